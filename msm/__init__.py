@@ -0,0 +1,11 @@
+"""MSM気象データ処理ツール
+
+京都大学生存圏データベースから気象庁MSMのnetCDFファイルを取得し、
+指定地点のデータを抽出・補正・集計する。各処理は ``msm`` コマンドの
+サブコマンドとして実行する（``msm --help`` を参照）。
+
+起動を速くするため、このパッケージでは netCDF4 / pandas / numpy を
+読み込まない。重い依存は各サブコマンドのモジュール内でのみ読み込む。
+"""
+
+__version__ = '0.1.0'
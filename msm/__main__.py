@@ -0,0 +1,7 @@
+"""``python -m msm`` で ``msm`` コマンドを実行する"""
+
+import sys
+
+from msm.cli import main
+
+sys.exit(main())
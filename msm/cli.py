@@ -0,0 +1,444 @@
+"""``msm`` コマンドのエントリポイント
+
+各サブコマンドの処理モジュール（netCDF4 / pandas / numpy を読み込むもの）は
+そのサブコマンドが実行されるときにだけ読み込む。``msm --help`` や処理対象の
+ない ``msm sync`` を頻繁に呼び出しても起動が遅くならないよう、このモジュール
+では標準ライブラリ以外を読み込まないこと。
+
+起動時間の確認::
+
+    python -X importtime -m msm --help 2> importtime.log
+"""
+
+import sys
+import argparse
+
+
+def _run_download(args):
+    from msm.download import process_download
+    if not process_download(args.config):
+        return 1
+    if args.skip_extract:
+        return 0
+    from msm.extract import process_extract
+    return 0 if process_extract(args.config) else 1
+
+
+def _run_extract(args):
+    from msm.extract import process_extract
+    return 0 if process_extract(args.config) else 1
+
+
+def _run_fix(args):
+    from msm.fix import run_fix
+    return run_fix(
+        args.input_dir,
+        args.output_dir,
+        method=args.method,
+        r1h_column=args.r1h_column,
+        time_column=args.time_column,
+        station=args.station,
+        year=args.year,
+        pattern=args.pattern,
+        parallel=not args.sequential,
+        max_workers=args.max_workers,
+        verbose=not args.quiet,
+        continuous=args.continuous,
+        max_gap=args.max_gap
+    )
+
+
+def _run_qc(args):
+    from msm.qc import run_qc, load_rules
+    try:
+        rules = load_rules(args.rules)
+    except (OSError, ValueError) as e:
+        print(f"エラー: 規則のファイルを読み込めませんでした: {e}")
+        return 1
+    return run_qc(args.input_dir, args.output_dir, rules, time_column=args.time_column, station=args.station,
+                  year=args.year, pattern=args.pattern, parallel=not args.sequential, max_workers=args.max_workers,
+                  verbose=not args.quiet)
+
+
+def _run_combine(args):
+    from msm.combine import process_combine_csv
+    return 0 if process_combine_csv(args.config) else 1
+
+
+def _run_inspect(args):
+    from msm.metaview import display_netcdf_metadata, analyze_msm_precipitation
+    print(f"ファイル {args.nc_file} のメタデータを表示します...\n")
+    display_netcdf_metadata(args.nc_file)
+    analyze_msm_precipitation(args.nc_file)
+    return 0
+
+
+def _run_sync(args):
+    from msm.sync import process_sync
+    return 0 if process_sync(args.config) else 1
+
+
+def _run_serve(args):
+    from msm.server import serve
+    return 0 if serve(args.config, args.host, args.port, args.verbose) else 1
+
+
+def _run_loadtest(args):
+    from msm.loadtest import run_query_load_test_command
+    targets = args.targets.split(',') if args.targets else None
+    ok = run_query_load_test_command(args.config, args.url, targets, args.start_year, args.end_year,
+                                     args.requests, args.concurrency, args.seed, args.arrow)
+    return 0 if ok else 1
+
+
+def _run_cube(args):
+    from msm.cube import build_cube
+    return 0 if build_cube(args.config, args.start, args.end, args.max_workers) else 1
+
+
+def _run_cube_point(args):
+    from msm.cube import export_point_daily
+    ok = export_point_daily(args.config, args.target, args.lat, args.lon, args.start, args.end, args.output)
+    return 0 if ok else 1
+
+
+def _run_rollup(args):
+    from msm.rollup import process_rollup, FREQUENCIES
+    freqs = args.freq.split(',') if args.freq else ['month', 'season', 'year', 'climatology']
+    unknown = [f for f in freqs if f not in FREQUENCIES]
+    if unknown:
+        print(f"エラー: 不明な集計単位です: {', '.join(unknown)}")
+        return 1
+    window = (args.start, args.end) if args.start and args.end else None
+    return 0 if process_rollup(args.config, freqs, window, args.verify) else 1
+
+
+def _run_extremes(args):
+    from msm.sketch import process_extremes, benchmark_sketch
+    if args.benchmark:
+        benchmark_sketch(args.n, args.k)
+        return 0
+    if not args.config:
+        print("エラー: 設定ファイルを指定してください")
+        return 1
+    return 0 if process_extremes(args.config) else 1
+
+
+def _run_queue(args):
+    from msm.workqueue import process_queue_command
+    ok = process_queue_command(args.config, args.action, args.start, args.end, args.chunk_days)
+    return 0 if ok else 1
+
+
+def _run_worker(args):
+    from msm.workqueue import run_worker
+    ok = run_worker(args.config, args.max_tasks, args.lease_timeout, args.heartbeat, args.max_attempts,
+                    wait=not args.no_wait)
+    return 0 if ok else 1
+
+
+def _run_verify(args):
+    from msm.journal import process_verify
+    return 0 if process_verify(args.config, args.scan, args.repair, args.compact) else 1
+
+
+def _run_transect(args):
+    from msm.transect import export_transect
+    ok = export_transect(args.config, args.name, args.variable, args.start, args.end, args.output)
+    return 0 if ok else 1
+
+
+def _run_pyramid(args):
+    from msm.plotting import process_pyramid
+    return 0 if process_pyramid(args.config, args.targets, args.variables, args.rebuild) else 1
+
+
+def _run_maps(args):
+    from msm.maps import render_maps
+    ok = render_maps(args.config, args.variable, args.start, args.end, args.projection,
+                     args.workers, args.overwrite)
+    return 0 if ok else 1
+
+
+def _run_derive(args):
+    from msm.derived import process_derive
+    return 0 if process_derive(args.config, args.start, args.end) else 1
+
+
+def _run_rolling(args):
+    from msm.rolling import process_rolling
+    return 0 if process_rolling(args.config, args.targets, args.rebuild) else 1
+
+
+def _run_panel(args):
+    from msm.panel import build_panel
+    return 0 if build_panel(args.config, args.start, args.end) else 1
+
+
+def _run_climatology(args):
+    from msm.climatology import process_climatology
+    return 0 if process_climatology(args.config, args.targets, args.rebuild) else 1
+
+
+def _run_anomaly(args):
+    from msm.climatology import export_anomalies
+    variables = args.variables.split(',') if args.variables else None
+    return 0 if export_anomalies(args.config, args.target, args.start, args.end, variables, args.standardized,
+                                 args.output, not args.raw) else 1
+
+
+def _run_standin(args):
+    from msm.standin import serve_standin
+    return 0 if serve_standin(args.root, args.host, args.port, args.verbose, grid=args.grid,
+                              latency=args.latency, bandwidth=args.bandwidth, drop_rate=args.drop_rate,
+                              error_rate=args.error_rate, ranges=not args.no_range, seed=args.seed) else 1
+
+
+def _run_download_loadtest(args):
+    from msm.loadtest import run_download_load_test_command
+    ok = run_download_load_test_command(args.config, args.url, args.start, args.end, args.workers, args.retries,
+                                        args.retry_delay, args.root, args.output, grid=args.grid,
+                                        latency=args.latency, bandwidth=args.bandwidth, drop_rate=args.drop_rate,
+                                        error_rate=args.error_rate, ranges=not args.no_range, seed=args.seed)
+    return 0 if ok else 1
+
+
+def _add_standin_arguments(p):
+    """代替サーバーの障害の注入の引数"""
+    p.add_argument('--grid', default='small', choices=['small', 'full'],
+                   help="生成するファイルのグリッド（full はMSM-Sと同じ約140MB、デフォルト: small）")
+    p.add_argument('--latency', type=float, default=0.0, help="応答までの待ち時間（秒）")
+    p.add_argument('--bandwidth', type=float, default=None, help="接続ごとの送信速度の上限（MB/s）")
+    p.add_argument('--drop-rate', type=float, default=0.0, help="本文の途中で接続を切る割合 (0-1)")
+    p.add_argument('--error-rate', type=float, default=0.0, help="503を返す割合 (0-1)")
+    p.add_argument('--no-range', action='store_true', help="Rangeリクエストに対応しない")
+    p.add_argument('--seed', type=int, default=0, help="障害を決める乱数のシード")
+
+
+def build_parser():
+    """サブコマンドを含む引数パーサーを作成する"""
+    parser = argparse.ArgumentParser(prog='msm', description="MSMデータ処理ツール")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('download', help="netCDFファイルをダウンロードし、各地点のCSVを抽出")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--skip-extract', action='store_true', help="ダウンロードのみ行い、CSVの抽出を行わない")
+    p.set_defaults(func=_run_download)
+
+    p = subparsers.add_parser('extract', help="ダウンロード済みのnetCDFファイルから各地点のCSVを抽出")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.set_defaults(func=_run_extract)
+
+    p = subparsers.add_parser('transect', help="抽出済みの測線の1変数を (時刻 × 距離) のCSVに出力")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('name', help="測線の名前（設定ファイルの transects のキー）")
+    p.add_argument('--variable', default='temp', help="出力する変数 (デフォルト: temp)")
+    p.add_argument('--start', required=True, help="開始日 (YYYY-MM-DD)")
+    p.add_argument('--end', required=True, help="終了日 (YYYY-MM-DD)")
+    p.add_argument('--output', default=None, help="出力するCSVファイルのパス")
+    p.set_defaults(func=_run_transect)
+
+    p = subparsers.add_parser('pyramid', help="描画用の間引きピラミッドを地点・変数ごとに作成")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--targets', nargs='+', default=None, help="地点名（省略時は設定ファイルのすべての地点）")
+    p.add_argument('--variables', nargs='+', default=None, help="変数名（デフォルト: temp r1h wind_speed）")
+    p.add_argument('--rebuild', action='store_true', help="元のCSVが更新されていなくても作り直す")
+    p.set_defaults(func=_run_pyramid)
+
+    p = subparsers.add_parser('maps', help="期間内の毎時の地図をPNGに描画（投影済みメッシュと背景をキャッシュ）")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--variable', default='temp', help="描画する変数 (デフォルト: temp)")
+    p.add_argument('--start', required=True, help="開始日 (YYYY-MM-DD)")
+    p.add_argument('--end', required=True, help="終了日 (YYYY-MM-DD)")
+    p.add_argument('--projection', choices=['lambert', 'platecarree', 'mercator'], default=None,
+                   help="投影法（設定ファイルの map.projection より優先）")
+    p.add_argument('--workers', type=int, default=None, help="並列に描画するプロセス数 (デフォルト: CPU数)")
+    p.add_argument('--overwrite', action='store_true', help="既存のフレームも描き直す")
+    p.set_defaults(func=_run_maps)
+
+    p = subparsers.add_parser('derive', help="抽出済みの地点のCSVに派生量（露点温度など）の列を追加")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--start', default=None, help="開始日 (YYYY-MM-DD、デフォルト: download_start_date)")
+    p.add_argument('--end', default=None, help="終了日 (YYYY-MM-DD、デフォルト: download_end_date)")
+    p.set_defaults(func=_run_derive)
+
+    p = subparsers.add_parser('rolling', help="24/72時間降水量・積算暖度などの移動窓の統計を前回の続きから計算")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--targets', nargs='+', default=None, help="地点名（省略時は設定ファイルのすべての地点）")
+    p.add_argument('--rebuild', action='store_true', help="保存した状態を使わずに最初から計算し直す")
+    p.set_defaults(func=_run_rolling)
+
+    p = subparsers.add_parser('panel', help="抽出済みのCSVから (時刻 × 地点 × 変数) のパネルを作成・更新")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--start', default=None, help="開始日 (YYYY-MM-DD、デフォルト: download_start_date)")
+    p.add_argument('--end', default=None, help="終了日 (YYYY-MM-DD、デフォルト: download_end_date)")
+    p.set_defaults(func=_run_panel)
+
+    p = subparsers.add_parser('climatology', help="地点の (通日, 時) ごとの平年値（平均・標準偏差）を計算")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--targets', nargs='+', default=None, help="地点名（省略時は設定ファイルのすべての地点）")
+    p.add_argument('--rebuild', action='store_true', help="元のCSVが変わっていなくても計算し直す")
+    p.set_defaults(func=_run_climatology)
+
+    p = subparsers.add_parser('anomaly', help="地点の期間の平年値からの偏差をCSVに出力")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--target', required=True, help="設定ファイルの地点名")
+    p.add_argument('--start', required=True, help="開始日 (YYYY-MM-DD)")
+    p.add_argument('--end', required=True, help="終了日 (YYYY-MM-DD)")
+    p.add_argument('--variables', help="変数（カンマ区切り、省略時は平年値のすべての変数）")
+    p.add_argument('--standardized', action='store_true', help="標準偏差で割った偏差（_z 列）も出力する")
+    p.add_argument('--raw', action='store_true', help="平滑化していない平年値を使う")
+    p.add_argument('--output', help="出力ファイル（省略時は output/climatology/ の下）")
+    p.set_defaults(func=_run_anomaly)
+
+    p = subparsers.add_parser('standin', help="ダウンロードの試験用のアーカイブ代替サーバーを起動")
+    p.add_argument('--root', default='./standin', help="ファイルのディレクトリ（ないファイルは生成して保存、デフォルト: ./standin）")
+    p.add_argument('--host', default='127.0.0.1', help="待ち受けるアドレス (デフォルト: 127.0.0.1)")
+    p.add_argument('--port', type=int, default=8080, help="待ち受けるポート (デフォルト: 8080)")
+    p.add_argument('--verbose', action='store_true', help="リクエストごとのログを表示する")
+    _add_standin_arguments(p)
+    p.set_defaults(func=_run_standin)
+
+    p = subparsers.add_parser('download-loadtest', help="ダウンロードの負荷試験（files/s、MB/s、再試行の回数を表示）")
+    p.add_argument('config', nargs='?', help="JSONの設定ファイルへのパス（期間と archive_base_url を使用）")
+    p.add_argument('--url', help="試験するアーカイブのURL（省略時は代替サーバーを起動）")
+    p.add_argument('--start', help="ダウンロードする最初の日 (YYYY-MM-DD)")
+    p.add_argument('--end', help="ダウンロードする最後の日 (YYYY-MM-DD)")
+    p.add_argument('--workers', type=int, default=4, help="同時にダウンロードするファイル数 (デフォルト: 4)")
+    p.add_argument('--retries', type=int, default=3, help="ファイルごとの再試行の上限 (デフォルト: 3)")
+    p.add_argument('--retry-delay', type=float, default=0.1, help="1回目の再試行までの待ち時間（秒、デフォルト: 0.1）")
+    p.add_argument('--root', help="代替サーバーのファイルのディレクトリ（省略時は一時ディレクトリ）")
+    p.add_argument('--output', help="ダウンロード先（省略時は一時ディレクトリ）")
+    _add_standin_arguments(p)
+    p.set_defaults(func=_run_download_loadtest)
+
+    p = subparsers.add_parser('fix', help="CSVファイルに対して特殊値処理を一括実行")
+    p.add_argument('--input-dir', default='./output/csv', help='入力CSVファイルがあるベースディレクトリ')
+    p.add_argument('--output-dir', default='./output/csv_fixed', help='処理済みCSVファイルを保存するディレクトリ')
+    p.add_argument('--method', choices=['nan', 'zero', 'interp'], default='nan',
+                   help='特殊値の処理方法 (nan=NaNに置換, zero=0に置換, interp=線形補間で置換)')
+    p.add_argument('--r1h-column', default='r1h', help='降水量データの列名')
+    p.add_argument('--time-column', default='time', help='時間データの列名')
+    p.add_argument('--sequential', action='store_true', help='並列処理を無効にして逐次処理を行う')
+    p.add_argument('--max-workers', type=int, default=None, help='並列処理の最大ワーカー数')
+    p.add_argument('--pattern', default='*.csv', help='処理対象とするファイルのパターン (デフォルト: *.csv)')
+    p.add_argument('--station', help='特定の観測地点のみを処理する場合、その地点名')
+    p.add_argument('--year', help='特定の年のみを処理する場合、その年')
+    p.add_argument('--quiet', action='store_true', help='詳細出力を表示しない')
+    p.add_argument('--continuous', action='store_true',
+                   help='地点ごとにファイルを時刻順に処理し、日の境界をまたいで線形補間する')
+    p.add_argument('--max-gap', type=int, default=6, help='--continuous で補間する欠損の最大の長さ（時間、デフォルト: 6）')
+    p.set_defaults(func=_run_fix)
+
+    p = subparsers.add_parser('qc', help="CSVファイルに品質管理の規則を一括適用し、値ごとのフラグと該当数を出力")
+    p.add_argument('--input-dir', default='./output/csv', help='入力CSVファイルがあるベースディレクトリ')
+    p.add_argument('--output-dir', default='./output/csv_qc', help='フラグの列を追加したCSVファイルを保存するディレクトリ')
+    p.add_argument('--rules', help='規則のJSONファイル（規則のリスト、または qc_rules を含む設定ファイル。省略時は既定の規則）')
+    p.add_argument('--time-column', default='time', help='時間データの列名')
+    p.add_argument('--sequential', action='store_true', help='並列処理を無効にして逐次処理を行う')
+    p.add_argument('--max-workers', type=int, default=None, help='並列処理の最大ワーカー数')
+    p.add_argument('--pattern', default='*.csv', help='処理対象とするファイルのパターン (デフォルト: *.csv)')
+    p.add_argument('--station', help='特定の観測地点のみを処理する場合、その地点名')
+    p.add_argument('--year', help='特定の年のみを処理する場合、その年')
+    p.add_argument('--quiet', action='store_true', help='詳細出力を表示しない')
+    p.set_defaults(func=_run_qc)
+
+    p = subparsers.add_parser('combine', help="各地点のCSVを結合し、日別・月別統計を作成")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.set_defaults(func=_run_combine)
+
+    p = subparsers.add_parser('inspect', help="netCDFファイルのメタデータと降水量データを表示")
+    p.add_argument('nc_file', nargs='?', default='output/netcdf/2025/0101.nc', help="netCDFファイルのパス")
+    p.set_defaults(func=_run_inspect)
+
+    p = subparsers.add_parser('sync', help="未処理の日だけをダウンロード・抽出・特殊値処理・集計（cron向け）")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.set_defaults(func=_run_sync)
+
+    p = subparsers.add_parser('serve', help="抽出済みデータの問い合わせ用HTTPサーバーを起動")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--host', default='127.0.0.1', help="待ち受けるアドレス (デフォルト: 127.0.0.1)")
+    p.add_argument('--port', type=int, default=8000, help="待ち受けるポート (デフォルト: 8000)")
+    p.add_argument('--verbose', action='store_true', help="リクエストごとのログを表示する")
+    p.set_defaults(func=_run_serve)
+
+    p = subparsers.add_parser('loadtest', help="問い合わせサーバーの負荷試験（レイテンシのパーセンタイルを表示）")
+    p.add_argument('config', nargs='?', help="JSONの設定ファイルへのパス（--url 省略時はサーバーを起動）")
+    p.add_argument('--url', help="試験するサーバーのURL")
+    p.add_argument('--targets', help="問い合わせる地点（カンマ区切り、省略時はすべて）")
+    p.add_argument('--start-year', type=int, help="問い合わせる最初の年")
+    p.add_argument('--end-year', type=int, help="問い合わせる最後の年")
+    p.add_argument('--requests', type=int, default=500, help="リクエスト数 (デフォルト: 500)")
+    p.add_argument('--concurrency', type=int, default=8, help="同時リクエスト数 (デフォルト: 8)")
+    p.add_argument('--seed', type=int, default=0, help="問い合わせを生成する乱数のシード")
+    p.add_argument('--arrow', action='store_true', help="JSONとArrow形式を混ぜて問い合わせる")
+    p.set_defaults(func=_run_loadtest)
+
+    p = subparsers.add_parser('cube', help="全グリッドの日別統計キューブを作成・更新")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--start', help="処理する最初の日 (YYYY-MM-DD、省略時は download_start_date)")
+    p.add_argument('--end', help="処理する最後の日 (YYYY-MM-DD、省略時は download_end_date)")
+    p.add_argument('--max-workers', type=int, default=None, help="並列処理の最大プロセス数")
+    p.set_defaults(func=_run_cube)
+
+    p = subparsers.add_parser('cube-point', help="日別統計キューブから地点の日別統計をCSVに出力")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--target', help="設定ファイルの地点名")
+    p.add_argument('--lat', type=float, help="緯度（--target の代わりに座標で指定）")
+    p.add_argument('--lon', type=float, help="経度（--target の代わりに座標で指定）")
+    p.add_argument('--start', help="出力する最初の日 (YYYY-MM-DD)")
+    p.add_argument('--end', help="出力する最後の日 (YYYY-MM-DD)")
+    p.add_argument('--output', help="出力するCSVファイルのパス")
+    p.set_defaults(func=_run_cube_point)
+
+    p = subparsers.add_parser('rollup', help="日ごとの部分集計を更新し、月・季節・年・平年値の統計を作成")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--freq', help="集計単位（カンマ区切り: day,month,season,year,climatology）")
+    p.add_argument('--start', help="任意期間の最初の日 (YYYY-MM-DD、--end と同時に指定)")
+    p.add_argument('--end', help="任意期間の最後の日 (YYYY-MM-DD)")
+    p.add_argument('--verify', action='store_true', help="combine と同じ計算（時別データの再集計）と比較する")
+    p.set_defaults(func=_run_rollup)
+
+    p = subparsers.add_parser('extremes', help="パーセンタイル・上位N件・再現期間の確率値をスケッチから作成")
+    p.add_argument('config', nargs='?', help="JSONの設定ファイルへのパス")
+    p.add_argument('--benchmark', action='store_true', help="スケッチの精度と速度を numpy.quantile と比較する")
+    p.add_argument('-n', type=int, default=1_000_000, help="ベンチマークのデータ数 (デフォルト: 1000000)")
+    p.add_argument('-k', type=int, default=200, help="ベンチマークのスケッチの精度パラメータ (デフォルト: 200)")
+    p.set_defaults(func=_run_extremes)
+
+    p = subparsers.add_parser('queue', help="複数ホストで分担する作業キューの作成・状態表示")
+    p.add_argument('action', choices=['init', 'status'], help="init=期間を作業に分けて登録, status=状態を表示")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--start', help="登録する最初の日 (YYYY-MM-DD、省略時は download_start_date)")
+    p.add_argument('--end', help="登録する最後の日 (YYYY-MM-DD、省略時は download_end_date)")
+    p.add_argument('--chunk-days', type=int, default=7, help="1作業の日数 (デフォルト: 7)")
+    p.set_defaults(func=_run_queue)
+
+    p = subparsers.add_parser('worker', help="作業キューから作業を取得してダウンロード・抽出・特殊値処理")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--max-tasks', type=int, default=None, help="処理する作業の最大数")
+    p.add_argument('--lease-timeout', type=float, default=600, help="停止したワーカーの作業を回収するまでの秒数 (デフォルト: 600)")
+    p.add_argument('--heartbeat', type=float, default=30, help="ハートビートの間隔（秒、デフォルト: 30）")
+    p.add_argument('--max-attempts', type=int, default=3, help="作業を失敗とするまでの試行回数 (デフォルト: 3)")
+    p.add_argument('--no-wait', action='store_true', help="未処理の作業がなくなったら、他のワーカーの作業の完了を待たずに終了する")
+    p.set_defaults(func=_run_worker)
+
+    p = subparsers.add_parser('verify', help="ジャーナルの記録とディスク上のファイルを照合")
+    p.add_argument('config', help="JSONの設定ファイルへのパス")
+    p.add_argument('--scan', action='store_true', help="ジャーナルにないファイルも内容を調べて書きかけのファイルを探す")
+    p.add_argument('--repair', action='store_true', help="--scan で見つけた書きかけのファイルを削除する（次回の処理でやり直す）")
+    p.add_argument('--compact', action='store_true', help="照合後にプロセスごとのジャーナルのファイルを1ファイルにまとめる")
+    p.set_defaults(func=_run_verify)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
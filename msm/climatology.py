@@ -0,0 +1,371 @@
+"""地点の (通日, 時) ごとの平年値と偏差
+
+地点の抽出済みCSVを年ごとに1回だけ読み、(通日, 時, 変数) の格子に値を並べて
+年をまたいで平均と標準偏差を逐次計算する（Welford法。1年の各セルの値は1つなので、
+年ごとに格子全体を1回の配列演算で更新できる）。通日はうるう年の暦（366日）で数え、
+2月29日以外の日付は年によらず同じ位置になる。
+
+``climatology_harmonics``（デフォルト: 3）が1以上の場合は、時ごとに通日の調和関数
+（年周期とその倍周期）を当てはめて平滑化した平年値・標準偏差も求める
+（2月29日のように年数の少ない日も滑らかになる）。
+
+結果は ``output/climatology/<地点名>.npz`` に保存し（1地点・6変数で1MB未満）、
+偏差は時刻からの配列の参照だけで求める::
+
+    from msm.climatology import load_climatology
+    clim = load_climatology('./output', 'yukikabe')
+    anomalies = clim.anomalies(df, ['temp'], standardized=True)   # temp_anom, temp_z 列
+
+設定ファイルの例::
+
+    "climatology_variables": ["temp", "rh", "r1h", "wind_speed"],
+    "climatology_years": [2007, 2025],
+    "climatology_harmonics": 3
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+from msm.fields import mask_r1h_sentinel
+from msm.journal import atomic_path
+
+CLIMATOLOGY_VARIABLES = ['temp', 'rh', 'r1h', 'wind_speed', 'psea', 'dswrf']
+
+DEFAULT_HARMONICS = 3
+
+DAYS = 366
+HOURS = 24
+
+# うるう年の各月の1日の通日（0始まり）
+_MONTH_OFFSETS = np.cumsum([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30])
+
+
+def day_hour_index(times):
+    """
+    時刻の (通日, 時) の位置を返す
+
+    Returns:
+    --------
+    tuple
+        (通日の numpy.ndarray（0-365、うるう年の暦）, 時の numpy.ndarray（0-23）)
+    """
+    t = np.asarray(times, dtype='datetime64[h]')
+    days = t.astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    month = (months - days.astype('datetime64[Y]').astype('datetime64[M]')).astype(np.int64)
+    day = (days - months).astype(np.int64)
+    hour = (t - days).astype(np.int64)
+    return _MONTH_OFFSETS[month] + day, hour
+
+
+def _harmonic_basis(harmonics):
+    """通日の調和関数の基底 (366, 2 * harmonics + 1)"""
+    phase = 2 * np.pi * np.arange(DAYS) / DAYS
+    columns = [np.ones(DAYS)]
+    for k in range(1, harmonics + 1):
+        columns += [np.cos(k * phase), np.sin(k * phase)]
+    return np.column_stack(columns)
+
+
+def smooth_harmonics(values, count, harmonics=DEFAULT_HARMONICS):
+    """
+    (通日, 時, 変数) の値を、時・変数ごとに通日の調和関数で平滑化する
+
+    各通日の年数（count）を重みとする最小二乗法で当てはめる。値のない通日も埋まる。
+    """
+    basis = _harmonic_basis(harmonics)
+    smoothed = np.full(values.shape, np.nan)
+    for h in range(values.shape[1]):
+        for k in range(values.shape[2]):
+            y = values[:, h, k]
+            w = np.where(np.isnan(y), 0.0, np.sqrt(count[:, h, k]))
+            if np.count_nonzero(w) < basis.shape[1]:
+                continue
+            coef, *_ = np.linalg.lstsq(basis * w[:, None], np.nan_to_num(y) * w, rcond=None)
+            smoothed[:, h, k] = basis @ coef
+    return smoothed
+
+
+class Climatology:
+    """
+    地点の (通日, 時) ごとの平年値
+
+    Attributes:
+    -----------
+    variables : list of str
+        変数（配列の3番目の軸の並び）
+    years : list of int
+        平年値に含めた年
+    count : numpy.ndarray
+        (366, 24, 変数) の年数
+    mean, std : numpy.ndarray
+        (366, 24, 変数) の平均・標準偏差（年数が2未満の標準偏差は欠損）
+    mean_smooth, std_smooth : numpy.ndarray or None
+        調和関数で平滑化した平均・標準偏差（harmonics が0の場合はNone）
+    """
+
+    def __init__(self, variables, years, count, mean, std, harmonics=0, signature=''):
+        self.variables = list(variables)
+        self.years = list(years)
+        self.count = count
+        self.mean = mean
+        self.std = std
+        self.harmonics = harmonics
+        self.signature = signature
+        self.mean_smooth = None
+        self.std_smooth = None
+        if harmonics:
+            self.mean_smooth = smooth_harmonics(mean, count, harmonics).astype(np.float32)
+            std_smooth = smooth_harmonics(std, np.where(np.isnan(std), 0, count), harmonics)
+            self.std_smooth = np.maximum(std_smooth, 0).astype(np.float32)
+
+    def normals(self, times, variables=None, smooth=True):
+        """
+        時刻の平年値を返す
+
+        Parameters:
+        -----------
+        times : array-like
+            時刻
+        variables : list of str, optional
+            変数（省略時はすべて）
+        smooth : bool, default=True
+            平滑化した値を使う（平滑化していない場合は元の値）
+
+        Returns:
+        --------
+        tuple
+            (平均, 標準偏差)。どちらも (時刻, 変数) の numpy.ndarray
+        """
+        variables = variables or self.variables
+        columns = [self.variables.index(var) for var in variables]
+        mean, std = (self.mean_smooth, self.std_smooth) if smooth and self.mean_smooth is not None \
+            else (self.mean, self.std)
+        day, hour = day_hour_index(times)
+        return mean[day, hour][:, columns], std[day, hour][:, columns]
+
+    def anomalies(self, data, variables=None, standardized=False, smooth=True):
+        """
+        時系列の平年値からの偏差を返す
+
+        Parameters:
+        -----------
+        data : pandas.DataFrame
+            時刻をインデックス（または time 列）とするデータ
+        variables : list of str, optional
+            変数（省略時は data にある平年値の変数すべて）
+        standardized : bool, default=False
+            標準偏差で割った値（``{変数}_z``）も返す
+
+        Returns:
+        --------
+        pandas.DataFrame
+            ``{変数}_anom``（と ``{変数}_z``）の列を持つ、data と同じインデックスのDataFrame
+        """
+        times = pd.to_datetime(data['time']) if 'time' in data.columns else data.index
+        variables = variables or [var for var in self.variables if var in data.columns]
+        mean, std = self.normals(np.asarray(times, dtype='datetime64[h]'), variables, smooth)
+        result = pd.DataFrame(index=data.index)
+        for k, var in enumerate(variables):
+            values = _clean(var, data[var].to_numpy(dtype=np.float64))
+            result[f"{var}_anom"] = values - mean[:, k]
+            if standardized:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    result[f"{var}_z"] = np.where(std[:, k] > 0, (values - mean[:, k]) / std[:, k], np.nan)
+        return result
+
+    def to_frame(self, smooth=False):
+        """平年値を (通日, 時) の行と ``{変数}_mean``・``{変数}_std`` の列の表にする"""
+        mean, std = (self.mean_smooth, self.std_smooth) if smooth and self.mean_smooth is not None \
+            else (self.mean, self.std)
+        day, hour = np.divmod(np.arange(DAYS * HOURS), HOURS)
+        months = np.searchsorted(_MONTH_OFFSETS, day, side='right')
+        frame = pd.DataFrame({'month': months, 'day': day - _MONTH_OFFSETS[months - 1] + 1, 'hour': hour})
+        for k, var in enumerate(self.variables):
+            frame[f"{var}_mean"] = mean[:, :, k].reshape(-1)
+            frame[f"{var}_std"] = std[:, :, k].reshape(-1)
+            frame[f"{var}_years"] = self.count[:, :, k].reshape(-1)
+        return frame
+
+    def save(self, path):
+        """npzファイルに保存する（一時ファイル経由）"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, variables=np.array(self.variables), years=np.array(self.years, dtype=np.int64),
+                         count=self.count, mean=self.mean, std=self.std,
+                         harmonics=np.array(self.harmonics), signature=np.array(self.signature))
+
+    @classmethod
+    def load(cls, path):
+        """npzファイルから読み込む（平滑化した値は読み込み時に計算し直す）"""
+        with np.load(path, allow_pickle=False) as npz:
+            return cls(npz['variables'].tolist(), npz['years'].tolist(), npz['count'], npz['mean'], npz['std'],
+                       int(npz['harmonics']), str(npz['signature']))
+
+
+def _clean(variable, values):
+    """r1h の特殊値（200）を欠損にする"""
+    if variable == 'r1h':
+        return mask_r1h_sentinel(values)
+    return values
+
+
+def _year_files(csv_dir, target_name, year):
+    year_dir = os.path.join(csv_dir, target_name, str(year))
+    return [os.path.join(year_dir, f) for f in sorted(os.listdir(year_dir)) if f.endswith('.csv')]
+
+
+def _source_signature(csv_dir, target_name, years):
+    """対象の年ディレクトリの更新時刻（作り直しの判定に使う）"""
+    target_dir = os.path.join(csv_dir, target_name)
+    return json.dumps({str(year): os.stat(os.path.join(target_dir, str(year))).st_mtime_ns for year in years},
+                      sort_keys=True)
+
+
+def available_years(csv_dir, target_name, years=None):
+    """地点のデータのある年（years = [最初の年, 最後の年] を指定した場合はその範囲）"""
+    target_dir = os.path.join(csv_dir, target_name)
+    if not os.path.isdir(target_dir):
+        return []
+    found = sorted(int(name) for name in os.listdir(target_dir) if name.isdigit())
+    if years:
+        found = [year for year in found if years[0] <= year <= years[1]]
+    return found
+
+
+def build_climatology(csv_dir, target_name, variables=None, years=None, harmonics=DEFAULT_HARMONICS):
+    """
+    地点の平年値を計算する（各年のCSVを1回だけ読み込む）
+
+    Parameters:
+    -----------
+    csv_dir : str
+        入力CSVのベースディレクトリ
+    target_name : str
+        地点名
+    variables : list of str, optional
+        変数（省略時は CLIMATOLOGY_VARIABLES）
+    years : list of int, optional
+        平年値に含める年の範囲 [最初の年, 最後の年]（省略時はデータのあるすべての年）
+    harmonics : int, default=DEFAULT_HARMONICS
+        平滑化に使う調和関数の数（0の場合は平滑化しない）
+
+    Returns:
+    --------
+    Climatology
+    """
+    variables = list(variables or CLIMATOLOGY_VARIABLES)
+    year_list = available_years(csv_dir, target_name, years)
+    if not year_list:
+        raise FileNotFoundError(f"地点 '{target_name}' のデータがありません: {os.path.join(csv_dir, target_name)}")
+    shape = (DAYS, HOURS, len(variables))
+    count = np.zeros(shape, dtype=np.int32)
+    mean = np.zeros(shape)
+    m2 = np.zeros(shape)
+    used = []
+    for year in year_list:
+        files = _year_files(csv_dir, target_name, year)
+        if not files:
+            continue
+        frame = pd.concat((pd.read_csv(path, usecols=lambda c: c == 'time' or c in variables) for path in files),
+                          ignore_index=True)
+        day, hour = day_hour_index(pd.to_datetime(frame['time']).to_numpy())
+        grid = np.full(shape, np.nan)
+        for k, var in enumerate(variables):
+            if var in frame.columns:
+                grid[day, hour, k] = _clean(var, frame[var].to_numpy(dtype=np.float64))
+        # Welford法で年ごとに更新する（各セルの値は1年に1つ）
+        valid = ~np.isnan(grid)
+        count += valid
+        delta = np.where(valid, grid - mean, 0.0)
+        mean += np.where(valid, delta / np.maximum(count, 1), 0.0)
+        m2 += np.where(valid, delta * (grid - mean), 0.0)
+        used.append(year)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.where(count >= 2, np.sqrt(m2 / (count - 1)), np.nan)
+    mean = np.where(count > 0, mean, np.nan)
+    return Climatology(variables, used, count, mean.astype(np.float32), std.astype(np.float32), harmonics,
+                       _source_signature(csv_dir, target_name, used))
+
+
+def climatology_file(output_dir, target_name):
+    return os.path.join(output_dir, 'climatology', f"{target_name}.npz")
+
+
+def load_climatology(output_dir, target_name):
+    """保存済みの地点の平年値を読み込む"""
+    path = climatology_file(output_dir, target_name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"平年値がありません（msm climatology で作成してください）: {path}")
+    return Climatology.load(path)
+
+
+def climatology_settings(config):
+    """設定ファイルの平年値の変数・年の範囲・調和関数の数を返す"""
+    return (config.get('climatology_variables', CLIMATOLOGY_VARIABLES), config.get('climatology_years'),
+            int(config.get('climatology_harmonics', DEFAULT_HARMONICS)))
+
+
+def process_climatology(config_file, targets=None, rebuild=False):
+    """
+    設定ファイルの地点の平年値を計算して保存する
+
+    元のCSVの年ディレクトリが前回から変わっていない地点（設定も同じ場合）はスキップする。
+    """
+    try:
+        config = load_config(config_file)
+        output_dir = config['output_directory']
+        csv_dir = config.get('input_csv_directory', os.path.join(output_dir, 'csv'))
+        variables, years, harmonics = climatology_settings(config)
+        for target_name in (targets or config['targets'].keys()):
+            path = climatology_file(output_dir, target_name)
+            if not rebuild and os.path.exists(path):
+                old = Climatology.load(path)
+                if old.variables == list(variables) and old.harmonics == harmonics and \
+                        old.signature == _source_signature(csv_dir, target_name,
+                                                           available_years(csv_dir, target_name, years)):
+                    print(f"地点 '{target_name}': 平年値は最新です ({path})")
+                    continue
+            climatology = build_climatology(csv_dir, target_name, variables, years, harmonics)
+            climatology.save(path)
+            print(f"地点 '{target_name}': 平年値を保存しました ({climatology.years[0]}-{climatology.years[-1]}年, "
+                  f"{len(climatology.years)} 年, {path})")
+        return True
+    except Exception as e:
+        print(f"エラー: 平年値の計算中に問題が発生しました: {e}")
+        return False
+
+
+def export_anomalies(config_file, target_name, start, end, variables=None, standardized=False, output=None,
+                     smooth=True):
+    """
+    地点の期間の時系列と平年値からの偏差をCSVに出力する（output を省略した場合は
+    output/climatology/<地点名>_anomaly_<開始>_<終了>.csv）
+    """
+    from msm.query import open_store
+
+    try:
+        config = load_config(config_file)
+        output_dir = config['output_directory']
+        climatology = load_climatology(output_dir, target_name)
+        variables = variables or climatology.variables
+        data = open_store(config_file).get_series(target_name, start, end, variables)
+        if data.empty:
+            print(f"エラー: 地点 '{target_name}' の {start} から {end} のデータがありません")
+            return False
+        result = pd.concat([data[variables], climatology.anomalies(data, variables, standardized, smooth)], axis=1)
+        output = output or os.path.join(output_dir, 'climatology', f"{target_name}_anomaly_{start}_{end}.csv")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with atomic_path(output) as tmp_path:
+            result.to_csv(tmp_path)
+        print(f"偏差を保存しました: {output} ({len(result)} 時刻)")
+        return True
+    except Exception as e:
+        print(f"エラー: 偏差の計算中に問題が発生しました: {e}")
+        return False
@@ -0,0 +1,9 @@
+"""設定ファイル（config.json）の読み込み"""
+
+import json
+
+
+def load_config(config_file):
+    """JSONの設定ファイルを読み込んで辞書として返す"""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
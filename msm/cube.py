@@ -0,0 +1,370 @@
+"""全グリッド（または設定した領域）の日別統計キューブ
+
+netCDFファイル1つ（1日分）ごとに、グリッド全体の日別統計を配列演算で計算し、
+年ごとのチャンク化したHDF5ファイル（``output/cube/YYYY.h5``）に保存する。
+各統計は (日, 緯度, 経度) の3次元データセットで、列は combine の日別出力と
+同じ名前を使う。新しい地点の日別統計はキューブから1点を読み出すだけで得られ、
+netCDFファイルを読み直す必要はない。
+
+- r1h の特殊値（200）は欠損として扱う（特殊値処理の method='nan' と同じ）
+- 日を順に追記してもチャンクを何度も圧縮し直さないよう、チャンクキャッシュを
+  時間方向1チャンク分より大きく取る
+- 年のファイルは一時ファイルにコピーして追記してから置き換えるため、書き込み中に
+  中断しても既存の日は失われない
+
+h5py が必要。
+"""
+
+import os
+import shutil
+import calendar
+import collections
+import concurrent.futures
+from datetime import date, datetime, timedelta
+
+import h5py
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+from msm.fields import read_field, wind_direction, wind_speed
+from msm.journal import atomic_path
+
+# キューブに保存する日別統計（combine の日別出力と同じ列名）
+CUBE_FIELDS = [
+    'temp_mean', 'psea_mean', 'sp_mean', 'rh_mean', 'dswrf_mean',
+    'r1h_sum', 'temp_max', 'temp_min', 'wind_speed_max', 'wind_speed_min',
+    'wind_direction_mode', 'wind_direction_vector', 'clear_hours', 'cloudy_hours',
+]
+
+# チャンクの大きさ（日, 緯度, 経度）
+CHUNK_SHAPE = (16, 32, 32)
+
+# データセットごとのチャンクキャッシュ（時間方向1チャンク分の全グリッドが収まる大きさ）
+CHUNK_CACHE_BYTES = 64 * 1024 ** 2
+
+
+def region_slices(lats, lons, region=None):
+    """
+    領域（lat_min, lat_max, lon_min, lon_max）に含まれるグリッドの範囲をスライスで返す
+
+    Returns:
+    --------
+    tuple
+        (緯度方向のスライス, 経度方向のスライス)
+    """
+    if not region:
+        return slice(0, len(lats)), slice(0, len(lons))
+    lat_idx = np.where((lats >= region['lat_min']) & (lats <= region['lat_max']))[0]
+    lon_idx = np.where((lons >= region['lon_min']) & (lons <= region['lon_max']))[0]
+    if len(lat_idx) == 0 or len(lon_idx) == 0:
+        raise ValueError(f"指定された領域にグリッドが含まれていません: {region}")
+    return slice(lat_idx.min(), lat_idx.max() + 1), slice(lon_idx.min(), lon_idx.max() + 1)
+
+
+def compute_daily_fields(nc_file, region=None):
+    """
+    netCDFファイル（1日分）から領域全体の日別統計を計算する
+
+    Returns:
+    --------
+    dict
+        統計名 -> (緯度, 経度) の配列。'lat', 'lon' には領域のグリッド座標を入れる
+    """
+    with nc.Dataset(nc_file) as dataset:
+        lats = np.asarray(dataset.variables['lat'][:])
+        lons = np.asarray(dataset.variables['lon'][:])
+        lat_slice, lon_slice = region_slices(lats, lons, region)
+        # temp は摂氏、r1h の特殊値（200）は NaN
+        data = {name: read_field(dataset, name, (lat_slice, lon_slice), np.float32)
+                for name in ['psea', 'sp', 'u', 'v', 'temp', 'rh', 'r1h', 'ncld', 'dswrf']}
+
+    speed = wind_speed(data['u'], data['v'])
+    direction = wind_direction(data['u'], data['v'])
+
+    with np.errstate(invalid='ignore'):
+        fields = {
+            'temp_mean': np.nanmean(data['temp'], axis=0),
+            'psea_mean': np.nanmean(data['psea'], axis=0),
+            'sp_mean': np.nanmean(data['sp'], axis=0),
+            'rh_mean': np.nanmean(data['rh'], axis=0),
+            'dswrf_mean': np.nanmean(data['dswrf'], axis=0),
+            'r1h_sum': np.nansum(data['r1h'], axis=0),
+            'temp_max': np.nanmax(data['temp'], axis=0),
+            'temp_min': np.nanmin(data['temp'], axis=0),
+            'wind_speed_max': np.nanmax(speed, axis=0),
+            'wind_speed_min': np.nanmin(speed, axis=0),
+            'clear_hours': (data['ncld'] < 3).sum(axis=0).astype(np.float32),
+            'cloudy_hours': (data['ncld'] >= 7).sum(axis=0).astype(np.float32),
+        }
+
+        # 最頻風向（10度ごとのビンで最も多いビンの中央値。同数の場合は小さい方）
+        bins = np.floor(direction / 10)
+        counts = np.stack([(bins == k).sum(axis=0) for k in range(36)])
+        fields['wind_direction_mode'] = (counts.argmax(axis=0) * 10 + 5).astype(np.float32)
+
+        # ベクトル平均風向（U, V成分の平均から計算）
+        u_mean = np.nanmean(data['u'], axis=0)
+        v_mean = np.nanmean(data['v'], axis=0)
+        fields['wind_direction_vector'] = wind_direction(u_mean, v_mean)
+
+    fields = {name: np.asarray(values, dtype=np.float32) for name, values in fields.items()}
+    fields['lat'] = lats[lat_slice]
+    fields['lon'] = lons[lon_slice]
+    return fields
+
+
+def _nc_path(save_dir, day):
+    return os.path.join(save_dir, day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+
+
+def cube_directory(config):
+    """設定ファイルからキューブのディレクトリを返す（省略時は output_directory/cube）"""
+    return config.get('cube_directory', os.path.join(config['output_directory'], 'cube'))
+
+
+def _year_file(cube_dir, year):
+    return os.path.join(cube_dir, f"{year}.h5")
+
+
+def _cube_years(cube_dir):
+    """キューブのディレクトリにある年のファイルの年を昇順で返す"""
+    if not os.path.isdir(cube_dir):
+        return []
+    return sorted(int(name[:-3]) for name in os.listdir(cube_dir) if name.endswith('.h5') and name[:-3].isdigit())
+
+
+def _day_index(day):
+    """年のファイルの中での日の位置（1月1日が0）"""
+    return day.timetuple().tm_yday - 1
+
+
+def open_cube(cube_file, mode='r'):
+    """チャンクキャッシュを設定してキューブファイル（1年分）を開く"""
+    return h5py.File(cube_file, mode, rdcc_nbytes=CHUNK_CACHE_BYTES, rdcc_nslots=100003)
+
+
+def _grid_of(nc_file, region):
+    """netCDFファイルから領域内のグリッド座標（緯度, 経度）を返す"""
+    with nc.Dataset(nc_file) as dataset:
+        lats = np.asarray(dataset.variables['lat'][:])
+        lons = np.asarray(dataset.variables['lon'][:])
+    lat_slice, lon_slice = region_slices(lats, lons, region)
+    return lats[lat_slice], lons[lon_slice]
+
+
+def _create_cube(cube_file, year, lats, lons, region):
+    """1年分の空のキューブファイルを作成する（時間方向は1月1日から12月31日まで）"""
+    n_days = 366 if calendar.isleap(year) else 365
+    with open_cube(cube_file, 'w') as cube:
+        cube.attrs['year'] = year
+        cube.attrs['region'] = repr(region or {})
+        cube.create_dataset('lat', data=lats)
+        cube.create_dataset('lon', data=lons)
+        cube.create_dataset('valid', data=np.zeros(n_days, dtype=bool))
+        chunks = (CHUNK_SHAPE[0], min(CHUNK_SHAPE[1], len(lats)), min(CHUNK_SHAPE[2], len(lons)))
+        for name in CUBE_FIELDS:
+            cube.create_dataset(name, shape=(n_days, len(lats), len(lons)),
+                                dtype=np.float32, chunks=chunks, fillvalue=np.nan,
+                                compression='gzip', compression_opts=4, shuffle=True)
+
+
+def _write_day(cube, day, fields):
+    """1日分の統計を年のキューブファイルに書き込む"""
+    index = _day_index(day)
+    for name in CUBE_FIELDS:
+        cube[name][index] = fields[name]
+    cube['valid'][index] = True
+
+
+def _write_year(cube_dir, year, days, results, save_dir, region):
+    """
+    1年分の日の計算結果を年のキューブファイルに書き込む
+
+    既存のファイルを一時ファイルにコピーしてから追記し、すべて書き込めた場合だけ
+    置き換える（書き込み中に中断しても既存のファイルは壊れない）。
+
+    Returns:
+    --------
+    tuple
+        (書き込んだ日数, 失敗した日数)
+    """
+    path = _year_file(cube_dir, year)
+    processed_count = 0
+    failed_count = 0
+    with atomic_path(path) as tmp_path:
+        if os.path.exists(path):
+            shutil.copyfile(path, tmp_path)
+        else:
+            _create_cube(tmp_path, year, *_grid_of(_nc_path(save_dir, days[0]), region), region)
+        with open_cube(tmp_path, 'a') as cube:
+            for day, future in results:
+                try:
+                    _write_day(cube, day, future.result())
+                except Exception as e:
+                    print(f"エラー: {_nc_path(save_dir, day)} の処理中に問題が発生しました: {e}")
+                    failed_count += 1
+                    continue
+                processed_count += 1
+                if processed_count % 100 == 0:
+                    print(f"進捗: {year} 年 {processed_count}/{len(days)} 日")
+    return processed_count, failed_count
+
+
+def build_cube(config_file, start_date=None, end_date=None, max_workers=None):
+    """
+    設定ファイルに基づいて、ダウンロード済みのnetCDFファイルから日別統計キューブを作成・更新する
+
+    キューブは年ごとのファイル（``YYYY.h5``）に分け、すでに含まれている日はスキップする。
+    年のファイルは1月1日からの時間軸を持つため、既存の日より前の日も追加できる。
+    netCDFファイルの読み込みと計算は複数プロセスで並列に行い、書き込みは日付順に
+    1プロセスで行う。
+    """
+    config = load_config(config_file)
+    output_dir = config['output_directory']
+    save_dir = os.path.join(output_dir, 'netcdf')
+    region = config.get('cube_region')
+    cube_dir = cube_directory(config)
+
+    start_dt = datetime.strptime(start_date or config['download_start_date'], '%Y-%m-%d').date()
+    end_dt = datetime.strptime(end_date or config['download_end_date'], '%Y-%m-%d').date()
+
+    os.makedirs(cube_dir, exist_ok=True)
+    if os.path.exists(os.path.join(cube_dir, 'daily_cube.h5')):
+        print(f"警告: 以前の形式のキューブファイルは使用しません（年ごとのファイルに作り直します）: "
+              f"{os.path.join(cube_dir, 'daily_cube.h5')}")
+
+    # 処理対象の日（ファイルがあり、キューブにまだない日）
+    valid = {}
+    for year in range(start_dt.year, end_dt.year + 1):
+        path = _year_file(cube_dir, year)
+        if not os.path.exists(path):
+            continue
+        with open_cube(path) as cube:
+            if cube.attrs['region'] != repr(region or {}):
+                print(f"エラー: キューブの領域 {cube.attrs['region']} が設定 {region or {}} と異なります。"
+                      f"キューブのディレクトリを削除してから作り直してください: {cube_dir}")
+                return False
+            valid[year] = cube['valid'][:]
+
+    days_by_year = collections.defaultdict(list)
+    day = start_dt
+    while day <= end_dt:
+        done = day.year in valid and valid[day.year][_day_index(day)]
+        if not done and os.path.exists(_nc_path(save_dir, day)):
+            days_by_year[day.year].append(day)
+        day += timedelta(days=1)
+
+    total = sum(len(days) for days in days_by_year.values())
+    print(f"日別統計キューブを更新します: {cube_dir} (処理対象: {total} 日)")
+    if not total:
+        return True
+
+    processed_count = 0
+    failed_count = 0
+    # 計算結果がメモリに溜まりすぎないよう、先行して投入するファイル数を制限する
+    max_workers = max_workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for year, days in sorted(days_by_year.items()):
+            results = _pipelined(executor, days, save_dir, region, max_workers * 2)
+            processed, failed = _write_year(cube_dir, year, days, results, save_dir, region)
+            processed_count += processed
+            failed_count += failed
+
+    print(f"\nキューブ更新完了:")
+    print(f"- 処理成功: {processed_count} 日")
+    if failed_count > 0:
+        print(f"- 処理失敗: {failed_count} 日")
+    return failed_count == 0
+
+
+def _pipelined(executor, days, save_dir, region, depth):
+    """日ごとの計算を先行して depth 件まで投入し、(日, future) を日付順に返す"""
+    pending = collections.deque()
+    for day in days:
+        pending.append((day, executor.submit(compute_daily_fields, _nc_path(save_dir, day), region)))
+        if len(pending) >= depth:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def read_point_daily(cube_dir, latitude, longitude, start_date=None, end_date=None):
+    """
+    キューブから指定座標に最も近いグリッドの日別統計を読み出す
+
+    Returns:
+    --------
+    pandas.DataFrame
+        日付をインデックスとする日別統計（combine の日別出力と同じ列名）
+    """
+    first = None if start_date is None else datetime.strptime(start_date, '%Y-%m-%d').date()
+    last = None if end_date is None else datetime.strptime(end_date, '%Y-%m-%d').date()
+    frames = []
+    lat_value = lon_value = None
+    for year in _cube_years(cube_dir):
+        if (first is not None and year < first.year) or (last is not None and year > last.year):
+            continue
+        with open_cube(_year_file(cube_dir, year)) as cube:
+            lats = cube['lat'][:]
+            lons = cube['lon'][:]
+            lat_idx = int(np.abs(lats - latitude).argmin())
+            lon_idx = int(np.abs(lons - longitude).argmin())
+            lat_value, lon_value = float(lats[lat_idx]), float(lons[lon_idx])
+
+            n_days = cube['valid'].shape[0]
+            begin = _day_index(first) if first is not None and first.year == year else 0
+            stop = _day_index(last) + 1 if last is not None and last.year == year else n_days
+            valid = cube['valid'][begin:stop]
+            data = {name: cube[name][begin:stop, lat_idx, lon_idx] for name in CUBE_FIELDS}
+        dates = pd.date_range(date(year, 1, 1) + timedelta(days=begin), periods=stop - begin, freq='D')
+        frames.append(pd.DataFrame(data, index=pd.Index(dates.date, name='date'))[valid])
+
+    if not frames:
+        return pd.DataFrame(columns=CUBE_FIELDS)
+    df = pd.concat(frames)
+    df['grid_latitude'] = lat_value
+    df['grid_longitude'] = lon_value
+    df['clear_hours'] = df['clear_hours'].astype(int)
+    df['cloudy_hours'] = df['cloudy_hours'].astype(int)
+    df['precipitation_day'] = df['r1h_sum'] >= 1.0
+    return df
+
+
+def export_point_daily(config_file, target_name=None, latitude=None, longitude=None,
+                       start_date=None, end_date=None, output_file=None):
+    """キューブから地点（設定ファイルの地点名または座標）の日別統計を読み出してCSVに保存する"""
+    config = load_config(config_file)
+    output_dir = config['output_directory']
+    cube_dir = cube_directory(config)
+
+    if target_name is not None:
+        if target_name not in config['targets']:
+            print(f"エラー: 地点 '{target_name}' が設定ファイルにありません")
+            return False
+        latitude = config['targets'][target_name]['latitude']
+        longitude = config['targets'][target_name]['longitude']
+        label = target_name
+    elif latitude is not None and longitude is not None:
+        label = f"{latitude}_{longitude}"
+    else:
+        print("エラー: 地点名または緯度・経度を指定してください")
+        return False
+
+    if not _cube_years(cube_dir):
+        print(f"エラー: キューブファイルが見つかりません: {cube_dir}")
+        return False
+
+    df = read_point_daily(cube_dir, latitude, longitude, start_date, end_date)
+    if output_file is None:
+        daily_dir = os.path.join(output_dir, 'statistics', 'daily')
+        if not os.path.exists(daily_dir):
+            os.makedirs(daily_dir)
+        output_file = os.path.join(daily_dir, f"{label}_cube_daily.csv")
+    with atomic_path(output_file) as tmp_path:
+        df.to_csv(tmp_path)
+    print(f"日別統計データを保存しました: {output_file} ({len(df)} 日, "
+          f"実際のグリッド: {df['grid_latitude'].iloc[0] if len(df) else '-'}, "
+          f"{df['grid_longitude'].iloc[0] if len(df) else '-'})")
+    return True
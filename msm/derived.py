@@ -0,0 +1,290 @@
+"""派生気象量（露点温度、水蒸気圧、体感温度、雨雪判別、可能蒸発量など）の計算
+
+派生量は ``@derived`` で登録した関数で、必要な変数（抽出した変数または他の派生量）を
+宣言する。``compute_derived`` は指定された派生量と、それが依存する派生量を依存関係の
+順に1回ずつ評価する。各関数は (時刻 × 地点) の配列をまとめて受け取るため、
+1ファイル（1日）につき1回の配列演算で全地点・全時刻の値が求まる。
+
+設定ファイルの ``derived_variables`` に列名を並べると、``msm extract`` が地点のCSVに
+列を追加する（抽出済みのCSVには ``msm derive`` で追加できる）::
+
+    "derived_variables": ["dew_point", "vapour_pressure", "wind_chill", "snowfall", "rainfall"],
+    "derived_parameters": {"snow_temperature": 0.0, "rain_temperature": 2.0}
+
+新しい派生量は次のように登録する::
+
+    @derived('relative_humidity_ratio', requires=['rh'], unit='-')
+    def _rh_ratio(rh, params):
+        return rh / 100.0
+"""
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from msm.fields import mask_r1h_sentinel
+from msm.journal import atomic_path
+
+# 登録された派生量（名前 -> DerivedVariable）
+DERIVED = OrderedDict()
+
+# 派生量の計算に使うパラメータの既定値
+DEFAULT_PARAMETERS = {
+    # 雨雪判別：この気温（℃）以下はすべて雪、rain_temperature 以上はすべて雨、その間は線形
+    'snow_temperature': 0.0,
+    'rain_temperature': 2.0,
+    # 可能蒸発量：地表面のアルベド
+    'albedo': 0.23,
+}
+
+
+class DerivedVariable:
+    """登録された派生量（名前、必要な変数、型、単位、計算する関数）"""
+
+    def __init__(self, name, requires, func, dtype='float32', unit=''):
+        self.name = name
+        self.requires = list(requires)
+        self.func = func
+        self.dtype = np.dtype(dtype)
+        self.unit = unit
+
+    def __call__(self, arrays, params):
+        return np.asarray(self.func(*(arrays[name] for name in self.requires), params))
+
+
+def derived(name, requires, dtype='float32', unit=''):
+    """派生量を登録するデコレーター"""
+    def register(func):
+        DERIVED[name] = DerivedVariable(name, requires, func, dtype, unit)
+        return func
+    return register
+
+
+def resolve_order(names):
+    """
+    指定された派生量と依存する派生量を、依存関係の順（依存先が先）に並べて返す
+
+    Raises:
+    -------
+    ValueError
+        登録されていない派生量、または循環する依存関係がある場合
+    """
+    order = []
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"派生量の依存関係が循環しています: {' -> '.join(path + [name])}")
+        if name not in DERIVED:
+            raise ValueError(f"登録されていない派生量です: {name}（{list(DERIVED)}）")
+        state[name] = 'visiting'
+        for dependency in DERIVED[name].requires:
+            if dependency in DERIVED:
+                visit(dependency, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+def base_requirements(names):
+    """派生量の計算に必要な、抽出した変数（派生量でないもの）の一覧"""
+    required = []
+    for name in resolve_order(names):
+        for dependency in DERIVED[name].requires:
+            if dependency not in DERIVED and dependency not in required:
+                required.append(dependency)
+    return required
+
+
+def compute_derived(arrays, names, params=None):
+    """
+    派生量を計算する
+
+    Parameters:
+    -----------
+    arrays : dict
+        変数名 -> 配列（形は任意。通常は (時刻, 地点)）。base_requirements の変数を含むこと
+    names : list of str
+        計算する派生量
+    params : dict, optional
+        DEFAULT_PARAMETERS を上書きするパラメータ
+
+    Returns:
+    --------
+    OrderedDict
+        派生量の名前 -> 配列（names に指定したものだけを指定した順に返す）
+    """
+    parameters = dict(DEFAULT_PARAMETERS)
+    parameters.update(params or {})
+    values = dict(arrays)
+    for name in resolve_order(names):
+        values[name] = DERIVED[name](values, parameters)
+    # 途中の派生量は倍精度のまま使い、出力するときだけ登録された型にする
+    return OrderedDict((name, values[name].astype(DERIVED[name].dtype)) for name in names)
+
+
+def _precipitation(r1h):
+    """r1h の特殊値（200）を欠損にした降水量"""
+    return mask_r1h_sentinel(r1h)
+
+
+@derived('saturation_vapour_pressure', requires=['temp'], unit='hPa')
+def _saturation_vapour_pressure(temp, params):
+    # Magnus式（WMO、水面）
+    temp = np.asarray(temp, dtype=np.float64)
+    return 6.112 * np.exp(17.62 * temp / (243.12 + temp))
+
+
+@derived('vapour_pressure', requires=['saturation_vapour_pressure', 'rh'], unit='hPa')
+def _vapour_pressure(saturation_vapour_pressure, rh, params):
+    return saturation_vapour_pressure * np.asarray(rh, dtype=np.float64) / 100.0
+
+
+@derived('dew_point', requires=['vapour_pressure'], unit='°C')
+def _dew_point(vapour_pressure, params):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = np.log(vapour_pressure / 6.112)
+        return 243.12 * gamma / (17.62 - gamma)
+
+
+@derived('wind_chill', requires=['temp', 'wind_speed'], unit='°C')
+def _wind_chill(temp, wind_speed, params):
+    # JAG/TI式（気温10℃以下・風速4.8km/h超で適用し、それ以外は気温）
+    temp = np.asarray(temp, dtype=np.float64)
+    speed_kmh = np.asarray(wind_speed, dtype=np.float64) * 3.6
+    factor = np.power(np.maximum(speed_kmh, 0.0), 0.16)
+    chill = 13.12 + 0.6215 * temp - 11.37 * factor + 0.3965 * temp * factor
+    return np.where((temp <= 10.0) & (speed_kmh > 4.8), chill, temp)
+
+
+@derived('snow_fraction', requires=['temp'], unit='-')
+def _snow_fraction(temp, params):
+    low, high = params['snow_temperature'], params['rain_temperature']
+    temp = np.asarray(temp, dtype=np.float64)
+    if high <= low:
+        return (temp <= low).astype(np.float64)
+    return np.clip((high - temp) / (high - low), 0.0, 1.0)
+
+
+@derived('snowfall', requires=['r1h', 'snow_fraction'], unit='mm/h')
+def _snowfall(r1h, snow_fraction, params):
+    return _precipitation(r1h) * snow_fraction
+
+
+@derived('rainfall', requires=['r1h', 'snow_fraction'], unit='mm/h')
+def _rainfall(r1h, snow_fraction, params):
+    return _precipitation(r1h) * (1.0 - snow_fraction)
+
+
+@derived('potential_evaporation',
+         requires=['temp', 'saturation_vapour_pressure', 'vapour_pressure', 'wind_speed', 'dswrf', 'sp'],
+         unit='mm/h')
+def _potential_evaporation(temp, saturation_vapour_pressure, vapour_pressure, wind_speed, dswrf, sp, params):
+    # FAO-56 Penman-Monteith式の時間値（基準蒸発散量）。正味放射は短波のみ（(1 - albedo) * dswrf）とし、
+    # 長波の放射収支は省略する。地中熱流量は日中 0.1 Rn、夜間 0.5 Rn。風速は10mから2mに換算する
+    temp = np.asarray(temp, dtype=np.float64)
+    es = saturation_vapour_pressure / 10.0  # kPa
+    ea = vapour_pressure / 10.0
+    delta = 4098.0 * es / (temp + 237.3) ** 2
+    gamma = 0.665e-3 * np.asarray(sp, dtype=np.float64) / 1000.0
+    rn = (1.0 - params['albedo']) * np.asarray(dswrf, dtype=np.float64) * 0.0036  # MJ/m2/h
+    g = np.where(rn > 0, 0.1 * rn, 0.5 * rn)
+    u2 = np.asarray(wind_speed, dtype=np.float64) * 4.87 / np.log(67.8 * 10.0 - 5.42)
+    et = (0.408 * delta * (rn - g) + gamma * 37.0 / (temp + 273.0) * u2 * (es - ea)) / \
+        (delta + gamma * (1.0 + 0.34 * u2))
+    return np.maximum(et, 0.0)
+
+
+def derived_settings(config):
+    """設定ファイルの派生量の一覧とパラメータを返す（一覧が不正な場合は ValueError）"""
+    names = list(config.get('derived_variables', []))
+    resolve_order(names)
+    return names, config.get('derived_parameters', {})
+
+
+def add_derived_columns(frames, names, params=None):
+    """
+    同じ時刻の複数地点のDataFrameに派生量の列を追加する（既存の列は置き換える）
+
+    全地点の値を (時刻, 地点) の配列にまとめて1回だけ計算する。
+
+    Parameters:
+    -----------
+    frames : list of pandas.DataFrame
+        同じ行数（時刻）の地点ごとのデータ
+    names : list of str
+        計算する派生量
+    params : dict, optional
+        パラメータ
+    """
+    if not names or not frames:
+        return frames
+    arrays = {var: np.column_stack([np.asarray(df[var], dtype=np.float64) for df in frames])
+              for var in base_requirements(names)}
+    results = compute_derived(arrays, names, params)
+    for j, df in enumerate(frames):
+        for name, values in results.items():
+            df[name] = values[:, j]
+    return frames
+
+
+def process_derive(config_file, start_date=None, end_date=None):
+    """
+    抽出済みの地点のCSV（output/csv）に派生量の列を追加する
+
+    日ごとに全地点のCSVを読み込んで1回で計算し、一時ファイル経由で書き直す。
+    書き直したファイルはジャーナルに抽出として記録し直す（特殊値処理は次回の
+    ``msm fix`` で入力の変更として処理し直される）。
+    """
+    import pandas as pd
+    from msm.config import load_config
+    from msm.journal import journal_directory, RunJournal
+
+    try:
+        config = load_config(config_file)
+        names, params = derived_settings(config)
+        if not names:
+            print("エラー: 設定ファイルに derived_variables が指定されていません")
+            return False
+        csv_dir = os.path.join(config['output_directory'], 'csv')
+        targets = list(config['targets'].keys())
+        journal = RunJournal(journal_directory(config))
+
+        start_dt = datetime.strptime(start_date or config['download_start_date'], '%Y-%m-%d')
+        end_dt = datetime.strptime(end_date or config['download_end_date'], '%Y-%m-%d')
+        processed_count = 0
+        skipped_count = 0
+        current = start_dt
+        while current <= end_dt:
+            year_str, date_str = current.strftime('%Y'), current.strftime('%Y%m%d')
+            paths = [os.path.join(csv_dir, t, year_str, f"{date_str}.csv") for t in targets]
+            present = [(t, p) for t, p in zip(targets, paths) if os.path.exists(p)]
+            current += timedelta(days=1)
+            if not present:
+                continue
+            frames = [pd.read_csv(p) for _, p in present]
+            if all(all(name in df.columns for name in names) for df in frames):
+                skipped_count += 1
+                continue
+            if len({len(df) for df in frames}) > 1:
+                print(f"警告: {date_str} の地点のCSVの行数が異なるため、スキップします")
+                continue
+            add_derived_columns(frames, names, params)
+            for (target, path), df in zip(present, frames):
+                with atomic_path(path) as tmp_path:
+                    df.to_csv(tmp_path, index=False)
+                journal.record('extract', f"{target}/{date_str}", path)
+            processed_count += 1
+
+        print(f"\n派生量の追加完了: {processed_count} 日（スキップ: {skipped_count} 日、列: {', '.join(names)}）")
+        return True
+    except Exception as e:
+        print(f"エラー: 派生量の計算中に問題が発生しました: {e}")
+        return False
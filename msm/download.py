@@ -0,0 +1,230 @@
+"""MSM netCDFファイルのダウンロード
+
+標準ライブラリのみを使用する（ダウンロードにはcurlを使用）。
+"""
+
+import os
+import time
+import subprocess
+import shutil
+import concurrent.futures
+from datetime import datetime, timedelta
+
+from msm.config import load_config
+from msm.journal import atomic_path, journal_directory, RunJournal
+
+def calculate_storage_requirements(start_date, end_date, file_size_mb=139.9, targets=None):
+    """計画されたダウンロードに必要なストレージ容量を計算して表示する"""
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    
+    # 日数の計算
+    days = (end_dt - start_dt).days + 1
+    
+    # 合計必要ストレージ
+    total_size_mb = days * file_size_mb
+    total_size_gb = total_size_mb / 1024
+    
+    # 地点数が多い場合のCSV出力サイズを概算（netCDFからの抽出なのでかなり小さくなる）
+    csv_size_estimate = 0
+    if targets:
+        # 1地点あたり約0.5MB/日と仮定
+        csv_size_estimate = days * len(targets) * 0.5
+    
+    print(f"ストレージ必要量の概算:")
+    print(f"- ダウンロード期間: {start_date} から {end_date} ({days}日間)")
+    print(f"- netCDFファイル: 約 {total_size_mb:.1f} MB ({total_size_gb:.2f} GB)")
+    
+    if csv_size_estimate > 0:
+        print(f"- CSV出力ファイル: 約 {csv_size_estimate:.1f} MB (処理する地点数: {len(targets)})")
+    
+    print(f"- 合計必要容量: 約 {(total_size_mb + csv_size_estimate):.1f} MB ({(total_size_gb + csv_size_estimate/1024):.2f} GB)")
+    
+    # 空き容量の確認
+    try:
+        total, used, free = shutil.disk_usage('/')
+        free_gb = free / (1024 ** 3)
+        print(f"- 現在の空き容量: {free_gb:.2f} GB")
+        
+        if free_gb < (total_size_gb + csv_size_estimate/1024):
+            print("警告: 必要なストレージが現在の空き容量を超えています。")
+    except:
+        print("注: 空き容量の確認に失敗しました。十分な空き容量があることを確認してください。")
+    
+    return total_size_mb
+
+MSM_BASE_URL = "http://database.rish.kyoto-u.ac.jp/arch/jmadata/data/gpv/netcdf/MSM-S"
+
+# 再試行の既定値（回数と、1回目の待ち時間（秒）。待ち時間は再試行のたびに2倍にする）
+DEFAULT_RETRIES = 3
+DEFAULT_RETRY_DELAY = 2.0
+
+# 再試行しないHTTPステータス（ファイルが存在しないなど）
+_PERMANENT_STATUS = range(400, 500)
+_TRANSIENT_STATUS = (408, 429)
+# curlの終了コード：Rangeリクエストに対応していないサーバーで続きから受信できなかった
+_CURL_CANNOT_RESUME = 33
+
+
+def archive_base_url(config):
+    """設定ファイルのアーカイブのURL（archive_base_url、省略時は MSM_BASE_URL）"""
+    return config.get('archive_base_url', MSM_BASE_URL).rstrip('/')
+
+
+def download_settings(config):
+    """設定ファイルからダウンロードの設定（download_msm_file のキーワード引数）を返す"""
+    return {
+        'retries': int(config.get('download_retries', DEFAULT_RETRIES)),
+        'retry_delay': float(config.get('download_retry_delay', DEFAULT_RETRY_DELAY)),
+    }
+
+
+def msm_file_url(date, base_url=None):
+    """指定日のMSM-SファイルのURLを返す（base_url を省略した場合は MSM_BASE_URL）"""
+    return f"{(base_url or MSM_BASE_URL).rstrip('/')}/{date.strftime('%Y')}/{date.strftime('%m%d')}.nc"
+
+
+def download_msm_file(url, output_path, retries=DEFAULT_RETRIES, retry_delay=DEFAULT_RETRY_DELAY,
+                      quiet=False, stats=None):
+    """1ファイルをダウンロードする。一時ファイルに保存してから置き換えるため、
+    中断やHTTPエラーの場合も不完全なファイルは残らない（Falseを返す）
+
+    接続の切断や5xxエラーの場合は retries 回まで待ち時間を2倍にしながら再試行し、
+    受信済みの部分はRangeリクエストで続きから受信する。404などの4xxエラーは再試行しない。
+    stats（dict）を指定すると 'retries'（再試行の回数）と 'bytes'（ファイルサイズ）を加算する。
+    """
+    attempts = 0
+    resume = True
+    try:
+        with atomic_path(output_path) as tmp_path:
+            while True:
+                # --fail: 404などのエラーページをファイルとして保存しない
+                # --speed-limit/--speed-time: 受信が止まった接続を打ち切って再試行する
+                command = ["curl", "--fail", "--speed-limit", "1", "--speed-time", "120",
+                           "-w", "%{http_code}", "-o", tmp_path]
+                if resume and os.path.exists(tmp_path) and os.path.getsize(tmp_path) > 0:
+                    command += ["-C", "-"]
+                if quiet:
+                    command += ["-s"]
+                result = subprocess.run(command + [url], stdout=subprocess.PIPE, text=True)
+                if result.returncode == 0:
+                    break
+                if result.returncode == _CURL_CANNOT_RESUME:
+                    # Rangeリクエストに対応していないサーバーでは最初から受信し直す
+                    resume = False
+                    os.remove(tmp_path)
+                    continue
+                status = int(result.stdout) if result.stdout.strip().isdigit() else 0
+                if (status in _PERMANENT_STATUS and status not in _TRANSIENT_STATUS) or attempts >= retries:
+                    raise subprocess.CalledProcessError(result.returncode, command)
+                attempts += 1
+                if not quiet:
+                    print(f"再試行します ({attempts}/{retries}): {url} (curl: {result.returncode}, HTTP: {status})")
+                time.sleep(retry_delay * 2 ** (attempts - 1))
+            size = os.path.getsize(tmp_path)
+        if stats is not None:
+            stats['bytes'] = stats.get('bytes', 0) + size
+        return True
+    except subprocess.CalledProcessError:
+        return False
+    finally:
+        if stats is not None:
+            stats['retries'] = stats.get('retries', 0) + attempts
+
+
+def download_msm_data(start_date, end_date, save_dir, skip_existing=True, journal=None,
+                      base_url=None, workers=1, quiet=False, **download_options):
+    """MSMデータをダウンロードする。すでに存在するファイルはスキップできる（journal に完了した日を記録する）
+
+    workers が2以上の場合は複数のファイルを同時にダウンロードする。download_options は
+    download_msm_file に渡す（retries、retry_delay）。ダウンロードしたファイル数・スキップ数・
+    失敗数・再試行の回数・バイト数の辞書を返す。
+    """
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    current_dt = start_dt
+    
+    summary = {'downloaded': 0, 'skipped': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+    pending = []
+    
+    print(f"\nMSMデータのダウンロードを開始します ({start_date} から {end_date})...")
+
+    while current_dt <= end_dt:
+        year = current_dt.strftime('%Y')
+        month_day = current_dt.strftime('%m%d')
+        year_dir = os.path.join(save_dir, year)
+        if not os.path.exists(year_dir):
+            os.makedirs(year_dir)
+        
+        url = msm_file_url(current_dt, base_url)
+        output_path = os.path.join(year_dir, f"{month_day}.nc")
+
+        # 既存ファイルのチェック
+        if skip_existing and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            if not quiet:
+                print(f"既存ファイルをスキップ: {output_path}")
+            summary['skipped'] += 1
+        else:
+            pending.append((current_dt, url, output_path))
+
+        current_dt += timedelta(days=1)
+
+    def fetch(item):
+        day, url, output_path = item
+        if not quiet:
+            print(f"ダウンロード中: {url}")
+        stats = {}
+        return item, download_msm_file(url, output_path, quiet=quiet, stats=stats, **download_options), stats
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for (day, url, output_path), ok, stats in executor.map(fetch, pending):
+            summary['retries'] += stats.get('retries', 0)
+            if ok:
+                summary['downloaded'] += 1
+                summary['bytes'] += stats.get('bytes', 0)
+                if journal is not None:
+                    journal.record('download', day.strftime('%Y-%m-%d'), output_path)
+            else:
+                print(f"エラー: ファイルのダウンロードに失敗しました: {url}")
+                summary['failed'] += 1
+    
+    print(f"\nダウンロード完了:")
+    print(f"- ダウンロード成功: {summary['downloaded']} ファイル")
+    print(f"- 既存ファイルスキップ: {summary['skipped']} ファイル")
+    if summary['retries'] > 0:
+        print(f"- 再試行: {summary['retries']} 回")
+    if summary['failed'] > 0:
+        print(f"- ダウンロード失敗: {summary['failed']} ファイル")
+    return summary
+
+
+def process_download(config_file):
+    """設定ファイルに基づいてnetCDFファイルをダウンロードする"""
+    config = load_config(config_file)
+
+    start_date = config['download_start_date']
+    end_date = config['download_end_date']
+    targets = config['targets']
+    output_dir = config['output_directory']
+    skip_existing = config.get('skip_existing_files', True)
+
+    # ストレージ要件の計算
+    calculate_storage_requirements(start_date, end_date, targets=targets)
+    
+    # ユーザー確認
+    if 'auto_confirm' not in config or not config['auto_confirm']:
+        confirm = input("\n続行しますか？ (y/n): ")
+        if confirm.lower() != 'y':
+            print("処理を中止しました。")
+            return False
+
+    # ディレクトリの準備
+    save_dir = os.path.join(output_dir, 'netcdf')
+    if not os.path.exists(save_dir):
+        os.makedirs(save_dir)
+
+    # データをダウンロード
+    download_msm_data(start_date, end_date, save_dir, skip_existing, RunJournal(journal_directory(config)),
+                      archive_base_url(config), int(config.get('download_workers', 1)),
+                      **download_settings(config))
+    return True
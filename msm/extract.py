@@ -0,0 +1,299 @@
+"""netCDFファイルからの地点データ抽出"""
+
+import os
+import warnings
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+from msm.download import process_download
+from msm.fields import read_field, r1h_sentinel_mask, wind_direction, wind_speed
+from msm.journal import atomic_path, journal_directory, RunJournal
+
+def target_csv_path(csv_dir, target_name, nc_file):
+    """netCDFファイル（YYYY/MMDD.nc）に対応する地点のCSVファイル（YYYY/YYYYMMDD.csv）のパスを返す"""
+    year_str = os.path.basename(os.path.dirname(nc_file))
+    date_str = os.path.splitext(os.path.basename(nc_file))[0]
+    return os.path.join(csv_dir, target_name, year_str, f"{year_str}{date_str}.csv")
+
+def _existing_csv_files(csv_dir, target_name, year_str, cache):
+    """地点・年ディレクトリ内の空でないCSVファイル名の集合を返す（ディレクトリごとに1回だけ読む）"""
+    key = (target_name, year_str)
+    if key not in cache:
+        names = set()
+        year_dir = os.path.join(csv_dir, target_name, year_str)
+        if os.path.isdir(year_dir):
+            with os.scandir(year_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.csv') and entry.stat().st_size > 0:
+                        names.add(entry.name)
+        cache[key] = names
+    return cache[key]
+
+def find_missing_targets(nc_file, targets, csv_dir, cache=None):
+    """netCDFファイルについて、CSVがまだ抽出されていない地点だけを返す"""
+    if cache is None:
+        cache = {}
+    year_str = os.path.basename(os.path.dirname(nc_file))
+    missing = {}
+    for target_name, target_info in targets.items():
+        csv_name = os.path.basename(target_csv_path(csv_dir, target_name, nc_file))
+        if csv_name not in _existing_csv_files(csv_dir, target_name, year_str, cache):
+            missing[target_name] = target_info
+    return missing
+
+# 近傍の窓の統計を計算する変数（地点の window を指定した場合のデフォルト）
+WINDOW_VARIABLES = ['temp', 'r1h', 'wind_speed']
+
+def window_slices(lat_idx, lon_idx, window, n_lat, n_lon):
+    """地点のグリッドを中心とする window × window の範囲（グリッドの端では切り詰める）をスライスで返す"""
+    half = window // 2
+    return (slice(max(lat_idx - half, 0), min(lat_idx + half + 1, n_lat)),
+            slice(max(lon_idx - half, 0), min(lon_idx + half + 1, n_lon)))
+
+def neighbourhood_statistics(blocks, variables):
+    """
+    地点の周囲の (時間, k, k) のブロックから、時刻ごとの平均・最大・標準偏差の列を計算する
+
+    blocks は read_field で読み込んだもの（temp は摂氏）。r1h の特殊値（200）は除き、
+    wind_speed は u, v のブロックから求める。
+
+    Returns:
+    --------
+    dict
+        列名（'{変数}_win_mean', '{変数}_win_max', '{変数}_win_std'）-> 配列
+    """
+    columns = {}
+    for var_name in variables:
+        try:
+            if var_name == 'wind_speed':
+                values = wind_speed(blocks['u'].astype(np.float64), blocks['v'].astype(np.float64))
+            else:
+                values = blocks[var_name].astype(np.float64)
+                if var_name == 'r1h':
+                    values[r1h_sentinel_mask(values)] = np.nan
+            flat = values.reshape(values.shape[0], -1)
+            with np.errstate(invalid='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                columns[f'{var_name}_win_mean'] = np.nanmean(flat, axis=1)
+                columns[f'{var_name}_win_max'] = np.nanmax(flat, axis=1)
+                columns[f'{var_name}_win_std'] = np.nanstd(flat, axis=1)
+        except KeyError as e:
+            print(f"警告: 変数 '{var_name}' の近傍の統計を計算できません: {e}")
+    return columns
+
+def extract_msm_data_to_csv(nc_file, targets, output_dir, journal=None, transects=None, transect_dir=None,
+                            derived_variables=None, derived_parameters=None, panel=None):
+    """複数の地点でのMSMデータをnetCDFファイルから抽出し、CSVファイルに保存する。
+    targets に含まれる地点だけを書き込み、それ以外の地点の既存ファイルには触れない。
+    CSVは一時ファイル経由で書き込み、journal に完了した地点・日を記録する。
+    transects を指定した場合は同じファイルから測線も抽出して transect_dir に保存する。
+    derived_variables を指定した場合は全地点の値から派生量を1回で計算して列を追加する。
+    panel（msm.panel.Panel）を指定した場合は全地点の値をパネルにも書き込む"""
+    try:
+        dataset = nc.Dataset(nc_file)
+    except Exception as e:
+        print(f"エラー: ファイル {nc_file} の処理中に問題が発生しました: {e}")
+        return False
+
+    try:
+        lats = dataset.variables['lat'][:]
+        lons = dataset.variables['lon'][:]
+        
+        # 時刻は全地点で共通なので1回だけ読み込む
+        times = dataset.variables['time'][:]
+        time_values = nc.num2date(times, units=dataset.variables['time'].units)
+        
+        # ファイル名の準備（日付部分を抽出）
+        file_basename = os.path.basename(nc_file)
+        date_str = os.path.splitext(file_basename)[0]  # 例：0501
+        
+        # 親ディレクトリから年を取得
+        nc_dir = os.path.dirname(nc_file)
+        year_str = os.path.basename(nc_dir)  # 例：2020
+        
+        # 完全な日付文字列を作成（YYYYMMDD形式）
+        full_date_str = f"{year_str}{date_str}"  # 例：20200501
+        
+        # 各ターゲット地点に対してデータを抽出（派生量を全地点まとめて計算するため、書き込みは後で行う）
+        extracted = []
+        for target_name, target_info in targets.items():
+            target_lat = target_info['latitude']
+            target_lon = target_info['longitude']
+            
+            # 最も近いグリッドポイントのインデックスを見つける
+            lat_idx = np.abs(lats - target_lat).argmin()
+            lon_idx = np.abs(lons - target_lon).argmin()
+            
+            # 実際のグリッドポイントの座標
+            actual_lat = float(lats[lat_idx])
+            actual_lon = float(lons[lon_idx])
+            
+            data = {'time': [], 'grid_latitude': [], 'grid_longitude': []}
+            data['time'] = time_values
+            
+            # 各時間ポイントに対してグリッド座標を追加
+            for _ in range(len(time_values)):
+                data['grid_latitude'].append(actual_lat)
+                data['grid_longitude'].append(actual_lon)
+            
+            # window を指定した地点は、変数ごとに周囲の範囲を1回で読み込み、中心の値もそこから取り出す
+            window = int(target_info.get('window', 1))
+            blocks = {}
+            if window > 1:
+                lat_slice, lon_slice = window_slices(lat_idx, lon_idx, window, len(lats), len(lons))
+                center = (lat_idx - lat_slice.start, lon_idx - lon_slice.start)
+            
+            variables_of_interest = ['psea', 'sp', 'u', 'v', 'temp', 'rh', 'r1h', 'ncld', 'dswrf']
+            for var_name in variables_of_interest:
+                try:
+                    # netCDF4 が scale_factor・add_offset を適用済みの値を読み込む（temp は摂氏に変換）。
+                    # r1h の特殊値（200）はそのまま残し、msm fix で処理する
+                    if window > 1:
+                        blocks[var_name] = read_field(dataset, var_name, (lat_slice, lon_slice), mask_sentinel=False)
+                        data[var_name] = blocks[var_name][:, center[0], center[1]].copy()
+                    else:
+                        data[var_name] = read_field(dataset, var_name, (lat_idx, lon_idx), mask_sentinel=False)
+                except Exception as e:
+                    print(f"警告: 変数 '{var_name}' の抽出中にエラーが発生しました: {e}")
+                    data[var_name] = np.full(len(time_values), np.nan)  # 欠損値で埋める
+
+            # Calculate wind direction and speed
+            data['wind_direction'] = wind_direction(data['u'], data['v'])
+            data['wind_speed'] = wind_speed(data['u'], data['v'])
+
+            # 近傍の窓の統計
+            if window > 1:
+                data.update(neighbourhood_statistics(blocks, target_info.get('window_variables', WINDOW_VARIABLES)))
+            
+            # 地点ごとのディレクトリを作成
+            target_dir = os.path.join(output_dir, target_name)
+            if not os.path.exists(target_dir):
+                os.makedirs(target_dir, exist_ok=True)
+            
+            # データをCSVに変換（年ディレクトリを作成）
+            target_year_dir = os.path.join(target_dir, year_str)
+            if not os.path.exists(target_year_dir):
+                os.makedirs(target_year_dir, exist_ok=True)
+            
+            # 新しい命名規則：YYYYMMDDの形式で年を含む
+            csv_file_path = os.path.join(target_year_dir, f"{full_date_str}.csv")
+            
+            # データフレームに変換
+            df = pd.DataFrame(data)
+            extracted.append((target_name, df, csv_file_path,
+                              f"(指定座標: {target_lat}, {target_lon}, 実際のグリッド: {actual_lat}, {actual_lon})"))
+
+        if derived_variables:
+            from msm.derived import add_derived_columns
+            add_derived_columns([df for _, df, _, _ in extracted], derived_variables, derived_parameters)
+
+        if panel is not None and extracted:
+            panel.write(pd.to_datetime([str(t) for t in time_values]).to_numpy(),
+                        [name for name, _, _, _ in extracted], [df for _, df, _, _ in extracted])
+
+        # CSVとして保存
+        for target_name, df, csv_file_path, location in extracted:
+            with atomic_path(csv_file_path) as tmp_path:
+                df.to_csv(tmp_path, index=False)
+            if journal is not None:
+                journal.record('extract', f"{target_name}/{full_date_str}", csv_file_path)
+            
+            print(f"データを保存しました: {csv_file_path} {location}")
+
+        if transects:
+            from msm.transect import write_transects
+            write_transects(dataset, nc_file, transects, transect_dir, time_values, journal)
+            
+        return True
+    
+    except Exception as e:
+        print(f"エラー: ファイル {nc_file} の処理中に問題が発生しました: {e}")
+        return False
+
+    finally:
+        dataset.close()
+
+def process_extract(config_file):
+    """設定ファイルに基づいてダウンロード済みのnetCDFファイルから各地点のCSVを抽出する"""
+    config = load_config(config_file)
+
+    targets = config['targets']
+    output_dir = config['output_directory']
+    skip_existing = config.get('skip_existing_files', True)
+
+    save_dir = os.path.join(output_dir, 'netcdf')
+    csv_dir = os.path.join(output_dir, 'csv')
+
+    if not os.path.exists(save_dir):
+        print(f"エラー: netCDFディレクトリが見つかりません: {save_dir}")
+        return False
+    if not os.path.exists(csv_dir):
+        os.makedirs(csv_dir)
+
+    # 各netCDFファイルから各地点のデータを抽出
+    print("\n各地点のデータを抽出しています...")
+    processed_count = 0
+    skipped_count = 0
+    failed_count = 0
+    extracted_pairs = 0
+    existing_cache = {}
+    journal = RunJournal(journal_directory(config))
+
+    # 測線（transects）は地点と同じnetCDFファイルを開いたときに抽出する
+    from msm.derived import derived_settings
+    from msm.panel import open_panel_writer
+    derived_variables, derived_parameters = derived_settings(config)
+    panel = open_panel_writer(config)
+
+    transects = {}
+    transect_dir = os.path.join(output_dir, 'transect')
+    if config.get('transects'):
+        from msm.transect import resolve_transects
+        transects = resolve_transects(config)
+    
+    for year_dir in sorted(os.listdir(save_dir)):
+        year_path = os.path.join(save_dir, year_dir)
+        if os.path.isdir(year_path):
+            for nc_file in sorted(os.listdir(year_path)):
+                if nc_file.endswith('.nc'):
+                    nc_file_path = os.path.join(year_path, nc_file)
+                    
+                    # 既存の抽出結果をチェックし、CSVがない地点だけを抽出する
+                    if skip_existing:
+                        missing = find_missing_targets(nc_file_path, targets, csv_dir, existing_cache)
+                        missing_transects = {}
+                        if transects:
+                            from msm.transect import find_missing_transects
+                            missing_transects = find_missing_transects(nc_file_path, transects, transect_dir)
+                    else:
+                        missing = targets
+                        missing_transects = transects
+                    
+                    if not missing and not missing_transects:
+                        skipped_count += 1
+                    else:
+                        print(f"処理中: {nc_file} ({len(missing)}/{len(targets)} 地点)")
+                        if extract_msm_data_to_csv(nc_file_path, missing, csv_dir, journal,
+                                                   missing_transects, transect_dir,
+                                                   derived_variables, derived_parameters, panel):
+                            processed_count += 1
+                            extracted_pairs += len(missing)
+                        else:
+                            failed_count += 1
+    
+    print(f"\nデータ抽出完了:")
+    print(f"- 処理成功: {processed_count} ファイル (抽出した地点・日: {extracted_pairs})")
+    print(f"- スキップ（全地点抽出済み）: {skipped_count} ファイル")
+    if failed_count > 0:
+        print(f"- 処理失敗: {failed_count} ファイル")
+    
+    return True
+
+def process_download_and_csv(config_file):
+    """設定ファイルに基づいてデータのダウンロードとCSV変換を実行する"""
+    if not process_download(config_file):
+        return False
+    return process_extract(config_file)
@@ -0,0 +1,76 @@
+"""netCDFの変数の読み込みと r1h の特殊値の判定（各処理で共通）
+
+抽出・地図・日別グリッド・測線・近傍の統計は、この関数で変数を読み込む::
+
+    temp = read_field(dataset, 'temp', (lat_slice, lon_slice))  # 摂氏、r1h の特殊値は NaN
+
+このモジュールでは numpy 以外を読み込まないこと（CSVだけを扱う処理からも使うため）。
+"""
+
+import numpy as np
+
+# r1h の特殊値（観測・解析できなかった時刻）
+R1H_SENTINEL = 200.0
+
+# u, v 成分から求める変数
+WIND_VARIABLES = ('wind_speed', 'wind_direction')
+
+
+def r1h_sentinel_mask(values):
+    """r1h の特殊値（200）の位置を真とする配列を返す"""
+    return np.isclose(values, R1H_SENTINEL, rtol=1e-10, atol=1e-10)
+
+
+def mask_r1h_sentinel(values):
+    """r1h の特殊値（200）を NaN にした浮動小数点の配列を返す（入力は変更しない）"""
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(r1h_sentinel_mask(values), np.nan, values)
+
+
+def wind_speed(u, v):
+    """u, v 成分から風速を求める"""
+    return np.sqrt(u ** 2 + v ** 2)
+
+
+def wind_direction(u, v):
+    """u, v 成分から風向（吹いてくる方向、北=0度、時計回り）を求める"""
+    return (270 - np.degrees(np.arctan2(v, u))) % 360
+
+
+def read_field(dataset, name, slices=(), dtype=None, mask_sentinel=True):
+    """
+    netCDFの変数を全時刻まとめて読み込み、欠損を NaN にした配列を返す
+
+    temp は摂氏に変換し、wind_speed・wind_direction は u, v から求める。
+
+    Parameters:
+    -----------
+    dataset : netCDF4.Dataset
+        読み込むnetCDFファイル
+    name : str
+        変数名（'wind_speed', 'wind_direction' も指定できる）
+    slices : tuple, default=()
+        (緯度, 経度) の添字（スライスまたは整数）。省略した場合は全体
+    dtype : numpy.dtype, default=None
+        戻り値の型。Noneの場合は変数の型（整数の場合は float64）
+    mask_sentinel : bool, default=True
+        r1h の特殊値（200）を NaN にするかどうか（CSVへの抽出では残し、msm fix で処理する）
+
+    Returns:
+    --------
+    numpy.ndarray
+        (時間, ...) の配列
+    """
+    if name in WIND_VARIABLES:
+        u = read_field(dataset, 'u', slices, dtype)
+        v = read_field(dataset, 'v', slices, dtype)
+        return wind_speed(u, v) if name == 'wind_speed' else wind_direction(u, v)
+    values = np.ma.asarray(dataset.variables[name][(slice(None),) + tuple(slices)])
+    if dtype is None:
+        dtype = values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64
+    values = np.ma.filled(values.astype(dtype), np.nan)
+    if name == 'temp':
+        values -= 273.15
+    elif name == 'r1h' and mask_sentinel:
+        values[r1h_sentinel_mask(values)] = np.nan
+    return values
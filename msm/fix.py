@@ -0,0 +1,634 @@
+"""
+MSMデータのCSVファイルに対する特殊値（r1h=200）処理
+
+``msm fix --input-dir ./output/csv --output-dir ./output/csv_fixed`` で実行する。
+
+1. 指定されたディレクトリ内のすべての地点・年のフォルダを探索
+2. 各フォルダ内のCSVファイルに対して特殊値処理を実行
+3. 処理結果を指定された出力ディレクトリに同じ構造で保存
+"""
+
+import os
+import time
+import fnmatch
+import concurrent.futures
+
+import numpy as np
+import pandas as pd
+
+from msm.fields import r1h_sentinel_mask
+from msm.journal import atomic_path, fix_journal_directory, RunJournal
+
+
+def process_r1h_timeseries(input_file, output_file, method='nan', r1h_column='r1h', time_column='time', verbose=True):
+    """
+    時系列として整理されたCSVファイルを効率的に処理する関数
+    特に時系列に沿った補間に最適化されています
+
+    Parameters:
+    -----------
+    input_file : str
+        入力CSVファイルのパス
+    output_file : str
+        出力CSVファイルのパス
+    method : str, default='nan'
+        特殊値の処理方法 ('nan', 'zero', 'interp')
+    r1h_column : str, default='r1h'
+        降水量データの列名
+    time_column : str, default='time'
+        時間データの列名
+    verbose : bool, default=True
+        詳細出力を表示するかどうか
+
+    Returns:
+    --------
+    bool
+        処理が成功したかどうか
+    """
+    try:
+        # CSVファイルを読み込む
+        if verbose:
+            print(f"処理中: {input_file}")
+
+        df = pd.read_csv(input_file)
+
+        if r1h_column not in df.columns:
+            if verbose:
+                print(f"警告: '{r1h_column}'列が存在しません")
+            return False
+
+        # 時間列がある場合は日時型に変換
+        if time_column in df.columns:
+            try:
+                df[time_column] = pd.to_datetime(df[time_column])
+                # 時間でソート
+                df = df.sort_values(time_column)
+            except:
+                if verbose:
+                    print(f"警告: 時間列の変換でエラーが発生しました")
+
+        # 特殊値の処理
+        special_mask = r1h_sentinel_mask(df[r1h_column])
+        special_count = special_mask.sum()
+
+        if special_count > 0:
+            if method == 'nan':
+                # NaNに置換
+                df.loc[special_mask, r1h_column] = np.nan
+
+            elif method == 'zero':
+                # 0に置換
+                df.loc[special_mask, r1h_column] = 0.0
+
+            elif method == 'interp':
+                # NaNに置換して補間
+                df.loc[special_mask, r1h_column] = np.nan
+                df[r1h_column] = df[r1h_column].interpolate(method='linear', limit_direction='both')
+                df[r1h_column] = df[r1h_column].fillna(0)
+
+            # 極小な負値を0に設定（オプション）
+            small_negative_mask = df[r1h_column] < 0.0001
+            if small_negative_mask.sum() > 0:
+                df.loc[small_negative_mask, r1h_column] = 0.0
+
+        # 処理済みデータを保存
+        output_dir = os.path.dirname(output_file)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+
+        with atomic_path(output_file) as tmp_path:
+            df.to_csv(tmp_path, index=False)
+
+        return True
+
+    except Exception as e:
+        if verbose:
+            print(f"エラー: ファイル {input_file} の処理中に問題が発生しました: {e}")
+        return False
+
+
+def find_csv_files(base_dir, pattern='*.csv'):
+    """
+    指定されたディレクトリ内のすべてのCSVファイルを再帰的に検索
+    
+    Parameters:
+    -----------
+    base_dir : str
+        検索を開始するベースディレクトリ
+    pattern : str, default='*.csv'
+        対象とするファイル名のパターン
+    
+    Returns:
+    --------
+    list
+        発見されたCSVファイルのパスのリスト
+    """
+    csv_files = []
+    
+    for root, dirs, files in os.walk(base_dir):
+        for file in files:
+            if fnmatch.fnmatch(file, pattern):
+                csv_files.append(os.path.join(root, file))
+    
+    return csv_files
+
+
+def _output_paths(input_files, output_dir):
+    """入力ファイルの共通ディレクトリからの相対パスで出力ファイルのパスを作成する"""
+    input_dir = os.path.commonpath([os.path.dirname(f) for f in input_files])
+    return [os.path.join(output_dir, os.path.relpath(f, input_dir)) for f in input_files]
+
+
+class StreamingGapCleaner:
+    """
+    地点のCSVファイルを時刻順に1つずつ受け取り、ファイル（日）の境界をまたいで
+    r1h の特殊値を線形補間する
+
+    補間が確定していない末尾の欠損を含むファイルだけを保留し、欠損の右側の値が
+    現れるか、欠損が max_gap 時間を超えた時点で書き出す。保留するのは最大でも
+    max_gap 時間分と1ファイルなので、期間の長さによらずメモリ使用量は一定。
+
+    - 前後の有効値の間の欠損が max_gap 時間以下なら時刻に対して線形補間する
+    - それより長い欠損と、系列の先頭・末尾の欠損は0にする（method='interp' と同じ）
+    """
+
+    def __init__(self, max_gap=6, r1h_column='r1h', time_column='time', journal=None):
+        self.max_gap = max_gap
+        self.r1h_column = r1h_column
+        self.time_column = time_column
+        # 書き出したファイルを記録するジャーナル（None の場合は記録しない）
+        self.journal = journal
+        # 保留中のファイル: (DataFrame, 元の値（特殊値はNaN）, 時刻[時間], 出力パス, 特殊値の有無, 入力パス)
+        self.pending = []
+        # 保留中のファイルより前の最後の有効値 (時刻[時間], 値)
+        self.anchor = None
+        self.special_count = 0
+
+    def _fill(self, final):
+        """保留中のファイルの欠損を補間し、確定したファイルを書き出す。書き出したファイル数を返す"""
+        values = np.concatenate([frame[1] for frame in self.pending])
+        hours = np.concatenate([frame[2] for frame in self.pending])
+        if self.anchor is not None:
+            values = np.concatenate([[self.anchor[1]], values])
+            hours = np.concatenate([[self.anchor[0]], hours])
+        n = len(values)
+        positions = np.arange(n)
+        valid = ~np.isnan(values)
+
+        # 各行の左右の最も近い有効値の位置（ない場合は -1 / n）
+        left = np.maximum.accumulate(np.where(valid, positions, -1))
+        right = np.minimum.accumulate(np.where(valid, positions, n)[::-1])[::-1]
+        has_left = left >= 0
+        closed = right < n
+        left_hours = hours[np.maximum(left, 0)]
+        right_hours = hours[np.minimum(right, n - 1)]
+        # 欠損している時間数（閉じていない欠損は現時点までの長さ）
+        gap_hours = np.where(closed, right_hours, hours[-1] + 1) - left_hours - 1
+        short_gap = has_left & (np.rint(gap_hours) <= self.max_gap)
+
+        filled = values.copy()
+        interpolate = ~valid & closed & short_gap
+        if interpolate.any():
+            left_values = values[left[interpolate]]
+            right_values = values[right[interpolate]]
+            weight = (hours[interpolate] - left_hours[interpolate]) / (right_hours[interpolate] - left_hours[interpolate])
+            filled[interpolate] = left_values + (right_values - left_values) * weight
+        unresolved = ~valid & ~closed & short_gap & (not final)
+        filled[~valid & ~interpolate & ~unresolved] = 0.0
+
+        if self.anchor is not None:
+            filled = filled[1:]
+            unresolved = unresolved[1:]
+
+        # 確定したファイルを書き出す（未確定の欠損を含むファイル以降は保留）
+        offset = 0
+        flush_count = len(self.pending)
+        for i, (df, original, _, output_file, had_special, input_file) in enumerate(self.pending):
+            rows = slice(offset, offset + len(original))
+            offset += len(original)
+            if unresolved[rows].any():
+                flush_count = i
+                break
+            df[self.r1h_column] = filled[rows]
+            if had_special:
+                # 極小な負値を0に設定（process_r1h_timeseries と同じ）
+                df.loc[df[self.r1h_column] < 0.0001, self.r1h_column] = 0.0
+            output_dir = os.path.dirname(output_file)
+            if not os.path.exists(output_dir):
+                os.makedirs(output_dir, exist_ok=True)
+            with atomic_path(output_file) as tmp_path:
+                df.to_csv(tmp_path, index=False)
+            if self.journal is not None:
+                self.journal.record('fix', output_file, output_file, source=input_file,
+                                    method='continuous', max_gap=self.max_gap)
+            original_valid = ~np.isnan(original)
+            if original_valid.any():
+                last = np.flatnonzero(original_valid)[-1]
+                self.anchor = (self.pending[i][2][last], original[last])
+        self.pending = self.pending[flush_count:]
+        return flush_count
+
+    def add(self, input_file, output_file):
+        """ファイルを1つ追加する。書き出したファイル数を返す"""
+        df = pd.read_csv(input_file)
+        if self.r1h_column not in df.columns:
+            raise KeyError(f"'{self.r1h_column}'列が存在しません: {input_file}")
+        df[self.time_column] = pd.to_datetime(df[self.time_column])
+        df = df.sort_values(self.time_column)
+
+        original = df[self.r1h_column].to_numpy(dtype=np.float64).copy()
+        special_mask = r1h_sentinel_mask(original)
+        original[special_mask] = np.nan
+        self.special_count += int(special_mask.sum())
+        hours = df[self.time_column].to_numpy(dtype='datetime64[s]').astype(np.int64) / 3600.0
+        self.pending.append((df, original, hours, output_file, bool(special_mask.any()), input_file))
+        return self._fill(final=False)
+
+    def finish(self):
+        """残りのファイルを書き出す（末尾の欠損は0にする）。書き出したファイル数を返す"""
+        if not self.pending:
+            return 0
+        return self._fill(final=True)
+
+
+def clean_r1h_continuous(input_files, output_files, max_gap=6, r1h_column='r1h', time_column='time', verbose=True,
+                         journal=None):
+    """
+    1地点のCSVファイルを時刻順に1回だけ読み、日の境界をまたいで r1h の欠損を補間する
+
+    Parameters:
+    -----------
+    input_files : list
+        1地点の入力CSVファイルのパスのリスト
+    output_files : list
+        対応する出力CSVファイルのパスのリスト
+    max_gap : int, default=6
+        線形補間する欠損の最大の長さ（時間）
+    r1h_column : str, default='r1h'
+        降水量データの列名
+    time_column : str, default='time'
+        時間データの列名
+    verbose : bool, default=True
+        詳細出力を表示するかどうか
+    journal : msm.journal.RunJournal, default=None
+        書き出したファイルを記録するジャーナル（method='continuous' と max_gap を付けて記録する）
+
+    Returns:
+    --------
+    tuple
+        (成功数, 失敗数)
+    """
+    cleaner = StreamingGapCleaner(max_gap, r1h_column, time_column, journal)
+    written = 0
+    try:
+        # YYYY/YYYYMMDD.csv のパスは文字列順が時刻順になる
+        for input_file, output_file in sorted(zip(input_files, output_files)):
+            written += cleaner.add(input_file, output_file)
+        written += cleaner.finish()
+    except Exception as e:
+        if verbose:
+            print(f"エラー: 連続補間の処理中に問題が発生しました: {e}")
+        return written, len(input_files) - written
+    if verbose:
+        print(f"連続補間: {len(input_files)} ファイル, 特殊値 {cleaner.special_count} 個")
+    return written, 0
+
+
+def _process_and_record(input_file, output_file, method, r1h_column, time_column, journal):
+    """1ファイルを処理し、成功した場合はジャーナルに記録する"""
+    if not process_r1h_timeseries(input_file, output_file, method, r1h_column, time_column, False):
+        return False
+    if journal is not None:
+        journal.record('fix', output_file, output_file, source=input_file, method=method)
+    return True
+
+
+def run_batch(input_files, output_files, worker, parallel=True, max_workers=None, verbose=True):
+    """
+    入力ファイルと出力ファイルの組を worker で並列または逐次に処理する（fix・qc で共通）
+
+    Parameters:
+    -----------
+    input_files, output_files : list
+        入力・出力ファイルのパスのリスト（同じ順）
+    worker : callable
+        worker(input_file, output_file)。偽の値を返した場合や例外は失敗として数える
+    parallel : bool, default=True
+        並列処理を行うかどうか
+    max_workers : int, default=None
+        並列処理の最大ワーカー数（Noneの場合はCPUコア数×5）
+    verbose : bool, default=True
+        詳細出力を表示するかどうか
+
+    Returns:
+    --------
+    tuple
+        (成功数, 失敗数, 処理時間, {入力ファイル: worker の戻り値})
+    """
+    start_time = time.time()
+    success_count = 0
+    failure_count = 0
+    results = {}
+
+    def collect(input_file, result):
+        nonlocal success_count, failure_count
+        results[input_file] = result
+        if result:
+            success_count += 1
+        else:
+            failure_count += 1
+
+    if parallel:
+        # 並列処理
+        if max_workers is None:
+            # デフォルトはCPUコア数の5倍（I/O待ちが多いため）
+            import multiprocessing
+            max_workers = multiprocessing.cpu_count() * 5
+        
+        if verbose:
+            print(f"並列処理を開始: 最大ワーカー数 = {max_workers}")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # ファイルごとに処理を並列実行
+            future_to_file = {
+                executor.submit(worker, input_file, output_file): input_file
+                for input_file, output_file in zip(input_files, output_files)
+            }
+            
+            # タスク完了を待機し、進捗状況を表示
+            total_files = len(input_files)
+            completed = 0
+            
+            for future in concurrent.futures.as_completed(future_to_file):
+                input_file = future_to_file[future]
+                try:
+                    collect(input_file, future.result())
+                except Exception as e:
+                    if verbose:
+                        print(f"エラー: ファイル {input_file} の処理中に例外が発生しました: {e}")
+                    collect(input_file, None)
+                
+                completed += 1
+                if verbose and completed % 100 == 0:
+                    progress = (completed / total_files) * 100
+                    elapsed = time.time() - start_time
+                    remaining = (elapsed / completed) * (total_files - completed) if completed > 0 else 0
+                    print(f"進捗: {completed}/{total_files} ファイル ({progress:.1f}%) - "
+                          f"経過時間: {elapsed:.1f}秒, 残り時間: {remaining:.1f}秒")
+    else:
+        # 逐次処理
+        for i, (input_file, output_file) in enumerate(zip(input_files, output_files)):
+            if verbose and (i+1) % 100 == 0:
+                progress = ((i+1) / len(input_files)) * 100
+                print(f"進捗: {i+1}/{len(input_files)} ファイル ({progress:.1f}%)")
+            
+            try:
+                collect(input_file, worker(input_file, output_file))
+            except Exception as e:
+                if verbose:
+                    print(f"エラー: ファイル {input_file} の処理中に例外が発生しました: {e}")
+                collect(input_file, None)
+    
+    return success_count, failure_count, time.time() - start_time, results
+
+
+def process_csv_batch(input_files, output_dir, method='nan', r1h_column='r1h', time_column='time',
+                     parallel=True, max_workers=None, verbose=True, journal=None):
+    """
+    複数のCSVファイルをバッチ処理する関数
+    
+    Parameters:
+    -----------
+    input_files : list
+        処理するCSVファイルのパスのリスト
+    output_dir : str
+        出力ディレクトリのパス
+    method : str, default='nan'
+        特殊値の処理方法 ('nan', 'zero', 'interp')
+    r1h_column : str, default='r1h'
+        降水量データの列名
+    time_column : str, default='time'
+        時間データの列名
+    parallel : bool, default=True
+        並列処理を行うかどうか
+    max_workers : int, default=None
+        並列処理の最大ワーカー数（Noneの場合はCPUコア数×5）
+    verbose : bool, default=True
+        詳細出力を表示するかどうか
+    journal : msm.journal.RunJournal, default=None
+        処理済みのファイルの記録。入力ファイルと処理方法が同じで出力ファイルが
+        記録どおりに存在するファイルはスキップする（中断した処理の再開）
+    
+    Returns:
+    --------
+    tuple
+        (成功数, 失敗数, 処理時間)
+    """
+    # 入力ディレクトリと出力ディレクトリのマッピングを作成
+    output_files = _output_paths(input_files, output_dir)
+
+    if journal is not None:
+        pairs = [(i, o) for i, o in zip(input_files, output_files)
+                 if not journal.is_done('fix', o, source=i, method=method)]
+        if verbose and len(pairs) < len(input_files):
+            print(f"ジャーナルにより処理済みの {len(input_files) - len(pairs)} ファイルをスキップします")
+        input_files = [i for i, _ in pairs]
+        output_files = [o for _, o in pairs]
+
+    def worker(input_file, output_file):
+        return _process_and_record(input_file, output_file, method, r1h_column, time_column, journal)
+
+    success_count, failure_count, processing_time, _ = run_batch(input_files, output_files, worker,
+                                                                 parallel, max_workers, verbose)
+    return success_count, failure_count, processing_time
+
+
+def process_csv_continuous(input_files, output_dir, max_gap=6, r1h_column='r1h', time_column='time',
+                           parallel=True, max_workers=None, verbose=True, journal=None):
+    """
+    地点ごとにCSVファイルを時刻順に処理し、日の境界をまたいで r1h の欠損を補間する
+    （地点の中は逐次処理、地点の間は並列処理）
+
+    journal を指定した場合、全ファイルが同じ入力・max_gap で処理済みの地点はスキップする。
+    補間は前後の日のファイルに依存するため、一部だけ処理済みの地点は全体を処理し直す
+
+    Returns:
+    --------
+    tuple
+        (成功数, 失敗数, 処理時間)
+    """
+    start_time = time.time()
+    output_files = _output_paths(input_files, output_dir)
+
+    # 地点（YYYY ディレクトリの親）ごとに分ける
+    groups = {}
+    for input_file, output_file in zip(input_files, output_files):
+        target_dir = os.path.dirname(os.path.dirname(input_file))
+        groups.setdefault(target_dir, ([], []))
+        groups[target_dir][0].append(input_file)
+        groups[target_dir][1].append(output_file)
+
+    if journal is not None:
+        skipped = 0
+        for target_dir, (files, outputs) in list(groups.items()):
+            if all(journal.is_done('fix', o, source=i, method='continuous', max_gap=max_gap)
+                   for i, o in zip(files, outputs)):
+                skipped += len(files)
+                del groups[target_dir]
+        if verbose and skipped:
+            print(f"ジャーナルにより処理済みの {skipped} ファイルをスキップします")
+
+    success_count = 0
+    failure_count = 0
+    if parallel and len(groups) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or len(groups)) as executor:
+            futures = [executor.submit(clean_r1h_continuous, files, outputs, max_gap, r1h_column, time_column, verbose,
+                                       journal)
+                       for files, outputs in groups.values()]
+            for future in concurrent.futures.as_completed(futures):
+                success, failure = future.result()
+                success_count += success
+                failure_count += failure
+    else:
+        for files, outputs in groups.values():
+            success, failure = clean_r1h_continuous(files, outputs, max_gap, r1h_column, time_column, verbose,
+                                                    journal)
+            success_count += success
+            failure_count += failure
+
+    return success_count, failure_count, time.time() - start_time
+
+
+def select_csv_files(input_dir, station=None, year=None, pattern='*.csv'):
+    """
+    入力ディレクトリ内の地点・年で絞り込んだCSVファイルを返す（fix・qc で共通）
+
+    Returns:
+    --------
+    list or None
+        CSVファイルのパスのリスト。指定した地点・年のディレクトリがない場合はNone
+    """
+    # 処理対象のCSVファイルを検索
+    if station and year:
+        # 特定の観測地点と年のCSVファイルを対象
+        search_dirs = [os.path.join(input_dir, station, year)]
+        if not os.path.exists(search_dirs[0]):
+            print(f"エラー: 指定されたディレクトリ '{search_dirs[0]}' が見つかりません")
+            return None
+    elif station:
+        # 特定の観測地点のCSVファイルを対象
+        search_dirs = [os.path.join(input_dir, station)]
+        if not os.path.exists(search_dirs[0]):
+            print(f"エラー: 指定された観測地点のディレクトリ '{search_dirs[0]}' が見つかりません")
+            return None
+    elif year:
+        # 特定の年のCSVファイルを対象（全観測地点）
+        # 年ディレクトリは観測地点ディレクトリの下にあるため、複数のパスを検索
+        station_dirs = [os.path.join(input_dir, d) for d in os.listdir(input_dir) 
+                        if os.path.isdir(os.path.join(input_dir, d))]
+        search_dirs = [os.path.join(d, year) for d in station_dirs if os.path.exists(os.path.join(d, year))]
+        if not search_dirs:
+            print(f"エラー: 指定された年 '{year}' のディレクトリが見つかりません")
+            return None
+    else:
+        # すべてのCSVファイルを対象
+        search_dirs = [input_dir]
+    
+    csv_files = []
+    for search_dir in search_dirs:
+        csv_files.extend(find_csv_files(search_dir, pattern))
+    return csv_files
+
+
+def run_fix(input_dir, output_dir, method='nan', r1h_column='r1h', time_column='time',
+            station=None, year=None, pattern='*.csv', parallel=True, max_workers=None, verbose=True,
+            continuous=False, max_gap=6):
+    """
+    入力ディレクトリ内のCSVファイル（地点・年で絞り込み可能）に対して特殊値処理を一括実行する
+
+    continuous=True の場合は method='interp' の代わりに地点ごとの連続補間
+    （日の境界をまたいで max_gap 時間までの欠損を補間）を行う
+    
+    Returns:
+    --------
+    int
+        終了コード（すべて成功した場合は0）
+    """
+    # 入力ディレクトリの存在確認
+    if not os.path.exists(input_dir):
+        print(f"エラー: 入力ディレクトリ '{input_dir}' が見つかりません")
+        return 1
+    
+    csv_files = select_csv_files(input_dir, station, year, pattern)
+    if csv_files is None:
+        return 1
+    
+    # 処理対象のCSVファイル数を確認
+    if not csv_files:
+        print(f"エラー: 処理対象のCSVファイルが見つかりません")
+        return 1
+    
+    if verbose:
+        print(f"MSMデータ一括処理ツール")
+        print(f"処理対象: {len(csv_files)} ファイル")
+        print(f"処理方法: {'連続補間 (最大 ' + str(max_gap) + ' 時間)' if continuous else method}")
+        
+        # 処理対象の内訳を表示
+        stations = set()
+        years = set()
+        
+        for csv_file in csv_files:
+            # パスからステーション名と年を抽出
+            parts = csv_file.split(os.sep)
+            for i, part in enumerate(parts):
+                if i > 0 and parts[i-1] == 'csv':
+                    stations.add(part)
+                if part.isdigit() and len(part) == 4:
+                    years.add(part)
+        
+        print(f"対象観測地点: {', '.join(sorted(stations))}")
+        print(f"対象年: {', '.join(sorted(years))}")
+    
+    # 出力ディレクトリの作成
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    # 処理の実行
+    if continuous:
+        success_count, failure_count, processing_time = process_csv_continuous(
+            csv_files,
+            output_dir,
+            max_gap=max_gap,
+            r1h_column=r1h_column,
+            time_column=time_column,
+            parallel=parallel,
+            max_workers=max_workers,
+            verbose=verbose,
+            journal=RunJournal(fix_journal_directory(output_dir))
+        )
+    else:
+        success_count, failure_count, processing_time = process_csv_batch(
+            csv_files,
+            output_dir,
+            method=method,
+            r1h_column=r1h_column,
+            time_column=time_column,
+            parallel=parallel,
+            max_workers=max_workers,
+            verbose=verbose,
+            journal=RunJournal(fix_journal_directory(output_dir))
+        )
+    
+    # 処理結果の表示
+    if verbose:
+        print(f"\n処理完了:")
+        print(f"- 成功: {success_count} ファイル")
+        print(f"- 失敗: {failure_count} ファイル")
+        print(f"- 合計処理時間: {processing_time:.2f}秒")
+        
+        # 処理速度の計算
+        if processing_time > 0:
+            files_per_second = (success_count + failure_count) / processing_time
+            print(f"- 処理速度: {files_per_second:.2f}ファイル/秒")
+    
+    return 0 if failure_count == 0 else 1
@@ -0,0 +1,395 @@
+"""中断に強い出力（一時ファイル経由の書き込み）と処理済み単位の記録（ジャーナル）
+
+出力ファイルは同じディレクトリの一時ファイルに書き込んでから ``os.replace`` で
+置き換えるため、処理が途中で止まっても書きかけのファイルが正式な名前で残ることはない::
+
+    with atomic_path(csv_file) as tmp_path:
+        df.to_csv(tmp_path, index=False)
+
+ジャーナルは処理が完了した単位（日、地点・日、ファイル）ごとに、出力ファイルの
+パス・サイズ・更新時刻をJSONLで1行ずつ追記する。``msm verify`` はジャーナルと
+ディスク上のファイルを照合する。プロセスごとに別のファイルに書き込むため、
+複数のワーカーが同じジャーナルディレクトリを共有できる。
+
+ファイルは開いたままにして1行ごとに flush し、fsync は ``sync_every`` 件ごとと
+``close`` の時だけ行う（プロセスが異常終了しても記録は残り、OSが停止した場合に
+失われるのは最後の数件だけで、その単位は次回に処理し直される）。プロセスごとの
+ファイルは ``compact_journal`` で (段階, 単位) ごとの最新の記録だけの1ファイルにまとめる。
+
+このモジュールでは標準ライブラリ以外を読み込まないこと（``msm sync`` の起動時間のため）。
+"""
+
+import os
+import json
+import atexit
+import socket
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+
+@contextmanager
+def atomic_path(path):
+    """
+    path の代わりに書き込む一時ファイルのパスを返し、正常に終了した場合だけ path に置き換える
+
+    一時ファイルは同じディレクトリに ``.<ファイル名>.<ホスト名>.<pid>.<スレッド>.tmp`` として作成する
+    （``*.csv`` や ``*.nc`` のパターンに一致しない名前）。出力ディレクトリを共有する別のホストの
+    プロセスと pid が同じでも衝突しない。例外が発生した場合は削除する。
+    """
+    directory, name = os.path.split(path)
+    tmp_path = os.path.join(directory, f".{name}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _source_stat(path):
+    st = os.stat(path)
+    return {'source_size': st.st_size, 'source_mtime_ns': st.st_mtime_ns}
+
+
+def fix_journal_directory(fixed_dir):
+    """特殊値処理（msm fix）のジャーナルのディレクトリ（出力ディレクトリの .journal）"""
+    return os.path.join(fixed_dir, '.journal')
+
+
+def journal_directory(config):
+    """設定ファイルからジャーナルのディレクトリを返す（省略時は output_directory/journal）"""
+    return config.get('journal_directory', os.path.join(config['output_directory'], 'journal'))
+
+
+class RunJournal:
+    """
+    処理が完了した単位を記録するジャーナル
+
+    Parameters:
+    -----------
+    journal_dir : str
+        ジャーナルのディレクトリ
+    name : str, default=None
+        書き込むファイル名（拡張子なし）。Noneの場合はホスト名とプロセスIDから作成する
+    sync_every : int, default=100
+        fsync する間隔（記録の件数）
+    """
+
+    def __init__(self, journal_dir, name=None, sync_every=100):
+        self.journal_dir = journal_dir
+        name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.path = os.path.join(journal_dir, f"{name}.jsonl")
+        self.sync_every = sync_every
+        self._lock = threading.Lock()
+        self._entries = None
+        self._file = None
+        self._unsynced = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, stage, unit, path, source=None, **extra):
+        """単位の完了を記録する（出力ファイルと、source を指定した場合は入力ファイルのサイズと更新時刻も記録する）"""
+        if source is not None:
+            extra.update(_source_stat(source))
+        st = os.stat(path)
+        entry = {
+            'stage': stage,
+            'unit': unit,
+            'path': path,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'time': datetime.now().isoformat(timespec='seconds'),
+        }
+        entry.update(extra)
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._file is None:
+                os.makedirs(self.journal_dir, exist_ok=True)
+                self._file = open(self.path, 'a', encoding='utf-8')
+                _OPEN_PATHS[self.path] = _OPEN_PATHS.get(self.path, 0) + 1
+                atexit.register(self.close)
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+            if self._entries is not None:
+                self._entries[(stage, unit)] = entry
+
+    def close(self):
+        """未同期の記録を fsync してファイルを閉じる（再び record すると開き直す）"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._unsynced = 0
+            _OPEN_PATHS[self.path] -= 1
+            if not _OPEN_PATHS[self.path]:
+                del _OPEN_PATHS[self.path]
+            atexit.unregister(self.close)
+
+    def entries(self):
+        """ディレクトリ内のすべてのジャーナルの記録を読み込み、(段階, 単位) ごとに最新の記録を返す"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = load_journal(self.journal_dir)
+            return self._entries
+
+    def is_done(self, stage, unit, source=None, **expected):
+        """
+        単位が完了済みかどうかを返す。記録があり、出力ファイルのサイズが記録と一致し、
+        入力ファイル（source）のサイズ・更新時刻と expected に指定した値（処理方法など）が
+        記録と一致する場合に完了とみなす
+        """
+        if source is not None:
+            try:
+                expected.update(_source_stat(source))
+            except OSError:
+                return False
+        entry = self.entries().get((stage, unit))
+        if entry is None:
+            return False
+        if any(entry.get(key) != value for key, value in expected.items()):
+            return False
+        try:
+            return os.path.getsize(entry['path']) == entry['size']
+        except OSError:
+            return False
+
+
+# このプロセスで書き込み中のジャーナルのファイル（パス → 開いている RunJournal の数）
+_OPEN_PATHS = {}
+
+COMPACT_NAME = 'compact.jsonl'
+
+
+def _writer_alive(name):
+    """ジャーナルのファイル名（<ホスト名>-<プロセスID>.jsonl）の書き込み元がまだ動いている可能性があるか"""
+    host, _, pid = name[:-len('.jsonl')].rpartition('-')
+    if host != socket.gethostname() or not pid.isdigit():
+        # 別のホストのプロセスは確認できないため、動いているとみなす
+        return True
+    if int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def compact_journal(journal_dir, verbose=True):
+    """
+    ジャーナルのディレクトリの記録を (段階, 単位) ごとの最新の記録だけにまとめて compact.jsonl に書き込み、
+    まとめたファイルのうち書き込み中でないもの（このホストで終了したプロセスと、このプロセスの閉じたファイル）を削除する
+
+    Returns:
+    --------
+    int
+        削除したファイル数
+    """
+    if not os.path.isdir(journal_dir):
+        return 0
+    names = sorted(name for name in os.listdir(journal_dir) if name.endswith('.jsonl'))
+    entries = load_journal(journal_dir)
+    compact_path = os.path.join(journal_dir, COMPACT_NAME)
+    with atomic_path(compact_path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for key in sorted(entries):
+                f.write(json.dumps(entries[key], ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    removed = 0
+    for name in names:
+        path = os.path.join(journal_dir, name)
+        if name == COMPACT_NAME or path in _OPEN_PATHS or _writer_alive(name):
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if verbose:
+        print(f"ジャーナル {journal_dir}: {len(entries)} 件を {COMPACT_NAME} にまとめ、{removed} ファイルを削除しました")
+    return removed
+
+
+def load_journal(journal_dir):
+    """ジャーナルのディレクトリのすべての記録を読み込む。書きかけの最後の行は無視する"""
+    entries = {}
+    if not os.path.isdir(journal_dir):
+        return entries
+    # まとめたファイルを最初に読み、同じ時刻の記録はプロセスごとのファイルを優先する
+    files = sorted((name for name in os.listdir(journal_dir) if name.endswith('.jsonl')),
+                   key=lambda name: (name != COMPACT_NAME, name))
+    for name in files:
+        with open(os.path.join(journal_dir, name), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                key = (entry['stage'], entry['unit'])
+                previous = entries.get(key)
+                if previous is None or entry['time'] >= previous['time']:
+                    entries[key] = entry
+    return entries
+
+
+def verify_journal(journal_dir, verbose=True):
+    """
+    ジャーナルの記録とディスク上のファイルを照合する
+
+    Returns:
+    --------
+    dict
+        {'ok': 件数, 'missing': [パス], 'size_mismatch': [パス], 'modified': [パス]}
+    """
+    result = {'ok': 0, 'missing': [], 'size_mismatch': [], 'modified': []}
+    for (stage, unit), entry in sorted(load_journal(journal_dir).items()):
+        path = entry['path']
+        try:
+            st = os.stat(path)
+        except OSError:
+            result['missing'].append(path)
+            continue
+        if st.st_size != entry['size']:
+            result['size_mismatch'].append(path)
+        elif st.st_mtime_ns != entry['mtime_ns']:
+            # サイズが同じで更新時刻だけが違う場合（コピーや再処理）は警告のみ
+            result['modified'].append(path)
+            result['ok'] += 1
+        else:
+            result['ok'] += 1
+    if verbose:
+        print(f"ジャーナル {journal_dir}: 一致 {result['ok']} 件, "
+              f"ファイルなし {len(result['missing'])} 件, サイズ不一致 {len(result['size_mismatch'])} 件, "
+              f"更新時刻の変更 {len(result['modified'])} 件")
+        for key in ['missing', 'size_mismatch']:
+            for path in result[key][:20]:
+                print(f"  {key}: {path}")
+    return result
+
+
+def check_csv_complete(path):
+    """CSVファイルが最後まで書き込まれているか（改行で終わり、最後の行の列数がヘッダーと同じか）を調べる"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.readline()
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0 or not header.endswith(b'\n'):
+                return False
+            f.seek(max(0, size - 4096))
+            tail = f.read()
+    except OSError:
+        return False
+    if not tail.endswith(b'\n'):
+        return False
+    last_line = tail.rstrip(b'\n').split(b'\n')[-1]
+    return last_line.count(b',') == header.count(b',')
+
+
+def check_netcdf_complete(path):
+    """netCDFファイルを開いて時刻の次元を読めるかを調べる"""
+    import netCDF4 as nc
+    try:
+        with nc.Dataset(path) as dataset:
+            return len(dataset.variables['time'][:]) > 0
+    except Exception:
+        return False
+
+
+def scan_outputs(output_dir, csv_dirs, journal_entries, repair=False, verbose=True):
+    """
+    ジャーナルに記録されていない netCDF・CSV ファイル（この機能より前に作成されたものなど）の
+    内容を調べ、書きかけのファイルを報告する（repair=True の場合は削除して次回の処理でやり直す）
+
+    Returns:
+    --------
+    list
+        書きかけと判定したファイルのパス
+    """
+    journaled = {entry['path'] for entry in journal_entries.values()}
+    bad = []
+    leftovers = []
+    checked = 0
+    netcdf_dir = os.path.join(output_dir, 'netcdf')
+    candidates = []
+    for base_dir, suffix, check in [(netcdf_dir, '.nc', check_netcdf_complete)] + \
+            [(d, '.csv', check_csv_complete) for d in csv_dirs]:
+        if not os.path.isdir(base_dir):
+            continue
+        for root, _, files in os.walk(base_dir):
+            for name in files:
+                if name.endswith(suffix):
+                    candidates.append((os.path.join(root, name), check))
+                elif name.startswith('.') and name.endswith('.tmp'):
+                    # 強制終了されたプロセスの一時ファイル（正式な名前のファイルには影響しない）
+                    leftovers.append(os.path.join(root, name))
+    for path, check in sorted(candidates):
+        if path in journaled:
+            continue
+        checked += 1
+        if not check(path):
+            bad.append(path)
+            if repair:
+                os.remove(path)
+    if repair:
+        for path in leftovers:
+            os.remove(path)
+    if verbose:
+        print(f"ジャーナルにないファイル {checked} 件を確認: 書きかけ {len(bad)} 件" + (" (削除しました)" if repair and bad else ""))
+        for path in bad[:20]:
+            print(f"  書きかけ: {path}")
+        if leftovers:
+            print(f"残っている一時ファイル: {len(leftovers)} 件" + (" (削除しました)" if repair else ""))
+    return bad
+
+
+def process_verify(config_file, scan=False, repair=False, compact=False):
+    """設定ファイルの出力ディレクトリのジャーナルとファイルを照合する（compact=True の場合は照合後にまとめる）"""
+    from msm.config import load_config
+
+    config = load_config(config_file)
+    output_dir = config['output_directory']
+    csv_dir = os.path.join(output_dir, 'csv')
+    fixed_dir = config.get('input_csv_directory', csv_dir)
+
+    journal_dirs = [journal_directory(config)]
+    if os.path.abspath(fixed_dir) != os.path.abspath(csv_dir):
+        journal_dirs.append(fix_journal_directory(fixed_dir))
+
+    ok = True
+    all_entries = {}
+    for journal_dir in journal_dirs:
+        result = verify_journal(journal_dir)
+        if (result['missing'] or result['size_mismatch']) and not repair:
+            ok = False
+        if repair:
+            # 記録とサイズが違うファイルを削除し、次回の処理でやり直す
+            for path in result['size_mismatch']:
+                os.remove(path)
+        all_entries.update({(journal_dir,) + key: entry for key, entry in load_journal(journal_dir).items()})
+
+    if scan:
+        csv_dirs = [csv_dir] if fixed_dir == csv_dir else [csv_dir, fixed_dir]
+        if scan_outputs(output_dir, csv_dirs, all_entries, repair) and not repair:
+            ok = False
+    if compact:
+        for journal_dir in journal_dirs:
+            compact_journal(journal_dir)
+    return ok
+
@@ -0,0 +1,333 @@
+"""負荷試験ドライバー
+
+``msm loadtest`` で問い合わせサーバー（msm.server）に並列でリクエストを送り、
+レイテンシのパーセンタイルとスループットを表示する。``--url`` を省略すると
+設定ファイルを使ってサーバーを別プロセスで起動してから試験する。
+
+``msm download-loadtest`` はアーカイブの代替サーバー（msm.standin）から並列でダウンロードし、
+files/s・MB/s・再試行の回数を表示する（ネットワークを使わずにダウンローダーの性能を測れる）。
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import random
+import subprocess
+import urllib.request
+import urllib.error
+import concurrent.futures
+from urllib.parse import urlencode
+
+
+def percentile(sorted_values, p):
+    """昇順に並んだ値のpパーセンタイル（最近接順位法）を返す"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(1, int(round(p / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize_latencies(latencies):
+    """レイテンシ（秒）のリストから代表値（ミリ秒）を計算する"""
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50_ms': percentile(values, 50) * 1000,
+        'p90_ms': percentile(values, 90) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': (values[-1] if values else float('nan')) * 1000,
+    }
+
+
+def _fetch(url, timeout):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        body = e.read()
+        status = e.code
+    return status, len(body), time.perf_counter() - start
+
+
+def _get_json(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def generate_queries(base_url, targets, start_year, end_year, count, seed=0, formats=('json',)):
+    """地点・期間・エンドポイントをランダムに組み合わせた問い合わせURLを作成する"""
+    rng = random.Random(seed)
+    urls = []
+    for _ in range(count):
+        target = rng.choice(targets)
+        year = rng.randint(start_year, end_year)
+        endpoint = rng.choice(['series', 'series', 'daily', 'monthly'])
+        if endpoint == 'series':
+            month = rng.randint(1, 12)
+            params = {'target': target, 'start': f'{year}-{month:02d}-01', 'end': f'{year}-{month:02d}-28',
+                      'variables': 'temp,r1h,wind_speed'}
+            if rng.random() < 0.3:
+                params['resample'] = 'D'
+        else:
+            params = {'target': target, 'start': f'{year}-01-01', 'end': f'{year}-12-31'}
+        params['format'] = rng.choice(formats)
+        urls.append(f"{base_url}/{endpoint}?{urlencode(params)}")
+    return urls
+
+
+def run_query_load_test(base_url, targets=None, start_year=None, end_year=None, requests=500,
+                        concurrency=8, seed=0, formats=('json',), timeout=60):
+    """
+    問い合わせサーバーに並列でリクエストを送り、結果を集計する
+
+    Parameters:
+    -----------
+    base_url : str
+        サーバーのURL（例: http://127.0.0.1:8000）
+    targets : list of str, optional
+        問い合わせる地点（Noneの場合は /targets から取得）
+    start_year, end_year : int
+        問い合わせる年の範囲
+    requests : int, default=500
+        送信するリクエスト数
+    concurrency : int, default=8
+        同時に送信するリクエスト数
+
+    Returns:
+    --------
+    dict
+        レイテンシのパーセンタイル（ミリ秒）、スループット、エラー数など
+    """
+    base_url = base_url.rstrip('/')
+    if targets is None:
+        targets = _get_json(f"{base_url}/targets")['targets']
+    if not targets:
+        raise ValueError("問い合わせる地点がありません")
+
+    urls = generate_queries(base_url, targets, start_year, end_year, requests, seed, formats)
+    latencies = []
+    errors = 0
+    total_bytes = 0
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in concurrent.futures.as_completed([executor.submit(_fetch, url, timeout) for url in urls]):
+            try:
+                status, size, elapsed = future.result()
+            except Exception:
+                errors += 1
+                continue
+            if status != 200:
+                errors += 1
+            latencies.append(elapsed)
+            total_bytes += size
+    wall_time = time.perf_counter() - start
+
+    result = summarize_latencies(latencies)
+    result.update({
+        'errors': errors,
+        'wall_time_s': wall_time,
+        'requests_per_s': len(urls) / wall_time if wall_time > 0 else float('nan'),
+        'mb_per_s': total_bytes / 1024 ** 2 / wall_time if wall_time > 0 else float('nan'),
+        'concurrency': concurrency,
+    })
+    try:
+        result['cache'] = _get_json(f"{base_url}/stats")
+    except Exception:
+        pass
+    return result
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def launch_server(config_file, startup_timeout=30):
+    """問い合わせサーバーを別プロセスで起動し、(process, base_url) を返す"""
+    port = _free_port()
+    process = subprocess.Popen([sys.executable, '-m', 'msm', 'serve', config_file, '--port', str(port)],
+                               stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + startup_timeout
+    while time.time() < deadline:
+        try:
+            _get_json(f"{base_url}/stats", timeout=1)
+            return process, base_url
+        except Exception:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("問い合わせサーバーの起動に失敗しました")
+
+
+def print_report(title, result):
+    """負荷試験の結果を表示する"""
+    print(f"\n{title}:")
+    for key, value in result.items():
+        if isinstance(value, float):
+            print(f"- {key}: {value:.2f}")
+        else:
+            print(f"- {key}: {value}")
+
+
+def run_query_load_test_command(config_file=None, url=None, targets=None, start_year=None, end_year=None,
+                                requests=500, concurrency=8, seed=0, arrow=False):
+    """``msm loadtest`` の処理本体。同じ問い合わせを2回送り、それぞれの結果を表示する"""
+    process = None
+    if url is None:
+        if config_file is None:
+            print("エラー: --url または設定ファイルを指定してください")
+            return False
+        process, url = launch_server(config_file)
+        print(f"問い合わせサーバーを起動しました: {url}")
+    if start_year is None or end_year is None:
+        if config_file is None:
+            print("エラー: --url を指定する場合は --start-year と --end-year も指定してください")
+            return False
+        from msm.config import load_config
+        config = load_config(config_file)
+        start_year = start_year or int(config['download_start_date'][:4])
+        end_year = end_year or int(config['download_end_date'][:4])
+
+    formats = ('json', 'arrow') if arrow else ('json',)
+    try:
+        for label in ['1回目', '2回目（同じ問い合わせ）']:
+            result = run_query_load_test(url, targets, start_year, end_year, requests, concurrency, seed, formats)
+            print_report(f"負荷試験結果 {label}", result)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return True
+
+
+def run_download_load_test(base_url, start_date, end_date, save_dir, workers=4, retries=3, retry_delay=0.1,
+                           reference_dir=None):
+    """
+    アーカイブ（または代替サーバー）から期間のファイルを並列でダウンロードし、結果を集計する
+
+    download_msm_data をそのまま使うため、ダウンローダーの並列数・再試行・続きからの受信を
+    含めた性能を測れる。
+
+    Parameters:
+    -----------
+    base_url : str
+        アーカイブのURL（.../MSM-S）
+    start_date, end_date : str
+        ダウンロードする期間（YYYY-MM-DD）
+    save_dir : str
+        保存先のディレクトリ（既存のファイルもダウンロードし直す）
+    workers : int, default=4
+        同時にダウンロードするファイル数
+    retries : int, default=3
+        ファイルごとの再試行の上限
+    retry_delay : float, default=0.1
+        1回目の再試行までの待ち時間（秒）
+    reference_dir : str, optional
+        元のファイルのディレクトリ。指定した場合はダウンロードしたファイルと比較する
+
+    Returns:
+    --------
+    dict
+        ファイル数、files/s、MB/s、再試行の回数、失敗数など
+    """
+    import io
+    import filecmp
+    import contextlib
+    from datetime import datetime, timedelta
+    from msm.download import download_msm_data
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = download_msm_data(start_date, end_date, save_dir, skip_existing=False, base_url=base_url,
+                                    workers=workers, quiet=True, retries=retries, retry_delay=retry_delay)
+    wall_time = time.perf_counter() - start
+
+    result = {
+        'files': summary['downloaded'],
+        'failed': summary['failed'],
+        'retries': summary['retries'],
+        'wall_time_s': wall_time,
+        'files_per_s': summary['downloaded'] / wall_time if wall_time > 0 else float('nan'),
+        'mb_per_s': summary['bytes'] / 1024 ** 2 / wall_time if wall_time > 0 else float('nan'),
+        'mb': summary['bytes'] / 1024 ** 2,
+        'workers': workers,
+    }
+    if reference_dir is not None:
+        mismatched = 0
+        day = datetime.strptime(start_date, '%Y-%m-%d')
+        while day <= datetime.strptime(end_date, '%Y-%m-%d'):
+            relative = os.path.join(day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+            downloaded = os.path.join(save_dir, relative)
+            if os.path.exists(downloaded) and not filecmp.cmp(downloaded, os.path.join(reference_dir, relative),
+                                                              shallow=False):
+                mismatched += 1
+            day += timedelta(days=1)
+        result['mismatched'] = mismatched
+    return result
+
+
+def run_download_load_test_command(config_file=None, url=None, start_date=None, end_date=None, workers=4,
+                                   retries=3, retry_delay=0.1, root=None, output=None, **fault_options):
+    """
+    ``msm download-loadtest`` の処理本体
+
+    url を省略すると代替サーバー（msm.standin）を別スレッドで起動し、fault_options
+    （latency、bandwidth、drop_rate、error_rate、ranges、grid、seed）の障害を注入して試験する。
+    ファイルは試験の前に生成しておき、ダウンロードしたファイルは元のファイルと比較する。
+    """
+    import shutil
+    import tempfile
+    from datetime import datetime, timedelta
+
+    if config_file is not None:
+        from msm.config import load_config
+        from msm.download import archive_base_url
+        config = load_config(config_file)
+        start_date = start_date or config['download_start_date']
+        end_date = end_date or config['download_end_date']
+        if url is None and 'archive_base_url' in config:
+            url = archive_base_url(config)
+    if start_date is None or end_date is None:
+        print("エラー: 設定ファイルまたは --start と --end を指定してください")
+        return False
+
+    server = None
+    work_dir = tempfile.mkdtemp(prefix='msm-download-loadtest-')
+    try:
+        reference_dir = None
+        if url is None:
+            from msm.standin import start_background_standin, standin_base_url
+            reference_dir = root or os.path.join(work_dir, 'archive')
+            server, _ = start_background_standin(reference_dir, **fault_options)
+            url = standin_base_url(server)
+            day = datetime.strptime(start_date, '%Y-%m-%d').date()
+            days = []
+            while day <= datetime.strptime(end_date, '%Y-%m-%d').date():
+                days.append(day)
+                day += timedelta(days=1)
+            print(f"代替サーバーを起動しました: {url}（{len(days)} ファイルを準備中）")
+            server.standin.prepare(days)
+        save_dir = output or os.path.join(work_dir, 'netcdf')
+        result = run_download_load_test(url, start_date, end_date, save_dir, workers, retries, retry_delay,
+                                        reference_dir)
+        if server is not None:
+            result['server'] = dict(server.standin.stats)
+        print_report(f"ダウンロードの負荷試験結果 ({url})", result)
+        return result['failed'] == 0 and result.get('mismatched', 0) == 0
+    except Exception as e:
+        print(f"エラー: ダウンロードの負荷試験中に問題が発生しました: {e}")
+        return False
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,384 @@
+"""MSMのグリッドの地図の描画（投影済みメッシュと背景のキャッシュ、並列描画）
+
+地図を1枚描くたびに変数全体を読み込み、全グリッドのメッシュを投影し直し、海岸線を
+描き直すと、1か月分の毎時の地図（約720枚）に何時間もかかる。このモジュールは
+
+- 投影したセルの境界のメッシュと、海岸線・国境を描いた背景の画像（RGBA）を
+  (グリッド, 投影法, 範囲, 画像の大きさ) ごとに ``output/maps/cache/`` にキャッシュする
+- netCDFファイルからは範囲に含まれる部分だけを読み込む
+- 1日分（24時刻）をまとめて1プロセスで描き、日ごとに複数プロセスで並列に描く
+
+ことで、1枚あたりの処理を「メッシュの値の入れ替えとPNGの保存」だけにする。
+cartopy はキャッシュの作成時にだけ使い、各フレームは投影座標の通常の matplotlib の
+Axes に描く。matplotlib と cartopy が必要。
+
+設定ファイルの ``map`` で投影法・範囲・画像の大きさを指定する::
+
+    "map": {
+        "projection": "lambert",
+        "region": {"lat_min": 41.0, "lat_max": 46.0, "lon_min": 139.0, "lon_max": 146.0},
+        "width": 800,
+        "coastline_resolution": "10m"
+    }
+"""
+
+import os
+import json
+import hashlib
+import collections
+import concurrent.futures
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from msm.fields import read_field
+from msm.journal import atomic_path
+
+# 変数ごとの描画の設定（カラーマップ, 最小値, 最大値, 単位）
+VARIABLE_STYLES = {
+    'temp': ('RdYlBu_r', -20.0, 35.0, '°C'),
+    'r1h': ('Blues', 0.0, 30.0, 'mm/h'),
+    'wind_speed': ('viridis', 0.0, 25.0, 'm/s'),
+    'rh': ('BrBG', 0.0, 100.0, '%'),
+    'psea': ('coolwarm', 98000.0, 104000.0, 'Pa'),
+    'sp': ('coolwarm', 80000.0, 104000.0, 'Pa'),
+    'ncld': ('Greys', 0.0, 100.0, '%'),
+    'dswrf': ('inferno', 0.0, 1000.0, 'W/m2'),
+}
+
+# 投影法（気象庁の図と同じランベルト正角円錐図法を含む）
+PROJECTIONS = ['lambert', 'platecarree', 'mercator']
+
+DEFAULT_MAP = {
+    'projection': 'lambert',
+    'region': None,
+    'width': 800,
+    'dpi': 100,
+    'coastline_resolution': '10m',
+}
+
+
+def map_settings(config, **overrides):
+    """設定ファイルの map に既定値と引数の指定を補って返す"""
+    settings = dict(DEFAULT_MAP)
+    settings.update(config.get('map', {}))
+    settings.update({key: value for key, value in overrides.items() if value is not None})
+    if settings['projection'] not in PROJECTIONS:
+        raise ValueError(f"projection は {PROJECTIONS} のいずれかを指定してください: {settings['projection']}")
+    return settings
+
+
+def crop_slices(lats, lons, region=None):
+    """領域（lat_min, lat_max, lon_min, lon_max。cube_region と同じ形式）に含まれるグリッドの範囲をスライスで返す"""
+    if not region:
+        return slice(0, len(lats)), slice(0, len(lons))
+    lat_idx = np.where((lats >= region['lat_min']) & (lats <= region['lat_max']))[0]
+    lon_idx = np.where((lons >= region['lon_min']) & (lons <= region['lon_max']))[0]
+    if len(lat_idx) == 0 or len(lon_idx) == 0:
+        raise ValueError(f"指定された領域にグリッドが含まれていません: {region}")
+    return slice(lat_idx.min(), lat_idx.max() + 1), slice(lon_idx.min(), lon_idx.max() + 1)
+
+
+def _cell_edges(centers):
+    """等間隔の格子点の中心からセルの境界を求める（両端は外挿）"""
+    centers = np.asarray(centers, dtype=np.float64)
+    middle = (centers[:-1] + centers[1:]) / 2
+    return np.concatenate([[2 * centers[0] - middle[0]], middle, [2 * centers[-1] - middle[-1]]])
+
+
+def _projection(name):
+    import cartopy.crs as ccrs
+
+    if name == 'lambert':
+        return ccrs.LambertConformal(central_longitude=140.0, central_latitude=30.0,
+                                     standard_parallels=(30.0, 60.0))
+    if name == 'mercator':
+        return ccrs.Mercator(central_longitude=140.0)
+    return ccrs.PlateCarree(central_longitude=0.0)
+
+
+def _project(crs, lon2d, lat2d):
+    """緯度・経度のメッシュを投影座標に変換する"""
+    import cartopy.crs as ccrs
+
+    points = crs.transform_points(ccrs.PlateCarree(), lon2d, lat2d)
+    return points[..., 0], points[..., 1]
+
+
+def _render_background(crs, extent, width, height, dpi, resolution):
+    """海岸線・国境だけを透明な背景に描いた画像（RGBA）を返す"""
+    import cartopy.feature as cfeature
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    fig.patch.set_alpha(0.0)
+    ax = fig.add_axes([0, 0, 1, 1], projection=crs)
+    ax.set_extent(extent, crs=crs)
+    ax.set_axis_off()
+    ax.patch.set_alpha(0.0)
+    ax.add_feature(cfeature.COASTLINE.with_scale(resolution), linewidth=0.6, edgecolor='black')
+    ax.add_feature(cfeature.BORDERS.with_scale(resolution), linewidth=0.4, edgecolor='dimgray')
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def grid_signature(lats, lons):
+    """グリッドの緯度・経度から求めた識別子"""
+    digest = hashlib.sha1()
+    for values in (lats, lons):
+        digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def prepare_map(nc_file, settings, cache_dir):
+    """
+    地図の投影済みメッシュと背景を作成する（キャッシュがあればそれを読み込む）
+
+    Parameters:
+    -----------
+    nc_file : str
+        グリッドを調べるnetCDFファイル
+    settings : dict
+        map_settings の戻り値
+    cache_dir : str
+        キャッシュのディレクトリ
+
+    Returns:
+    --------
+    str
+        キャッシュファイルのパス（load_prepared で読み込む）
+    """
+    import netCDF4 as nc
+
+    with nc.Dataset(nc_file) as dataset:
+        lats = np.asarray(dataset.variables['lat'][:])
+        lons = np.asarray(dataset.variables['lon'][:])
+
+    key = {
+        'grid': grid_signature(lats, lons),
+        'projection': settings['projection'],
+        'region': settings['region'],
+        'width': settings['width'],
+        'dpi': settings['dpi'],
+        'coastline_resolution': settings['coastline_resolution'],
+    }
+    name = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    cache_file = os.path.join(cache_dir, f"{name}.npz")
+    if os.path.exists(cache_file):
+        return cache_file
+
+    lat_slice, lon_slice = crop_slices(lats, lons, settings['region'])
+    lon2d, lat2d = np.meshgrid(_cell_edges(lons[lon_slice]), _cell_edges(lats[lat_slice]))
+    crs = _projection(settings['projection'])
+    x_edges, y_edges = _project(crs, lon2d, lat2d)
+    extent = [float(np.nanmin(x_edges)), float(np.nanmax(x_edges)),
+              float(np.nanmin(y_edges)), float(np.nanmax(y_edges))]
+    width = int(settings['width'])
+    height = int(round(width * (extent[3] - extent[2]) / (extent[1] - extent[0])))
+    background = _render_background(crs, extent, width, height, settings['dpi'],
+                                    settings['coastline_resolution'])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with atomic_path(cache_file) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f, key=np.array(json.dumps(key, sort_keys=True)),
+                lat_slice=np.array([lat_slice.start, lat_slice.stop]),
+                lon_slice=np.array([lon_slice.start, lon_slice.stop]),
+                x_edges=x_edges, y_edges=y_edges, extent=np.array(extent),
+                size=np.array([width, height, settings['dpi']]), background=background)
+    print(f"地図のメッシュと背景をキャッシュしました: {cache_file} ({width}x{height})")
+    return cache_file
+
+
+_prepared = {}
+
+
+def load_prepared(cache_file):
+    """キャッシュファイルを読み込む（プロセスごとに1回だけ）"""
+    if cache_file not in _prepared:
+        with np.load(cache_file, allow_pickle=False) as npz:
+            _prepared[cache_file] = {key: npz[key] for key in npz.files}
+    return _prepared[cache_file]
+
+
+def read_frames(dataset, variable, lat_slice, lon_slice):
+    """
+    変数の範囲部分を全時刻まとめて読み込む（時間, 緯度, 経度）
+
+    temp は摂氏に変換し、wind_speed は u, v から求める。r1h の特殊値（200）は欠損にする。
+    """
+    return read_field(dataset, variable, (lat_slice, lon_slice), np.float32)
+
+
+class FrameRenderer:
+    """
+    キャッシュしたメッシュと背景を使って地図をPNGに保存する
+
+    図・メッシュ・背景・カラーバーは最初に1回だけ作成し、フレームごとには
+    メッシュの値と表題だけを入れ替えて保存する。
+
+    Parameters:
+    -----------
+    prepared : dict
+        load_prepared の戻り値
+    style : tuple
+        (カラーマップ, 最小値, 最大値, 単位)
+    """
+
+    def __init__(self, prepared, style):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        cmap, vmin, vmax, unit = style
+        width, height, dpi = (int(v) for v in prepared['size'])
+        x0, x1, y0, y1 = prepared['extent']
+        x_edges, y_edges = prepared['x_edges'], prepared['y_edges']
+
+        self.fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        ax = self.fig.add_axes([0, 0, 1, 1])
+        ax.set_axis_off()
+        empty = np.ma.masked_all((x_edges.shape[0] - 1, x_edges.shape[1] - 1))
+        self.mesh = ax.pcolormesh(x_edges, y_edges, empty, cmap=cmap, vmin=vmin, vmax=vmax, shading='flat')
+        ax.imshow(prepared['background'], extent=(x0, x1, y0, y1), origin='upper',
+                  interpolation='nearest', zorder=3)
+        ax.set_xlim(x0, x1)
+        ax.set_ylim(y0, y1)
+        cax = self.fig.add_axes([0.92, 0.05, 0.02, 0.35])
+        self.fig.colorbar(self.mesh, cax=cax).set_label(unit)
+        self.title = self.fig.text(0.01, 0.99, '', ha='left', va='top', fontsize=10,
+                                   bbox={'facecolor': 'white', 'alpha': 0.7, 'edgecolor': 'none'})
+
+    def render(self, values, output_file, title):
+        """範囲部分の値（緯度, 経度）の地図を output_file に保存する"""
+        self.mesh.set_array(np.ma.masked_invalid(values).ravel())
+        self.title.set_text(title)
+        with atomic_path(output_file) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                self.canvas.print_png(f)
+
+
+_renderers = {}
+
+
+def _renderer(cache_file, style):
+    """キャッシュファイル・描画の設定ごとの FrameRenderer（プロセスごとに1回だけ作成する）"""
+    key = (cache_file, style)
+    if key not in _renderers:
+        _renderers[key] = FrameRenderer(load_prepared(cache_file), style)
+    return _renderers[key]
+
+
+def frame_file(frames_dir, variable, time_value):
+    """フレームのPNGファイルのパス（<変数名>/YYYY/YYYYMMDDHH.png）"""
+    return os.path.join(frames_dir, variable, time_value.strftime('%Y'), f"{time_value.strftime('%Y%m%d%H')}.png")
+
+
+def render_day(nc_file, variable, cache_file, frames_dir, style, overwrite=False):
+    """
+    1日分のnetCDFファイルの全時刻の地図を描く（変数の範囲部分は1回だけ読み込む）
+
+    Returns:
+    --------
+    int
+        描いたフレームの数
+    """
+    import netCDF4 as nc
+
+    prepared = load_prepared(cache_file)
+    renderer = _renderer(cache_file, style)
+    lat_slice = slice(*(int(v) for v in prepared['lat_slice']))
+    lon_slice = slice(*(int(v) for v in prepared['lon_slice']))
+    with nc.Dataset(nc_file) as dataset:
+        time_values = nc.num2date(dataset.variables['time'][:], units=dataset.variables['time'].units)
+        outputs = [frame_file(frames_dir, variable, t) for t in time_values]
+        if not overwrite and all(os.path.exists(path) for path in outputs):
+            return 0
+        frames = read_frames(dataset, variable, lat_slice, lon_slice)
+
+    count = 0
+    for t, values, path in zip(time_values, frames, outputs):
+        if not overwrite and os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        renderer.render(values, path, f"{variable}  {t.strftime('%Y-%m-%d %H:%M')} UTC")
+        count += 1
+    return count
+
+
+def render_maps(config_file, variable, start_date, end_date, projection=None, max_workers=None, overwrite=False):
+    """
+    設定ファイルに基づいて、期間内の毎時の地図をPNGに描く
+
+    投影済みメッシュと背景を最初に1回だけ用意し、日ごとに複数プロセスで並列に描く。
+    出力は ``output/maps/<変数名>/YYYY/YYYYMMDDHH.png``。既存のフレームはスキップする。
+
+    Parameters:
+    -----------
+    config_file : str
+        設定ファイルのパス
+    variable : str
+        変数名（VARIABLE_STYLES のキー）
+    start_date, end_date : str
+        期間（YYYY-MM-DD）
+    projection : str, optional
+        投影法（設定ファイルの map.projection より優先）
+    max_workers : int, optional
+        プロセス数（Noneの場合はCPU数）
+    overwrite : bool, default=False
+        既存のフレームも描き直す
+    """
+    import time
+    from msm.config import load_config
+
+    try:
+        config = load_config(config_file)
+        if variable not in VARIABLE_STYLES:
+            print(f"エラー: 変数 '{variable}' は描画できません（{list(VARIABLE_STYLES)}）")
+            return False
+        settings = map_settings(config, projection=projection)
+        style = tuple(settings.get('styles', {}).get(variable, VARIABLE_STYLES[variable]))
+        output_dir = config['output_directory']
+        save_dir = os.path.join(output_dir, 'netcdf')
+        maps_dir = config.get('maps_directory', os.path.join(output_dir, 'maps'))
+
+        nc_files = []
+        day = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        while day <= end:
+            path = os.path.join(save_dir, day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+            if os.path.exists(path):
+                nc_files.append(path)
+            day += timedelta(days=1)
+        if not nc_files:
+            print(f"エラー: 期間 {start_date} から {end_date} のnetCDFファイルが見つかりません")
+            return False
+
+        t0 = time.perf_counter()
+        cache_file = prepare_map(nc_files[0], settings, os.path.join(maps_dir, 'cache'))
+
+        frame_count = 0
+        failed_count = 0
+        max_workers = max_workers or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = collections.OrderedDict(
+                (executor.submit(render_day, path, variable, cache_file, maps_dir, style, overwrite), path)
+                for path in nc_files)
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    frame_count += future.result()
+                except Exception as e:
+                    print(f"エラー: {futures[future]} の描画中に問題が発生しました: {e}")
+                    failed_count += 1
+
+        elapsed = time.perf_counter() - t0
+        print(f"\n地図の描画完了: {frame_count} 枚 ({len(nc_files)} 日, {elapsed:.1f} 秒, {max_workers} プロセス)")
+        if failed_count > 0:
+            print(f"- 処理失敗: {failed_count} 日")
+        return failed_count == 0
+    except Exception as e:
+        print(f"エラー: 地図の描画中に問題が発生しました: {e}")
+        return False
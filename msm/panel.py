@@ -0,0 +1,246 @@
+"""全地点・全変数の時刻をそろえた3次元配列（パネル）
+
+地点間の比較（旭川と雪壁の気温減率、中間地点に沿った勾配など）のたびに
+地点ごとのCSVを読み込んで時刻で結合する代わりに、(時刻, 地点, 変数) の
+float32 の配列を年ごとのファイル ``output/panel/YYYY.npy`` に保持する。
+同じ形の ``YYYY.valid.npy`` は値があるかどうか（書き込み済みで欠損でない）を示す。
+どちらも ``numpy.load(mmap_mode='r')`` でメモリマップとして開けるため、地点間の比較は
+NumPyのスライスと演算だけで行える::
+
+    from msm.panel import Panel
+    panel = Panel('./output')
+    times, values, valid = panel.read('2024-12-01', '2025-03-31', ['asahikawa', 'yukikabe'], ['temp'])
+    lapse = values[:, 1, 0] - values[:, 0, 0]
+
+地点・変数の並びは ``output/panel/panel.json`` に保存し、1日分（24時刻 × 全地点 × 全変数）は
+ファイルの連続した1つの範囲に書き込む。r1h の特殊値（200）は欠損として扱う。
+"""
+
+import os
+import json
+
+import numpy as np
+
+from msm.fields import r1h_sentinel_mask
+from msm.journal import atomic_path
+
+# パネルに保存する変数（extract のCSVの列と同じ）
+PANEL_VARIABLES = ['psea', 'sp', 'u', 'v', 'temp', 'rh', 'r1h', 'ncld', 'dswrf', 'wind_direction', 'wind_speed']
+
+
+def panel_directory(config):
+    """設定ファイルからパネルのディレクトリを返す（省略時は output_directory/panel）"""
+    return config.get('panel_directory', os.path.join(config['output_directory'], 'panel'))
+
+
+def panel_layout(config):
+    """設定ファイルの地点と変数（PANEL_VARIABLES と派生量）の並びを返す"""
+    variables = list(PANEL_VARIABLES) + [name for name in config.get('derived_variables', [])
+                                         if name not in PANEL_VARIABLES]
+    return list(config['targets'].keys()), variables
+
+
+def _year_hours(year):
+    return (np.datetime64(f"{year + 1}-01-01T00", 'h') - np.datetime64(f"{year}-01-01T00", 'h')).astype(np.int64)
+
+
+class Panel:
+    """
+    年ごとのパネルファイルの読み書き
+
+    Parameters:
+    -----------
+    panel_dir : str
+        パネルのディレクトリ（output_directory を指定した場合はその下の panel）
+    targets, variables : list of str, optional
+        書き込み時の地点・変数の並び。既存のパネルと異なる場合は ValueError
+    """
+
+    def __init__(self, panel_dir, targets=None, variables=None):
+        if not os.path.exists(os.path.join(panel_dir, 'panel.json')) and \
+                os.path.exists(os.path.join(panel_dir, 'panel', 'panel.json')):
+            panel_dir = os.path.join(panel_dir, 'panel')
+        self.panel_dir = panel_dir
+        self.meta_file = os.path.join(panel_dir, 'panel.json')
+        self._arrays = {}
+        if os.path.exists(self.meta_file):
+            with open(self.meta_file, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if targets is not None and (meta['targets'] != list(targets) or meta['variables'] != list(variables)):
+                raise ValueError(f"パネルの地点・変数の並びが設定と異なります。{panel_dir} を削除して "
+                                 f"msm panel で作り直してください")
+            self.targets, self.variables = meta['targets'], meta['variables']
+        elif targets is not None:
+            self.targets, self.variables = list(targets), list(variables)
+            os.makedirs(panel_dir, exist_ok=True)
+            with atomic_path(self.meta_file) as tmp_path:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'targets': self.targets, 'variables': self.variables}, f, ensure_ascii=False, indent=2)
+        else:
+            raise FileNotFoundError(f"パネルが見つかりません: {self.meta_file}")
+        self.target_index = {name: i for i, name in enumerate(self.targets)}
+        self.variable_index = {name: i for i, name in enumerate(self.variables)}
+
+    def _paths(self, year):
+        return (os.path.join(self.panel_dir, f"{year}.npy"),
+                os.path.join(self.panel_dir, f"{year}.valid.npy"))
+
+    def _create_year(self, year):
+        """年のファイルを作成する（値はNaN、valid はFalse）。同時に作成された場合は先に作成されたものを使う"""
+        shape = (int(_year_hours(year)), len(self.targets), len(self.variables))
+        for path, dtype, fill in zip(self._paths(year), (np.float32, np.bool_), (np.nan, False)):
+            if os.path.exists(path):
+                continue
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=shape)
+            array[:] = fill
+            array.flush()
+            del array
+            try:
+                # 既存のファイルを置き換えないよう、リンクで排他的に作成する
+                os.link(tmp_path, path)
+            except FileExistsError:
+                pass
+            finally:
+                os.remove(tmp_path)
+
+    def open_year(self, year, mode='r'):
+        """年の値と valid のメモリマップを返す（mode='r+' で書き込み、ファイルがなければ作成する）"""
+        key = (int(year), mode)
+        if key not in self._arrays:
+            values_path, valid_path = self._paths(year)
+            if not os.path.exists(values_path) or not os.path.exists(valid_path):
+                if mode == 'r':
+                    return None, None
+                self._create_year(int(year))
+            self._arrays[key] = (np.load(values_path, mmap_mode=mode), np.load(valid_path, mmap_mode=mode))
+        return self._arrays[key]
+
+    def write(self, times, target_names, frames):
+        """
+        地点ごとの同じ時刻のデータ（DataFrame）をパネルに書き込む
+
+        全地点を並び順どおりに書き込む場合、1日分は各ファイルの連続した1つの範囲になる。
+
+        Parameters:
+        -----------
+        times : array-like
+            時刻（frames の行と同じ順）
+        target_names : list of str
+            地点名（frames と同じ順）
+        frames : list of pandas.DataFrame
+            地点ごとのデータ（パネルの変数の列を含む。ない列は欠損）
+        """
+        hours = np.asarray(times, dtype='datetime64[h]')
+        block = np.full((len(hours), len(target_names), len(self.variables)), np.nan, dtype=np.float32)
+        for j, df in enumerate(frames):
+            for k, var in enumerate(self.variables):
+                if var in df.columns:
+                    block[:, j, k] = np.asarray(df[var], dtype=np.float64)
+        r1h = self.variable_index.get('r1h')
+        if r1h is not None:
+            sentinel = r1h_sentinel_mask(block[:, :, r1h])
+            block[:, :, r1h][sentinel] = np.nan
+        valid = ~np.isnan(block)
+
+        columns = [self.target_index[name] for name in target_names]
+        contiguous = columns == list(range(len(self.targets)))
+        years = hours.astype('datetime64[Y]').astype(np.int64) + 1970
+        for year in np.unique(years):
+            rows = np.where(years == year)[0]
+            offsets = (hours[rows] - np.datetime64(f"{year}-01-01T00", 'h')).astype(np.int64)
+            values_map, valid_map = self.open_year(int(year), 'r+')
+            if contiguous and np.array_equal(offsets, np.arange(offsets[0], offsets[0] + len(offsets))):
+                values_map[offsets[0]:offsets[-1] + 1] = block[rows]
+                valid_map[offsets[0]:offsets[-1] + 1] = valid[rows]
+            else:
+                index = np.ix_(offsets, columns)
+                values_map[index] = block[rows]
+                valid_map[index] = valid[rows]
+            values_map.flush()
+            valid_map.flush()
+
+    def read(self, start, end, targets=None, variables=None):
+        """
+        期間のパネルを読み込む（両端を含む。日付のみの場合 end はその日の23時まで）
+
+        Returns:
+        --------
+        tuple
+            (時刻の numpy.ndarray（datetime64[h]）, 値 (時刻, 地点, 変数), valid (時刻, 地点, 変数))。
+            ファイルのない年の部分は値がNaN、valid がFalse
+        """
+        start_h = np.datetime64(start, 'h')
+        end_h = np.datetime64(end, 'h') + (np.timedelta64(23, 'h') if len(str(end)) == 10 else np.timedelta64(0, 'h'))
+        t_idx = [self.target_index[name] for name in (targets or self.targets)]
+        v_idx = [self.variable_index[name] for name in (variables or self.variables)]
+        times = np.arange(start_h, end_h + 1)
+        values = np.full((len(times), len(t_idx), len(v_idx)), np.nan, dtype=np.float32)
+        valid = np.zeros(values.shape, dtype=bool)
+        years = times.astype('datetime64[Y]').astype(np.int64) + 1970
+        for year in np.unique(years):
+            rows = np.where(years == year)[0]
+            values_map, valid_map = self.open_year(int(year))
+            if values_map is None:
+                continue
+            offsets = (times[rows] - np.datetime64(f"{year}-01-01T00", 'h')).astype(np.int64)
+            sl = slice(offsets[0], offsets[-1] + 1)
+            values[rows] = values_map[sl][:, t_idx][:, :, v_idx]
+            valid[rows] = valid_map[sl][:, t_idx][:, :, v_idx]
+        return times, values, valid
+
+    def close(self):
+        """開いているメモリマップを閉じる"""
+        for values_map, valid_map in self._arrays.values():
+            if hasattr(values_map, 'flush') and values_map.flags.writeable:
+                values_map.flush()
+                valid_map.flush()
+        self._arrays.clear()
+
+
+def open_panel_writer(config):
+    """設定ファイルの panel が有効な場合に書き込み用の Panel を返す（無効な場合はNone）"""
+    if not config.get('panel'):
+        return None
+    targets, variables = panel_layout(config)
+    return Panel(panel_directory(config), targets, variables)
+
+
+def build_panel(config_file, start_date=None, end_date=None):
+    """
+    抽出済みの地点のCSV（input_csv_directory、未指定なら output/csv）からパネルを作成・更新する
+
+    日ごとに全地点のCSVを読み込み、1日分をまとめて書き込む。
+    """
+    import pandas as pd
+    from msm.config import load_config
+
+    try:
+        config = load_config(config_file)
+        targets, variables = panel_layout(config)
+        panel = Panel(panel_directory(config), targets, variables)
+        csv_dir = config.get('input_csv_directory', os.path.join(config['output_directory'], 'csv'))
+        days = pd.date_range(start_date or config['download_start_date'], end_date or config['download_end_date'])
+        written = 0
+        for day in days:
+            year_str, date_str = day.strftime('%Y'), day.strftime('%Y%m%d')
+            present = [(name, os.path.join(csv_dir, name, year_str, f"{date_str}.csv")) for name in targets]
+            present = [(name, path) for name, path in present if os.path.exists(path)]
+            if not present:
+                continue
+            frames = [pd.read_csv(path) for _, path in present]
+            times = [pd.to_datetime(df['time']).to_numpy() for df in frames]
+            if all(np.array_equal(t, times[0]) for t in times):
+                panel.write(times[0], [name for name, _ in present], frames)
+            else:
+                for (name, _), t, df in zip(present, times, frames):
+                    panel.write(t, [name], [df])
+            written += 1
+            if written % 365 == 0:
+                print(f"進捗: {written} 日")
+        panel.close()
+        print(f"パネルを更新しました: {panel.panel_dir} ({written} 日, {len(targets)} 地点 × {len(variables)} 変数)")
+        return True
+    except Exception as e:
+        print(f"エラー: パネルの作成中に問題が発生しました: {e}")
+        return False
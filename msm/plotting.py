@@ -0,0 +1,457 @@
+"""長期間の時別データの高速な描画（間引きと多重解像度ピラミッド）
+
+18年分の時別データ（1系列あたり約16万点）をそのまま matplotlib に渡すと描画が遅く、
+拡大・縮小の操作もできない。このモジュールは画面の1ピクセルに入る区間ごとの
+最小値・最大値だけを残す（見た目が変わらない間引き）ことで、描画する点を
+画面の幅の数倍に抑える。
+
+地点・変数ごとに、区間の長さを4倍ずつ長くした最小値・最大値のピラミッドを
+``output/pyramid/<地点名>/<変数名>.npz`` に作成しておき、表示範囲が変わるたびに
+その範囲だけを適切な段から取り出して描き直す::
+
+    from msm.plotting import plot_series
+    fig, ax = plot_series('config.json', ['asahikawa', 'yukikabe'], 'temp')
+
+間引きの方法としては LTTB（Largest-Triangle-Three-Buckets）も選べる（``method='lttb'``）。
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from msm.journal import atomic_path
+
+# ピラミッドの段ごとの区間の長さの倍率
+PYRAMID_FACTOR = 4
+
+# ピラミッドの最も粗い段の区間の数の目安
+MIN_TOP_BUCKETS = 256
+
+# 1ピクセルあたりの区間の数（最小値・最大値の2点ずつ描く）
+BUCKETS_PER_PIXEL = 1.0
+
+HOUR = np.timedelta64(1, 'h')
+
+
+def minmax_downsample(x, y, n_buckets):
+    """
+    等しい点数の区間ごとに最小値と最大値の点だけを残す（時刻の順に並べる）
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        時刻などの横軸の値（昇順）
+    y : numpy.ndarray
+        値（NaNは無視する）
+    n_buckets : int
+        区間の数（出力はおよそ 2 * n_buckets 点）
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (x, y)
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return x, y
+    size = int(np.ceil(n / n_buckets))
+    padded = np.full(size * int(np.ceil(n / size)), np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(-1, size)
+    valid = ~np.isnan(blocks).all(axis=1)
+    filled_min = np.where(np.isnan(blocks), np.inf, blocks)
+    filled_max = np.where(np.isnan(blocks), -np.inf, blocks)
+    base = np.arange(blocks.shape[0]) * size
+    i_min = base + filled_min.argmin(axis=1)
+    i_max = base + filled_max.argmax(axis=1)
+    idx = np.sort(np.stack([i_min[valid], i_max[valid]], axis=1), axis=1).ravel()
+    return x[idx], y[idx]
+
+
+def lttb(x, y, n_out):
+    """
+    LTTB（Largest-Triangle-Three-Buckets）で n_out 点に間引く
+
+    区間ごとに、前の区間で選んだ点と次の区間の平均の点とで作る三角形の面積が
+    最大になる点を選ぶ。区間の中の計算はNumPyでまとめて行う。NaNの点は除いてから間引く。
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        横軸の値（数値、昇順）
+    y : numpy.ndarray
+        値
+    n_out : int
+        出力する点の数（3以上）
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (x, y)
+    """
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    xf = x.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # 次の区間の平均（最後の区間は最後の点）
+    sums_x = np.add.reduceat(xf[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    counts = np.diff(edges)
+    mean_x = np.append(sums_x / counts, xf[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax_, ay = xf[a], y[a]
+        area = np.abs((ax_ - mean_x[i + 1]) * (y[lo:hi] - ay) - (ax_ - xf[lo:hi]) * (mean_y[i + 1] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+class SeriesPyramid:
+    """
+    1系列の最小値・最大値の多重解像度ピラミッド
+
+    時別の値を1時間間隔の格子に並べ（欠けている時刻はNaN）、段 k は
+    ``PYRAMID_FACTOR ** k`` 時間ごとの区間の最小値・最大値とその時刻（先頭からの時間数）を持つ。
+    段0は元の時別の値。
+
+    Parameters:
+    -----------
+    start : numpy.datetime64
+        格子の先頭の時刻
+    values : numpy.ndarray
+        1時間間隔の値
+    """
+
+    def __init__(self, start, values, levels=None):
+        self.start = np.datetime64(start, 's')
+        self.values = np.asarray(values, dtype=np.float32)
+        self.levels = levels if levels is not None else self._build(self.values)
+
+    @staticmethod
+    def _build(values):
+        levels = []
+        mins = maxs = values.astype(np.float32)
+        i_min = i_max = np.arange(len(values), dtype=np.int32)
+        while len(mins) > MIN_TOP_BUCKETS:
+            n = len(mins)
+            m = int(np.ceil(n / PYRAMID_FACTOR)) * PYRAMID_FACTOR
+            pad = m - n
+            # 前の段の PYRAMID_FACTOR 個の区間をまとめる
+            mn = np.concatenate([mins, np.full(pad, np.inf, np.float32)])
+            mn = np.where(np.isnan(mn), np.inf, mn).reshape(-1, PYRAMID_FACTOR)
+            mx = np.concatenate([maxs, np.full(pad, -np.inf, np.float32)])
+            mx = np.where(np.isnan(mx), -np.inf, mx).reshape(-1, PYRAMID_FACTOR)
+            arg_min = mn.argmin(axis=1)
+            arg_max = mx.argmax(axis=1)
+            rows = np.arange(mn.shape[0])
+            new_mins = mn[rows, arg_min]
+            new_maxs = mx[rows, arg_max]
+            idx_min = np.concatenate([i_min, np.zeros(pad, np.int32)]).reshape(-1, PYRAMID_FACTOR)[rows, arg_min]
+            idx_max = np.concatenate([i_max, np.zeros(pad, np.int32)]).reshape(-1, PYRAMID_FACTOR)[rows, arg_max]
+            empty = np.isinf(new_mins)
+            new_mins[empty] = np.nan
+            new_maxs[empty] = np.nan
+            mins, maxs, i_min, i_max = new_mins, new_maxs, idx_min, idx_max
+            levels.append((mins, maxs, i_min, i_max))
+        return levels
+
+    def bucket_hours(self, level):
+        """段 level の区間の長さ（時間）"""
+        return PYRAMID_FACTOR ** level
+
+    def query(self, start=None, end=None, n_pixels=1000):
+        """
+        期間の値を、区間の数が n_pixels * BUCKETS_PER_PIXEL 以下になる最も細かい段から取り出す
+
+        Parameters:
+        -----------
+        start, end : str or numpy.datetime64, optional
+            表示する期間（Noneの場合は全期間）
+        n_pixels : int, default=1000
+            描画する幅（ピクセル）。Noneの場合は元の時別の値（段0）を返す
+
+        Returns:
+        --------
+        tuple
+            (時刻の numpy.ndarray（datetime64[s]）, 値の numpy.ndarray, 使用した段)
+        """
+        n = len(self.values)
+        lo = 0 if start is None else int((np.datetime64(start, 's') - self.start) // HOUR)
+        hi = n if end is None else int((np.datetime64(end, 's') - self.start) // HOUR) + 1
+        lo, hi = max(lo, 0), min(hi, n)
+        if hi <= lo:
+            return np.array([], dtype='datetime64[s]'), np.array([], dtype=np.float32), 0
+
+        level = 0
+        if n_pixels is not None:
+            max_buckets = max(int(n_pixels * BUCKETS_PER_PIXEL), 1)
+            while (hi - lo) / self.bucket_hours(level) > max_buckets and level < len(self.levels):
+                level += 1
+
+        if level == 0:
+            idx = np.arange(lo, hi)
+            values = self.values[lo:hi]
+        else:
+            mins, maxs, i_min, i_max = self.levels[level - 1]
+            size = self.bucket_hours(level)
+            b_lo, b_hi = lo // size, (hi - 1) // size + 1
+            first = np.minimum(i_min[b_lo:b_hi], i_max[b_lo:b_hi])
+            second = np.maximum(i_min[b_lo:b_hi], i_max[b_lo:b_hi])
+            min_first = i_min[b_lo:b_hi] <= i_max[b_lo:b_hi]
+            v_first = np.where(min_first, mins[b_lo:b_hi], maxs[b_lo:b_hi])
+            v_second = np.where(min_first, maxs[b_lo:b_hi], mins[b_lo:b_hi])
+            idx = np.stack([first, second], axis=1).ravel()
+            values = np.stack([v_first, v_second], axis=1).ravel()
+        times = self.start + idx.astype('timedelta64[h]')
+        return times, values, level
+
+    def to_arrays(self):
+        """保存用の配列の辞書を返す"""
+        arrays = {'start': np.array(str(self.start)), 'values': self.values,
+                  'n_levels': np.array(len(self.levels))}
+        for k, (mins, maxs, i_min, i_max) in enumerate(self.levels):
+            arrays[f'min_{k}'] = mins
+            arrays[f'max_{k}'] = maxs
+            arrays[f'imin_{k}'] = i_min
+            arrays[f'imax_{k}'] = i_max
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """to_arrays の配列から作成する"""
+        levels = [(arrays[f'min_{k}'], arrays[f'max_{k}'], arrays[f'imin_{k}'], arrays[f'imax_{k}'])
+                  for k in range(int(arrays['n_levels']))]
+        return cls(np.datetime64(str(arrays['start'])), arrays['values'], levels)
+
+    @classmethod
+    def from_series(cls, series):
+        """時刻インデックスの pandas.Series から作成する（1時間間隔の格子に並べ直す）"""
+        series = series[~series.index.duplicated()].sort_index()
+        if series.empty:
+            return cls(np.datetime64('1970-01-01T00:00:00'), np.array([], dtype=np.float32))
+        start = series.index[0].floor('h')
+        offsets = ((series.index - start) // pd.Timedelta(hours=1)).to_numpy()
+        values = np.full(int(offsets[-1]) + 1, np.nan, dtype=np.float32)
+        values[offsets] = series.to_numpy(dtype=np.float64)
+        return cls(np.datetime64(start.to_datetime64(), 's'), values)
+
+
+def _source_signature(csv_dir, target):
+    """地点の年ディレクトリの更新時刻（ピラミッドの作り直しの判定に使う）"""
+    target_dir = os.path.join(csv_dir, target)
+    if not os.path.isdir(target_dir):
+        return {}
+    return {name: os.stat(os.path.join(target_dir, name)).st_mtime_ns
+            for name in sorted(os.listdir(target_dir)) if name.isdigit()}
+
+
+def pyramid_file(pyramid_dir, target, variable):
+    """ピラミッドのファイルのパス"""
+    return os.path.join(pyramid_dir, target, f"{variable}.npz")
+
+
+def load_pyramid(store, pyramid_dir, target, variable, rebuild=False):
+    """
+    地点・変数のピラミッドを読み込む。ない場合や元のCSVが更新されている場合は作成して保存する
+
+    元のCSVの年ディレクトリのうち更新された年だけを読み直して段0（時別の値）を置き換え、
+    粗い段は置き換えた段0から計算し直す。
+
+    Parameters:
+    -----------
+    store : msm.query.SeriesStore
+        元の時別データを読み込むストア
+    pyramid_dir : str
+        ピラミッドを保存するディレクトリ
+    target : str
+        地点名
+    variable : str
+        変数名
+    rebuild : bool, default=False
+        Trueの場合は常に作り直す
+
+    Returns:
+    --------
+    SeriesPyramid or None
+        データがない場合は None
+    """
+    current = _source_signature(store.csv_dir, target)
+    signature = json.dumps(current, sort_keys=True)
+    path = pyramid_file(pyramid_dir, target, variable)
+    previous = None
+    if not rebuild and os.path.exists(path):
+        with np.load(path, allow_pickle=False) as npz:
+            if str(npz['signature']) == signature:
+                return SeriesPyramid.from_arrays(npz)
+            previous = (json.loads(str(npz['signature'])), SeriesPyramid.from_arrays(npz))
+
+    years = sorted(int(name) for name in current)
+    if not years:
+        return None
+    if previous is None:
+        changed = years
+        parts = []
+    else:
+        # 更新時刻が変わった年（と削除された年）だけを読み直す
+        old_signature, old = previous
+        changed = [year for year in years if old_signature.get(str(year)) != current[str(year)]]
+        index = pd.DatetimeIndex(old.start + np.arange(len(old.values)) * HOUR)
+        keep = index.year.isin([year for year in years if year not in changed])
+        parts = [pd.Series(old.values[keep], index=index[keep])]
+    for year in changed:
+        data = store.get_series(target, f"{year}-01-01", f"{year}-12-31", [variable])
+        if not data.empty:
+            parts.append(data[variable])
+    parts = [part for part in parts if not part.empty]
+    if not parts:
+        return None
+    pyramid = SeriesPyramid.from_series(pd.concat(parts))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, signature=np.array(signature), **pyramid.to_arrays())
+    return pyramid
+
+
+def _open(config_file):
+    from msm.config import load_config
+    from msm.query import open_store
+
+    config = load_config(config_file)
+    pyramid_dir = config.get('pyramid_directory', os.path.join(config['output_directory'], 'pyramid'))
+    return config, open_store(config_file), pyramid_dir
+
+
+def plot_series(config_file, targets, variable, start=None, end=None, ax=None, method='minmax', width_px=None):
+    """
+    複数地点の1変数の時系列を間引いて描画する
+
+    method='minmax' の場合はピラミッドを使い、拡大・縮小で表示範囲が変わるたびに
+    その範囲だけを適切な段から取り出して描き直す。
+
+    Parameters:
+    -----------
+    config_file : str
+        設定ファイルのパス
+    targets : list of str
+        地点名
+    variable : str
+        変数名（'temp', 'r1h' など）
+    start, end : str, optional
+        最初に表示する期間（Noneの場合は全期間）
+    ax : matplotlib.axes.Axes, optional
+        描画先（Noneの場合は新しく作成する）
+    method : str, default='minmax'
+        'minmax'（ピラミッドの最小値・最大値）または 'lttb'
+    width_px : int, optional
+        間引きの基準とする幅（ピクセル）。Noneの場合は描画先の幅
+
+    Returns:
+    --------
+    tuple
+        (matplotlib.figure.Figure, matplotlib.axes.Axes)
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+
+    if isinstance(targets, str):
+        targets = [targets]
+    if method not in ('minmax', 'lttb'):
+        raise ValueError(f"method は 'minmax' または 'lttb' を指定してください: {method}")
+    _, store, pyramid_dir = _open(config_file)
+    if ax is None:
+        fig, ax = plt.subplots(figsize=(12, 4))
+    else:
+        fig = ax.figure
+
+    def pixels():
+        return width_px or max(int(ax.get_window_extent().width), 100)
+
+    pyramids = {}
+    lines = {}
+    for target in targets:
+        pyramid = load_pyramid(store, pyramid_dir, target, variable)
+        if pyramid is None:
+            print(f"警告: 地点 '{target}' の '{variable}' のデータが見つかりません")
+            continue
+        pyramids[target] = pyramid
+        lines[target], = ax.plot([], [], linewidth=0.8, label=target)
+
+    def fetch(pyramid, lo, hi):
+        if method == 'minmax':
+            times, values, _ = pyramid.query(lo, hi, pixels())
+            return mdates.date2num(times), values
+        times, values, _ = pyramid.query(lo, hi, n_pixels=None)
+        return lttb(mdates.date2num(times), values.astype(np.float64), 2 * pixels())
+
+    def redraw(lo, hi):
+        for target, pyramid in pyramids.items():
+            lines[target].set_data(*fetch(pyramid, lo, hi))
+
+    first = min((p.start for p in pyramids.values()), default=None)
+    last = max((p.start + (len(p.values) - 1) * HOUR for p in pyramids.values()), default=None)
+    lo = np.datetime64(start, 's') if start else first
+    hi = np.datetime64(end, 's') + np.timedelta64(23, 'h') if end and len(end) == 10 else (
+        np.datetime64(end, 's') if end else last)
+    redraw(lo, hi)
+    if lo is not None:
+        ax.set_xlim(mdates.date2num(lo), mdates.date2num(hi))
+    ax.relim()
+    ax.autoscale_view(scalex=False)
+
+    state = {'busy': False}
+
+    def on_xlim_changed(axes):
+        # set_data の中で再び呼ばれないようにする
+        if state['busy']:
+            return
+        state['busy'] = True
+        try:
+            x0, x1 = axes.get_xlim()
+            redraw(np.datetime64(mdates.num2date(x0).replace(tzinfo=None), 's'),
+                   np.datetime64(mdates.num2date(x1).replace(tzinfo=None), 's'))
+        finally:
+            state['busy'] = False
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+    ax.xaxis_date()
+    ax.set_ylabel(variable)
+    if len(lines) > 1:
+        ax.legend(loc='upper right')
+    return fig, ax
+
+
+def process_pyramid(config_file, targets=None, variables=None, rebuild=False):
+    """設定ファイルの地点・変数のピラミッドを作成する（元のCSVが更新されたものだけ）"""
+    import time
+
+    try:
+        config, store, pyramid_dir = _open(config_file)
+        targets = targets or list(config['targets'].keys())
+        variables = variables or ['temp', 'r1h', 'wind_speed']
+        for target in targets:
+            for variable in variables:
+                t0 = time.perf_counter()
+                pyramid = load_pyramid(store, pyramid_dir, target, variable, rebuild)
+                if pyramid is None:
+                    print(f"警告: 地点 '{target}' の '{variable}' のデータが見つかりません")
+                    continue
+                print(f"ピラミッド: {pyramid_file(pyramid_dir, target, variable)} "
+                      f"({len(pyramid.values)} 時間, {len(pyramid.levels)} 段, {time.perf_counter() - t0:.2f} 秒)")
+        return True
+    except Exception as e:
+        print(f"エラー: ピラミッドの作成中に問題が発生しました: {e}")
+        return False
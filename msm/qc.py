@@ -0,0 +1,475 @@
+"""抽出済みCSVの品質管理（QC）
+
+規則を宣言的に並べ、ファイル（またはデータの塊）ごとに1回読み込んだデータに対して
+すべての規則を配列演算で評価する。値ごとのフラグは規則の順のビットを立てた
+``{変数}_qc`` 列（uint32）として出力し、規則ごとの該当数を集計する。
+
+``msm qc --input-dir ./output/csv --output-dir ./output/csv_qc`` で実行する
+（ファイルの探索・並列処理・ジャーナルによる再開は ``msm fix`` と共通）。
+
+規則の種類:
+
+- ``sentinel``: 特殊値（``value``）。以降の規則ではその値を欠損として扱う
+- ``range``: ``min`` 未満または ``max`` 超の値
+- ``spike``: 前後の時刻との差がどちらも ``threshold`` を超え、向きが同じ値（1時間だけ突出した値）
+- ``step``: 前の時刻との差が ``threshold`` を超える値
+- ``stuck``: 同じ値が ``hours`` 時刻以上続く値（``ignore`` の値は除く）
+- ``cross``: 複数の変数の条件式 ``condition`` が真になる時刻の ``variables`` の値。条件式は ``ast`` で
+  解析し、変数名・数値・算術／比較／論理演算（``&``、``|``、``~``、``and``、``or``、``not``）と
+  ``_CONDITION_FUNCTIONS`` の関数（``abs``、``sqrt`` など）の呼び出しだけを評価する
+  （属性・添字・それ以外の関数は使えない）
+
+規則ごとの該当数はフラグを立てた値の数で、``cross`` では条件が真の時刻の数 × ``variables`` の数になる。
+
+``action`` に ``nan`` を指定した規則は、該当する値を出力で欠損にする（デフォルトは ``flag``：フラグのみ）。
+前後の時刻を使う規則は、ファイル（日）の中で時刻が1時間ずつ連続する値だけを比べる。
+規則は設定ファイルの ``qc_rules`` または ``--rules`` のJSONファイルで指定する（省略時は DEFAULT_RULES）::
+
+    "qc_rules": [
+        {"name": "rh_range", "type": "range", "variable": "rh", "min": 0, "max": 100},
+        {"name": "temp_spike", "type": "spike", "variable": "temp", "threshold": 8.0},
+        {"name": "wind_consistency", "type": "cross", "variables": ["wind_speed"],
+         "condition": "abs(wind_speed - sqrt(u ** 2 + v ** 2)) > 0.01"}
+    ]
+"""
+
+import os
+import ast
+import json
+import hashlib
+import operator
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from msm.journal import atomic_path, fix_journal_directory, RunJournal
+
+QC_RULE_TYPES = ['sentinel', 'range', 'spike', 'step', 'stuck', 'cross']
+
+QC_ACTIONS = ['flag', 'nan']
+
+# フラグは uint32 の列に保存するため、規則は32個まで
+MAX_RULES = 32
+
+DEFAULT_RULES = [
+    {'name': 'r1h_sentinel', 'type': 'sentinel', 'variable': 'r1h', 'value': 200, 'action': 'nan'},
+    {'name': 'r1h_range', 'type': 'range', 'variable': 'r1h', 'min': 0, 'max': 150},
+    {'name': 'rh_range', 'type': 'range', 'variable': 'rh', 'min': 0, 'max': 100},
+    {'name': 'ncld_range', 'type': 'range', 'variable': 'ncld', 'min': 0, 'max': 100},
+    {'name': 'dswrf_range', 'type': 'range', 'variable': 'dswrf', 'min': 0, 'max': 1400},
+    # 気温は摂氏、気圧はPa。scale_factor の二重適用やケルビンのままの値はここで見つかる
+    {'name': 'temp_range', 'type': 'range', 'variable': 'temp', 'min': -50, 'max': 45},
+    {'name': 'psea_range', 'type': 'range', 'variable': 'psea', 'min': 87000, 'max': 109000},
+    {'name': 'sp_range', 'type': 'range', 'variable': 'sp', 'min': 50000, 'max': 109000},
+    {'name': 'wind_speed_range', 'type': 'range', 'variable': 'wind_speed', 'min': 0, 'max': 75},
+    {'name': 'temp_spike', 'type': 'spike', 'variable': 'temp', 'threshold': 8.0},
+    {'name': 'temp_step', 'type': 'step', 'variable': 'temp', 'threshold': 12.0},
+    {'name': 'psea_step', 'type': 'step', 'variable': 'psea', 'threshold': 800.0},
+    {'name': 'temp_stuck', 'type': 'stuck', 'variable': 'temp', 'hours': 12},
+    {'name': 'ncld_stuck', 'type': 'stuck', 'variable': 'ncld', 'hours': 24, 'ignore': [0, 100]},
+    {'name': 'wind_consistency', 'type': 'cross', 'variables': ['wind_speed'],
+     'condition': 'abs(wind_speed - sqrt(u ** 2 + v ** 2)) > 0.01'},
+    {'name': 'rain_dry', 'type': 'cross', 'variables': ['r1h', 'rh'], 'condition': '(r1h >= 1.0) & (rh < 40)'},
+]
+
+# cross の条件式で使える関数
+_CONDITION_FUNCTIONS = {
+    'abs': np.abs, 'sqrt': np.sqrt, 'hypot': np.hypot, 'minimum': np.minimum, 'maximum': np.maximum,
+    'isnan': np.isnan, 'where': np.where,
+}
+
+
+def validate_rules(rules):
+    """
+    規則の一覧を検証し、規則名 -> ビット番号の辞書を返す
+
+    Raises:
+    -------
+    ValueError
+        規則の種類・名前・引数が不正な場合
+    """
+    if len(rules) > MAX_RULES:
+        raise ValueError(f"規則は {MAX_RULES} 個までです（{len(rules)} 個）")
+    bits = OrderedDict()
+    for i, rule in enumerate(rules):
+        name = rule.get('name')
+        if not name or name in bits:
+            raise ValueError(f"規則 {i} の name がないか重複しています: {name}")
+        kind = rule.get('type')
+        if kind not in QC_RULE_TYPES:
+            raise ValueError(f"規則 '{name}' の種類が不正です: {kind}（{QC_RULE_TYPES}）")
+        if rule.get('action', 'flag') not in QC_ACTIONS:
+            raise ValueError(f"規則 '{name}' の action が不正です: {rule.get('action')}（{QC_ACTIONS}）")
+        required = {'sentinel': ['variable', 'value'], 'range': ['variable'], 'spike': ['variable', 'threshold'],
+                    'step': ['variable', 'threshold'], 'stuck': ['variable', 'hours'],
+                    'cross': ['variables', 'condition']}[kind]
+        missing = [key for key in required if key not in rule]
+        if missing:
+            raise ValueError(f"規則 '{name}' に {', '.join(missing)} がありません")
+        if kind == 'range' and 'min' not in rule and 'max' not in rule:
+            raise ValueError(f"規則 '{name}' に min または max がありません")
+        if kind == 'cross':
+            _compile_condition(rule['condition'])
+        bits[name] = i
+    return bits
+
+
+def rules_key(rules):
+    """規則の一覧のハッシュ（ジャーナルで規則の変更を判定する）"""
+    return hashlib.sha1(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+# cross の条件式で使える演算子
+_BINARY_OPERATORS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod, ast.Pow: operator.pow,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+_UNARY_OPERATORS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert,
+                    ast.Not: np.logical_not}
+_COMPARE_OPERATORS = {
+    ast.Lt: operator.lt, ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+    ast.Eq: operator.eq, ast.NotEq: operator.ne,
+}
+
+_compiled = {}
+
+
+def _check_node(node, condition):
+    """条件式の構文木が使える要素だけでできているかを調べる"""
+    if isinstance(node, ast.Expression):
+        _check_node(node.body, condition)
+    elif isinstance(node, ast.Name):
+        if node.id in _CONDITION_FUNCTIONS:
+            raise ValueError(f"条件式が不正です: {condition}（関数 '{node.id}' は呼び出しでのみ使えます）")
+    elif isinstance(node, ast.Constant):
+        if type(node.value) not in (int, float, bool):
+            raise ValueError(f"条件式が不正です: {condition}（数値以外の定数 {node.value!r}）")
+    elif isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPERATORS:
+        _check_node(node.left, condition)
+        _check_node(node.right, condition)
+    elif isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPERATORS:
+        _check_node(node.operand, condition)
+    elif isinstance(node, ast.Compare) and all(type(op) in _COMPARE_OPERATORS for op in node.ops):
+        for child in [node.left] + node.comparators:
+            _check_node(child, condition)
+    elif isinstance(node, ast.BoolOp):
+        for child in node.values:
+            _check_node(child, condition)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and \
+            node.func.id in _CONDITION_FUNCTIONS and not node.keywords:
+        for child in node.args:
+            _check_node(child, condition)
+    else:
+        raise ValueError(f"条件式が不正です: {condition}（使えない要素: {type(node).__name__}）")
+
+
+def _compile_condition(condition):
+    """条件式を解析して検証した構文木を返す"""
+    if condition not in _compiled:
+        try:
+            tree = ast.parse(condition, '<qc>', mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"条件式が不正です: {condition}（{e}）")
+        _check_node(tree, condition)
+        _compiled[condition] = tree
+    return _compiled[condition]
+
+
+def _evaluate_node(node, columns):
+    """検証済みの構文木を列の配列で評価する（変数がない場合は NameError）"""
+    if isinstance(node, ast.Expression):
+        return _evaluate_node(node.body, columns)
+    if isinstance(node, ast.Name):
+        if node.id not in columns:
+            raise NameError(node.id)
+        return np.asarray(columns[node.id])
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.BinOp):
+        return _BINARY_OPERATORS[type(node.op)](_evaluate_node(node.left, columns),
+                                                _evaluate_node(node.right, columns))
+    if isinstance(node, ast.UnaryOp):
+        return _UNARY_OPERATORS[type(node.op)](_evaluate_node(node.operand, columns))
+    if isinstance(node, ast.Compare):
+        # a < b < c は (a < b) & (b < c)
+        left = _evaluate_node(node.left, columns)
+        result = True
+        for op, comparator in zip(node.ops, node.comparators):
+            right = _evaluate_node(comparator, columns)
+            result = np.logical_and(result, _COMPARE_OPERATORS[type(op)](left, right))
+            left = right
+        return result
+    if isinstance(node, ast.BoolOp):
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        result = _evaluate_node(node.values[0], columns)
+        for child in node.values[1:]:
+            result = combine(result, _evaluate_node(child, columns))
+        return result
+    # ast.Call（_check_node で _CONDITION_FUNCTIONS の関数だけに限定済み）
+    return _CONDITION_FUNCTIONS[node.func.id](*[_evaluate_node(arg, columns) for arg in node.args])
+
+
+def _flagged_variables(rules):
+    """フラグの列を持つ変数（規則の順）"""
+    variables = []
+    for rule in rules:
+        for var in rule.get('variables', [rule.get('variable')]):
+            if var is not None and var not in variables:
+                variables.append(var)
+    return variables
+
+
+def _neighbours(values, consecutive):
+    """1時間前・1時間後の値（時刻が連続しない場合は欠損）"""
+    previous = np.full(values.shape, np.nan)
+    following = np.full(values.shape, np.nan)
+    previous[1:] = np.where(consecutive, values[:-1], np.nan)
+    following[:-1] = np.where(consecutive, values[1:], np.nan)
+    return previous, following
+
+
+def _stuck(values, consecutive, hours, ignore):
+    """同じ値が hours 時刻以上続く位置"""
+    if len(values) == 0:
+        return np.zeros(0, dtype=bool)
+    same = np.zeros(len(values), dtype=bool)
+    same[1:] = consecutive & (values[1:] == values[:-1])
+    run_id = np.cumsum(~same)
+    run_length = np.bincount(run_id)[run_id]
+    mask = (run_length >= hours) & ~np.isnan(values)
+    if ignore:
+        mask &= ~np.isin(values, ignore)
+    return mask
+
+
+def evaluate_rules(data, rules, times=None):
+    """
+    時刻順のデータにすべての規則を適用する
+
+    Parameters:
+    -----------
+    data : dict or pandas.DataFrame
+        変数名 -> 値の配列（時刻順）
+    rules : list of dict
+        規則（validate_rules で検証済みのもの）
+    times : array-like, optional
+        時刻。指定した場合、前後の時刻を使う規則は1時間ずつ連続する値だけを比べる
+        （省略時はすべての行が連続しているとみなす）
+
+    Returns:
+    --------
+    tuple
+        (変数名 -> フラグ（uint32）の配列の辞書, 規則名 -> 該当する値の数の辞書,
+        変数名 -> 欠損にする位置（action が nan の規則）の辞書)
+    """
+    columns = {var: np.asarray(data[var], dtype=np.float64) for var in data.keys()}
+    n = len(next(iter(columns.values()))) if columns else 0
+    if times is not None and n > 1:
+        hours = np.asarray(times, dtype='datetime64[h]').astype(np.int64)
+        consecutive = np.diff(hours) == 1
+    else:
+        consecutive = np.ones(max(n - 1, 0), dtype=bool)
+
+    # 特殊値は先に判定し、以降の規則では欠損として扱う
+    working = dict(columns)
+    for rule in rules:
+        if rule['type'] == 'sentinel' and rule['variable'] in working:
+            values = working[rule['variable']]
+            working[rule['variable']] = np.where(
+                np.isclose(values, rule['value'], rtol=1e-10, atol=1e-10), np.nan, values)
+
+    flags = {var: np.zeros(n, dtype=np.uint32) for var in _flagged_variables(rules) if var in columns}
+    counts = OrderedDict()
+    to_nan = {}
+    for bit, rule in enumerate(rules):
+        kind = rule['type']
+        targets = rule.get('variables', [rule.get('variable')])
+        if any(var not in columns for var in targets):
+            counts[rule['name']] = 0
+            continue
+        with np.errstate(invalid='ignore'):
+            if kind == 'cross':
+                try:
+                    mask = np.asarray(_evaluate_node(_compile_condition(rule['condition']), working), dtype=bool)
+                except NameError:
+                    # 条件式の変数がないデータ
+                    counts[rule['name']] = 0
+                    continue
+                mask = np.broadcast_to(mask, (n,))
+            else:
+                var = rule['variable']
+                values = working[var]
+                if kind == 'sentinel':
+                    mask = np.isclose(columns[var], rule['value'], rtol=1e-10, atol=1e-10)
+                elif kind == 'range':
+                    mask = np.zeros(n, dtype=bool)
+                    if rule.get('min') is not None:
+                        mask |= values < rule['min']
+                    if rule.get('max') is not None:
+                        mask |= values > rule['max']
+                elif kind == 'spike':
+                    previous, following = _neighbours(values, consecutive)
+                    up, down = values - previous, values - following
+                    mask = (np.abs(up) > rule['threshold']) & (np.abs(down) > rule['threshold']) & \
+                        (np.sign(up) == np.sign(down))
+                elif kind == 'step':
+                    previous, _ = _neighbours(values, consecutive)
+                    mask = np.abs(values - previous) > rule['threshold']
+                else:
+                    mask = _stuck(values, consecutive, rule['hours'], rule.get('ignore'))
+        counts[rule['name']] = int(np.count_nonzero(mask)) * len(targets)
+        for var in targets:
+            flags[var][mask] |= np.uint32(1 << bit)
+            if rule.get('action', 'flag') == 'nan':
+                to_nan[var] = to_nan.get(var, np.zeros(n, dtype=bool)) | mask
+    return flags, counts, to_nan
+
+
+def qc_file(input_file, output_file, rules, time_column='time'):
+    """
+    1ファイルを読み込んで規則を適用し、フラグの列を追加したCSVを出力する
+
+    Returns:
+    --------
+    dict
+        'rows'（行数）と規則ごとの該当数
+    """
+    df = pd.read_csv(input_file)
+    times = None
+    if time_column in df.columns:
+        df[time_column] = pd.to_datetime(df[time_column])
+        df = df.sort_values(time_column, kind='stable').reset_index(drop=True)
+        times = df[time_column].to_numpy()
+    variables = [c for c in df.columns if c != time_column and not c.endswith('_qc')]
+    flags, counts, to_nan = evaluate_rules({var: df[var] for var in variables}, rules, times)
+    for var, mask in to_nan.items():
+        df.loc[mask, var] = np.nan
+    for var, values in flags.items():
+        df[f"{var}_qc"] = values
+
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with atomic_path(output_file) as tmp_path:
+        df.to_csv(tmp_path, index=False)
+    result = {'rows': len(df)}
+    result.update(counts)
+    return result
+
+
+def _qc_and_record(input_file, output_file, rules, key, time_column, journal):
+    """1ファイルを処理し、該当数をジャーナルに記録する"""
+    counts = qc_file(input_file, output_file, rules, time_column)
+    if journal is not None:
+        journal.record('qc', output_file, output_file, source=input_file, rules=key, counts=counts)
+    return counts
+
+
+def decode_flags(flags, rules):
+    """フラグの値を規則名のリストにする"""
+    return [rule['name'] for bit, rule in enumerate(rules) if int(flags) & (1 << bit)]
+
+
+def load_rules(path=None):
+    """規則をJSONファイル（規則のリスト、または qc_rules を含む設定ファイル）から読み込む（省略時は DEFAULT_RULES）"""
+    if path is None:
+        return [dict(rule) for rule in DEFAULT_RULES]
+    with open(path, 'r', encoding='utf-8') as f:
+        loaded = json.load(f)
+    if isinstance(loaded, dict):
+        loaded = loaded.get('qc_rules', DEFAULT_RULES)
+    return loaded
+
+
+def summarize_qc(journal, output_dir, rules, key):
+    """
+    ジャーナルに記録されたファイルごとの該当数を地点・年ごとに集計する
+
+    Returns:
+    --------
+    pandas.DataFrame
+        target, year, files, rows と規則ごとの該当数の列
+    """
+    rows = {}
+    for (stage, unit), entry in journal.entries().items():
+        if stage != 'qc' or entry.get('rules') != key or not os.path.exists(entry['path']):
+            continue
+        parts = os.path.relpath(entry['path'], output_dir).split(os.sep)
+        target, year = (parts[-3], parts[-2]) if len(parts) >= 3 else ('', '')
+        row = rows.setdefault((target, year), OrderedDict(
+            [('target', target), ('year', year), ('files', 0), ('rows', 0)] + [(r['name'], 0) for r in rules]))
+        row['files'] += 1
+        for name, value in entry['counts'].items():
+            if name in row:
+                row[name] += value
+    return pd.DataFrame([rows[k] for k in sorted(rows)],
+                        columns=['target', 'year', 'files', 'rows'] + [r['name'] for r in rules])
+
+
+def run_qc(input_dir, output_dir, rules=None, time_column='time', station=None, year=None, pattern='*.csv',
+           parallel=True, max_workers=None, verbose=True):
+    """
+    入力ディレクトリ内のCSVファイル（地点・年で絞り込み可能）に規則を適用し、
+    フラグの列を追加したファイルを出力ディレクトリに同じ構造で保存する
+
+    規則ごとの該当数を地点・年ごとに集計して ``output_dir/qc_summary.csv`` に保存し、
+    規則とビットの対応を ``output_dir/qc_rules.json`` に保存する。
+
+    Returns:
+    --------
+    int
+        終了コード（すべて成功した場合は0）
+    """
+    from msm.fix import select_csv_files, run_batch
+
+    rules = rules if rules is not None else load_rules()
+    try:
+        bits = validate_rules(rules)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return 1
+    if not os.path.exists(input_dir):
+        print(f"エラー: 入力ディレクトリ '{input_dir}' が見つかりません")
+        return 1
+    csv_files = select_csv_files(input_dir, station, year, pattern)
+    if csv_files is None:
+        return 1
+    if not csv_files:
+        print(f"エラー: 処理対象のCSVファイルが見つかりません")
+        return 1
+
+    os.makedirs(output_dir, exist_ok=True)
+    key = rules_key(rules)
+    journal = RunJournal(fix_journal_directory(output_dir))
+    output_files = [os.path.join(output_dir, os.path.relpath(f, input_dir)) for f in csv_files]
+    pairs = [(i, o) for i, o in zip(csv_files, output_files) if not journal.is_done('qc', o, source=i, rules=key)]
+    if verbose:
+        print(f"MSMデータ品質管理: {len(csv_files)} ファイル, 規則 {len(rules)} 個")
+        if len(pairs) < len(csv_files):
+            print(f"ジャーナルにより処理済みの {len(csv_files) - len(pairs)} ファイルをスキップします")
+
+    def worker(input_file, output_file):
+        return _qc_and_record(input_file, output_file, rules, key, time_column, journal)
+
+    success_count, failure_count, processing_time, _ = run_batch(
+        [i for i, _ in pairs], [o for _, o in pairs], worker, parallel, max_workers, verbose)
+
+    with atomic_path(os.path.join(output_dir, 'qc_rules.json')) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'bits': bits, 'rules': rules}, f, ensure_ascii=False, indent=2)
+    summary = summarize_qc(journal, output_dir, rules, key)
+    with atomic_path(os.path.join(output_dir, 'qc_summary.csv')) as tmp_path:
+        summary.to_csv(tmp_path, index=False)
+
+    if verbose:
+        print(f"\n処理完了:")
+        print(f"- 成功: {success_count} ファイル")
+        print(f"- 失敗: {failure_count} ファイル")
+        print(f"- 合計処理時間: {processing_time:.2f}秒")
+        if not summary.empty:
+            total_rows = int(summary['rows'].sum())
+            print(f"\n規則ごとの該当数（{int(summary['files'].sum())} ファイル, {total_rows} 行）:")
+            for rule in rules:
+                print(f"- {rule['name']} (bit {bits[rule['name']]}): {int(summary[rule['name']].sum())}")
+        print(f"集計: {os.path.join(output_dir, 'qc_summary.csv')}")
+    return 0 if failure_count == 0 else 1
@@ -0,0 +1,269 @@
+"""抽出済みデータの時系列取得API
+
+``output/csv_fixed/<地点名>/<年>/*.csv`` を年単位でまとめて読み込み、
+メモリ上限付きのLRUキャッシュに保持する。同じ地点・年への2回目以降の
+問い合わせはCSVを読み直さずにキャッシュから返す。年単位の日別・月別統計も
+同じキャッシュに保持する（msm.server から共有して使用する）。
+
+使用例::
+
+    from msm.query import get_series
+    df = get_series('yukikabe', '2024-12-01', '2025-03-31', ['temp', 'r1h'], resample='D')
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+
+# リサンプリング時に合計を取る変数（それ以外は平均）
+SUM_VARIABLES = ['r1h']
+
+# キャッシュのデフォルト上限（1地点1年はおよそ1MB）
+DEFAULT_CACHE_BYTES = 256 * 1024 ** 2
+
+
+class SeriesStore:
+    """
+    抽出済みCSVディレクトリから地点の時系列を取得するクラス
+
+    年ごとに読み込んだデータ（時刻をインデックスとするDataFrame）を
+    LRUでキャッシュし、合計サイズが max_bytes を超えたら古いものから破棄する。
+    年ディレクトリの更新時刻が変わった場合（新しい日が追加された場合など）は
+    読み込み直す。
+
+    Parameters:
+    -----------
+    csv_dir : str
+        抽出済みCSVのベースディレクトリ
+    max_bytes : int, default=DEFAULT_CACHE_BYTES
+        キャッシュするデータの合計サイズの上限（バイト）
+    """
+
+    def __init__(self, csv_dir, max_bytes=DEFAULT_CACHE_BYTES):
+        self.csv_dir = csv_dir
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _read_year(self, target, year):
+        """1地点1年分のCSVを読み込んで時刻インデックスのDataFrameにする"""
+        year_dir = os.path.join(self.csv_dir, target, str(year))
+        files = sorted(f for f in os.listdir(year_dir) if f.endswith('.csv'))
+        if not files:
+            return pd.DataFrame()
+        df = pd.concat((pd.read_csv(os.path.join(year_dir, f)) for f in files), ignore_index=True)
+        df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('time')), name='time')
+        df = df.astype(np.float64)
+        return df.sort_index()
+
+    def _get_block(self, kind, target, year, loader):
+        """
+        キャッシュされたブロックを返す。ない場合は loader() で作成してキャッシュする。
+        同じブロックを複数のスレッドが同時に要求した場合は、1つのスレッドだけが
+        読み込み、他のスレッドはその結果を待つ（リクエストの合流）。
+        """
+        year_dir = os.path.join(self.csv_dir, target, str(year))
+        if not os.path.isdir(year_dir):
+            return None
+        key = (kind, target, int(year))
+        mtime = os.stat(year_dir).st_mtime_ns
+
+        while True:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[0] == mtime:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+            # 他のスレッドの読み込み完了を待ってキャッシュを見直す
+            pending.wait()
+
+        try:
+            block = loader()
+            size = int(block.memory_usage(index=True, deep=False).sum())
+            with self._lock:
+                old = self._cache.pop(key, None)
+                if old is not None:
+                    self._cache_bytes -= old[2]
+                self._cache[key] = (mtime, block, size)
+                self._cache_bytes += size
+                # 上限を超えた分を古いものから破棄（今読み込んだブロックは残す）
+                while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                    _, (_, _, evicted_size) = self._cache.popitem(last=False)
+                    self._cache_bytes -= evicted_size
+            return block
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.set()
+
+    def load_year(self, target, year):
+        """1地点1年分の時別データを返す（キャッシュがあればそれを使う）"""
+        return self._get_block('hourly', target, year, lambda: self._read_year(target, year))
+
+    def load_statistics_year(self, target, year, freq):
+        """1地点1年分の日別（freq='daily'）または月別（freq='monthly'）統計を返す"""
+        from msm.combine import compute_daily_statistics, compute_monthly_statistics
+
+        def build():
+            hourly = self.load_year(target, year)
+            if hourly is None or hourly.empty:
+                return pd.DataFrame()
+            all_data = hourly.reset_index()
+            daily_df = compute_daily_statistics(all_data)
+            if freq == 'daily':
+                stats = daily_df
+                stats.index = pd.DatetimeIndex(pd.to_datetime(stats.index), name='date')
+            else:
+                stats = compute_monthly_statistics(all_data, daily_df)
+                stats.index = pd.DatetimeIndex(stats.index.to_timestamp(), name='month')
+            return stats
+
+        if freq not in ('daily', 'monthly'):
+            raise ValueError(f"freq は 'daily' または 'monthly' を指定してください: {freq}")
+        return self._get_block(freq, target, year, build)
+
+    def _collect(self, start, end, load):
+        """期間に含まれる年のブロックを読み込んで期間で切り出し、連結する"""
+        start_ts = pd.Timestamp(start)
+        end_ts = pd.Timestamp(end)
+        if end_ts == end_ts.normalize():
+            end_ts = end_ts + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+
+        frames = []
+        for year in range(start_ts.year, end_ts.year + 1):
+            df = load(year)
+            if df is not None and not df.empty:
+                frames.append(df.loc[start_ts:end_ts])
+        if not frames:
+            return None
+        return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+    def get_series(self, target, start, end, variables=None, resample=None):
+        """
+        地点の時系列を期間・変数を指定して取得する
+
+        Parameters:
+        -----------
+        target : str
+            地点名
+        start, end : str or datetime
+            取得する期間（両端を含む。日付のみの場合 end はその日の最後の時刻まで）
+        variables : list of str, optional
+            取得する変数（Noneの場合はすべて）
+        resample : str, optional
+            pandasのリサンプリング規則（'D', 'MS' など）。r1h は合計、
+            wind_direction は u, v の平均から求め直し、その他は平均を取る
+
+        Returns:
+        --------
+        pandas.DataFrame
+            時刻をインデックスとするデータ（``.to_numpy()`` でNumPy配列として取得できる）
+        """
+        data = self._collect(start, end, lambda year: self.load_year(target, year))
+        columns = list(variables) if variables else None
+        if data is None:
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name='time'), dtype=np.float64)
+
+        if resample is None:
+            return data[columns] if columns else data.copy()
+        return _resample(data, columns or list(data.columns), resample)
+
+    def get_statistics(self, target, start, end, freq='daily', columns=None):
+        """
+        地点の日別・月別統計を期間を指定して取得する（combine の日別・月別出力と同じ列）
+
+        Parameters:
+        -----------
+        target : str
+            地点名
+        start, end : str or datetime
+            取得する期間（両端を含む）
+        freq : str, default='daily'
+            'daily' または 'monthly'
+        columns : list of str, optional
+            取得する列（Noneの場合はすべて）
+        """
+        data = self._collect(start, end, lambda year: self.load_statistics_year(target, year, freq))
+        if data is None:
+            return pd.DataFrame(columns=columns)
+        return data[list(columns)] if columns else data.copy()
+
+    def cache_info(self):
+        """キャッシュの状態（件数、サイズ、ヒット数、ミス数）を返す"""
+        with self._lock:
+            return {
+                'entries': len(self._cache),
+                'bytes': self._cache_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+            }
+
+    def clear_cache(self):
+        """キャッシュを空にする"""
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+
+def _resample(data, columns, rule):
+    """変数の性質に応じた集計方法でリサンプリングする"""
+    resampler = data.resample(rule)
+    result = {}
+    for var in columns:
+        if var == 'wind_direction' and 'u' in data.columns and 'v' in data.columns:
+            u_mean = resampler['u'].mean()
+            v_mean = resampler['v'].mean()
+            result[var] = (270 - np.degrees(np.arctan2(v_mean, u_mean))) % 360
+        elif var in SUM_VARIABLES:
+            result[var] = resampler[var].sum()
+        else:
+            result[var] = resampler[var].mean()
+    return pd.DataFrame(result)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(csv_dir, max_bytes=DEFAULT_CACHE_BYTES):
+    """CSVディレクトリごとに共有される SeriesStore を返す"""
+    key = os.path.abspath(csv_dir)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SeriesStore(csv_dir, max_bytes)
+        return _stores[key]
+
+
+def open_store(config_file):
+    """設定ファイルの input_csv_directory（未指定なら output/csv）の SeriesStore を返す"""
+    config = load_config(config_file)
+    csv_dir = config.get('input_csv_directory', os.path.join(config['output_directory'], 'csv'))
+    return get_store(csv_dir, config.get('query_cache_bytes', DEFAULT_CACHE_BYTES))
+
+
+def get_series(target, start, end, variables=None, resample=None, csv_dir='./output/csv_fixed'):
+    """
+    地点の時系列を取得する（プロセス内で共有されるキャッシュを使用）
+
+    引数の詳細は SeriesStore.get_series を参照。
+    """
+    return get_store(csv_dir).get_series(target, start, end, variables, resample)
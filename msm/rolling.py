@@ -0,0 +1,418 @@
+"""移動窓の積算値と積算暖度（デグリーデー）の逐次計算
+
+地点のCSVを時刻順に1回だけ読み、24時間・72時間降水量、期間の最大風速、
+積算暖度などを計算する。移動窓の合計は前のファイルの末尾の値とつないだ
+累積和の差で、最大値・最小値は単調なdequeで求める。計算の途中の状態
+（窓に含まれる直前の値、dequeの中身、積算暖度の累計）を
+``output/rolling/<地点名>/state.json`` に保存するため、次回は前回の続きの
+ファイルだけを読んで系列を延長する。combine の実行期間の境界をまたぐ窓も
+正しく計算される。処理済みの日のCSVのサイズと更新時刻も保存し、再修正された日
+（または後から追加された過去の日）がある場合は、その年の初めの状態
+（``start_YYYY.json``）から計算し直す。r1h の特殊値（200）は欠損として扱う。
+
+設定ファイルの ``rolling_windows`` で窓を指定する（省略時は DEFAULT_WINDOWS）::
+
+    "rolling_windows": {
+        "r1h_sum_24h": {"variable": "r1h", "stat": "sum", "hours": 24},
+        "wind_speed_max_24h": {"variable": "wind_speed", "stat": "max", "hours": 24},
+        "pdd": {"variable": "temp", "stat": "degree_days", "base": 0.0, "reset": "10-01"}
+    }
+
+- ``sum``, ``mean``, ``max``, ``min``: 直近 ``hours`` 時間（現在の時刻を含む）の値。
+  欠損は除き、有効な値が ``min_periods``（デフォルト: 1）個未満の場合は欠損
+- ``degree_days``: ``max(値 - base, 0) / 24`` の積算（℃・日）。``hours`` を指定した
+  場合は直近 ``hours`` 時間の積算、省略した場合は毎年 ``reset``（月-日）に0に戻す累計
+
+出力は ``output/rolling/<地点名>/YYYY.csv``（時刻と窓ごとの列）。
+"""
+
+import os
+import json
+import glob
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+from msm.fields import mask_r1h_sentinel
+from msm.journal import atomic_path
+
+DEFAULT_WINDOWS = {
+    'r1h_sum_24h': {'variable': 'r1h', 'stat': 'sum', 'hours': 24},
+    'r1h_sum_72h': {'variable': 'r1h', 'stat': 'sum', 'hours': 72},
+    'wind_speed_max_24h': {'variable': 'wind_speed', 'stat': 'max', 'hours': 24},
+    'pdd': {'variable': 'temp', 'stat': 'degree_days', 'base': 0.0, 'reset': '10-01'},
+}
+
+ROLLING_STATS = ['sum', 'mean', 'max', 'min', 'degree_days']
+
+HOUR = np.timedelta64(1, 'h')
+
+
+def _validate_windows(windows):
+    for name, spec in windows.items():
+        if spec.get('stat') not in ROLLING_STATS:
+            raise ValueError(f"窓 '{name}' の stat は {ROLLING_STATS} のいずれかを指定してください: {spec.get('stat')}")
+        if spec['stat'] != 'degree_days' and int(spec.get('hours', 0)) < 1:
+            raise ValueError(f"窓 '{name}' の hours を1以上で指定してください")
+
+
+def _season_start(hours, reset):
+    """各時刻（1970年からの時間数）が属する積算期間の開始年（reset の月日を年の区切りとする）"""
+    month, day = (int(v) for v in reset.split('-'))
+    times = hours.astype('datetime64[h]')
+    years = times.astype('datetime64[Y]').astype(np.int64) + 1970
+    reset_of_year = np.array([np.datetime64(f"{y:04d}-{month:02d}-{day:02d}T00", 'h') for y in np.unique(years)])
+    starts = dict(zip(np.unique(years), reset_of_year))
+    before_reset = times < np.array([starts[y] for y in years])
+    return years - before_reset.astype(np.int64)
+
+
+class RollingEngine:
+    """
+    移動窓の統計を時刻順に逐次計算するクラス
+
+    Parameters:
+    -----------
+    windows : dict
+        窓の名前 -> 設定（variable, stat, hours, min_periods, base, reset）
+    state : dict, optional
+        to_state で保存した状態（前回の続きから計算する）
+    """
+
+    def __init__(self, windows, state=None):
+        _validate_windows(windows)
+        self.windows = windows
+        # 変数ごとに保持する直前の値の数（その変数の最も長い窓 - 1）
+        self.tail_lengths = {}
+        for spec in windows.values():
+            if spec.get('hours') and spec['stat'] in ('sum', 'mean', 'degree_days'):
+                var = spec['variable']
+                self.tail_lengths[var] = max(self.tail_lengths.get(var, 0), int(spec['hours']) - 1)
+        self.last_hour = None
+        self.tails = {var: np.full(n, np.nan) for var, n in self.tail_lengths.items()}
+        self.deques = {name: deque() for name, spec in windows.items() if spec['stat'] in ('max', 'min')}
+        self.seasons = {name: [None, 0.0] for name, spec in windows.items()
+                        if spec['stat'] == 'degree_days' and not spec.get('hours')}
+        if state is not None:
+            self._load_state(state)
+
+    def _window_sums(self, values, length, min_periods):
+        """直前の値とつないだ累積和の差で、各時刻までの length 時間の合計と個数を求める"""
+        valid = ~np.isnan(values)
+        csum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        ccount = np.concatenate([[0], np.cumsum(valid)])
+        sums = csum[length:] - csum[:-length]
+        counts = ccount[length:] - ccount[:-length]
+        sums[counts < min_periods] = np.nan
+        return sums, counts
+
+    def update(self, hours, data):
+        """
+        新しい時刻の値を追加し、その時刻の窓の統計を返す
+
+        Parameters:
+        -----------
+        hours : numpy.ndarray
+            1970年からの時間数（昇順）。前回までの時刻以前のものは無視する
+        data : dict
+            変数名 -> hours と同じ長さの配列
+
+        Returns:
+        --------
+        pandas.DataFrame
+            時刻（入力にあった時刻だけ）と窓ごとの列
+        """
+        hours = np.asarray(hours, dtype=np.int64)
+        keep = np.ones(len(hours), dtype=bool) if self.last_hour is None else hours > self.last_hour
+        hours = hours[keep]
+        if len(hours) == 0:
+            return pd.DataFrame(columns=['time'] + list(self.windows))
+        hours, first = np.unique(hours, return_index=True)
+
+        # 欠けている時刻を欠損で埋めた1時間間隔の格子（窓の長さより長い空白は直前の値を捨てる）
+        start = hours[0] if self.last_hour is None else self.last_hour + 1
+        if hours[0] - start > max(self.tail_lengths.values(), default=0):
+            start = hours[0]
+            self.tails = {var: np.full(n, np.nan) for var, n in self.tail_lengths.items()}
+        grid = np.arange(start, hours[-1] + 1)
+        position = hours - start
+        columns = {}
+        for var in {spec['variable'] for spec in self.windows.values()}:
+            values = np.full(len(grid), np.nan)
+            values[position] = np.asarray(data[var], dtype=np.float64)[keep][first]
+            # r1h の特殊値（200）は欠損として扱う（特殊値処理前のCSVでも積算に含めない）
+            columns[var] = mask_r1h_sentinel(values) if var == 'r1h' else values
+
+        result = {'time': grid[position].astype('datetime64[h]')}
+        for name, spec in self.windows.items():
+            values = columns[spec['variable']]
+            stat = spec['stat']
+            if stat == 'degree_days':
+                increments = np.maximum(values - float(spec.get('base', 0.0)), 0.0) / 24.0
+                if spec.get('hours'):
+                    out = self._rolling_sum(spec, increments)
+                else:
+                    out = self._seasonal_sum(name, spec, grid, increments)
+            elif stat in ('sum', 'mean'):
+                out = self._rolling_sum(spec, values, mean=(stat == 'mean'))
+            else:
+                out = self._running_extreme(name, spec, grid, values, stat)
+            result[name] = out[position]
+
+        for var, n in self.tail_lengths.items():
+            if n:
+                self.tails[var] = np.concatenate([self.tails[var], columns[var]])[-n:]
+        self.last_hour = int(grid[-1])
+        return pd.DataFrame(result)
+
+    def _rolling_sum(self, spec, values, mean=False):
+        length = int(spec['hours'])
+        var = spec['variable']
+        tail = self.tails[var][len(self.tails[var]) - (length - 1):] if length > 1 else np.empty(0)
+        if spec['stat'] == 'degree_days':
+            tail = np.maximum(tail - float(spec.get('base', 0.0)), 0.0) / 24.0
+        sums, counts = self._window_sums(np.concatenate([tail, values]), length, int(spec.get('min_periods', 1)))
+        if mean:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return sums / counts
+        return sums
+
+    def _running_extreme(self, name, spec, grid, values, stat):
+        # 単調なdeque：先頭が窓の中の最大値（min の場合は最小値）
+        length = int(spec['hours'])
+        window = self.deques[name]
+        sign = 1.0 if stat == 'max' else -1.0
+        out = np.empty(len(grid))
+        for i, (hour, value) in enumerate(zip(grid.tolist(), (values * sign).tolist())):
+            while window and window[0][0] <= hour - length:
+                window.popleft()
+            if value == value:
+                while window and window[-1][1] <= value:
+                    window.pop()
+                window.append((hour, value))
+            out[i] = window[0][1] * sign if window else np.nan
+        return out
+
+    def _seasonal_sum(self, name, spec, grid, increments):
+        seasons = _season_start(grid, spec.get('reset', '10-01'))
+        increments = np.where(np.isnan(increments), 0.0, increments)
+        out = np.empty(len(grid))
+        season, total = self.seasons[name]
+        for key in np.unique(seasons):
+            mask = seasons == key
+            carry = total if season == int(key) else 0.0
+            out[mask] = carry + np.cumsum(increments[mask])
+            season, total = int(key), float(out[mask][-1])
+        self.seasons[name] = [season, total]
+        return out
+
+    def to_state(self):
+        """JSONに保存できる状態を返す"""
+        def listed(values):
+            return [None if np.isnan(v) else float(v) for v in values]
+
+        return {
+            'windows': self.windows,
+            'last_hour': self.last_hour,
+            'tails': {var: listed(values) for var, values in self.tails.items()},
+            'deques': {name: [[h, v] for h, v in window] for name, window in self.deques.items()},
+            'seasons': self.seasons,
+        }
+
+    def _load_state(self, state):
+        self.last_hour = state['last_hour']
+        for var, values in state['tails'].items():
+            self.tails[var] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        for name, items in state['deques'].items():
+            self.deques[name] = deque((int(h), float(v)) for h, v in items)
+        for name, value in state['seasons'].items():
+            self.seasons[name] = list(value)
+
+
+def _daily_files(csv_dir, target_name):
+    """地点の日別CSVファイルを (日付文字列, パス) の時刻順のリストで返す"""
+    files = glob.glob(os.path.join(csv_dir, target_name, '[0-9][0-9][0-9][0-9]', '*.csv'))
+    return sorted((os.path.splitext(os.path.basename(f))[0], f) for f in files)
+
+
+def _write_year(rolling_dir, year, df):
+    """年の出力ファイルに行を追加する（新しい行の時刻以降の既存の行は置き換える）"""
+    path = os.path.join(rolling_dir, f"{year}.csv")
+    if os.path.exists(path):
+        old = pd.read_csv(path, parse_dates=['time'])
+        old = old[old['time'] < df['time'].iloc[0]]
+        df = pd.concat([old, df], ignore_index=True)
+    with atomic_path(path) as tmp_path:
+        df.to_csv(tmp_path, index=False)
+
+
+def _source_stats(files):
+    """日付 -> [CSVのサイズ, 更新時刻 ns]"""
+    stats = {}
+    for date, path in files:
+        st = os.stat(path)
+        stats[date] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _save_json(path, data):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+
+
+def _restart_state(rolling_dir, all_files, state, verbose, target_name):
+    """
+    前回の処理後に再修正（または追加）された処理済みの日があれば、その年の初めの状態を返す
+
+    Returns:
+    --------
+    dict or None
+        計算を再開する状態（変更がなければ state のまま、年の初めの状態がなければ None）
+    """
+    last_date = state['last_date']
+    processed = [(date, path) for date, path in all_files if date <= last_date]
+    current = _source_stats(processed)
+    if 'sources' not in state:
+        # サイズと更新時刻を記録していない状態ファイルは現在のファイルを処理済みとみなす
+        state['sources'] = current
+        return state
+    changed = sorted(date for date, stat in current.items() if state['sources'].get(date) != stat)
+    if not changed:
+        return state
+
+    year = changed[0][:4]
+    snapshot = os.path.join(rolling_dir, f"start_{year}.json")
+    if not os.path.exists(snapshot):
+        if verbose:
+            print(f"地点 '{target_name}': 処理済みの日 {changed[0]} が変更されたため、最初から計算し直します")
+        return None
+    if verbose:
+        print(f"地点 '{target_name}': 処理済みの日 {changed[0]} が変更されたため、{year} 年から計算し直します")
+    with open(snapshot, 'r', encoding='utf-8') as f:
+        restart = json.load(f)
+    restart['sources'] = {date: stat for date, stat in state['sources'].items() if date < f"{year}0101"}
+    return restart
+
+
+def update_rolling(csv_dir, target_name, windows, rolling_dir, rebuild=False, verbose=True):
+    """
+    地点の移動窓の統計を前回の続きから計算して保存する
+
+    処理済みの日のCSVのサイズまたは更新時刻が変わっている場合（特殊値処理のやり直しなど）は、
+    最も早い変更日の年の初めの状態から計算し直す。
+
+    Parameters:
+    -----------
+    csv_dir : str
+        入力CSVのベースディレクトリ（通常は特殊値処理済みのディレクトリ）
+    target_name : str
+        地点名
+    windows : dict
+        窓の設定
+    rolling_dir : str
+        地点の出力ディレクトリ
+    rebuild : bool, default=False
+        Trueの場合は状態を捨てて最初から計算し直す
+
+    Returns:
+    --------
+    bool
+        成功した場合はTrue
+    """
+    try:
+        state_file = os.path.join(rolling_dir, 'state.json')
+        all_files = _daily_files(csv_dir, target_name)
+        state = None
+        recorded = None
+        if not rebuild and os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state['engine']['windows'] != windows:
+                print(f"窓の設定が変更されたため、地点 '{target_name}' を最初から計算し直します")
+                state = None
+            else:
+                recorded = 'sources' in state
+                state = _restart_state(rolling_dir, all_files, state, verbose, target_name)
+        if state is None and os.path.isdir(rolling_dir):
+            for name in os.listdir(rolling_dir):
+                if name.endswith('.csv') or (name.startswith('start_') and name.endswith('.json')):
+                    os.remove(os.path.join(rolling_dir, name))
+
+        engine = RollingEngine(windows, state['engine'] if state else None)
+        last_date = state['last_date'] if state else ''
+        sources = state['sources'] if state else {}
+        files = [(date, path) for date, path in all_files if date > last_date]
+        if not files:
+            if verbose:
+                print(f"地点 '{target_name}': 新しいファイルはありません（最終処理日: {last_date or 'なし'}）")
+            if recorded is False:
+                # サイズと更新時刻を記録していなかった状態ファイルに記録を追加する
+                _save_json(state_file, state)
+            return True
+
+        os.makedirs(rolling_dir, exist_ok=True)
+        variables = sorted({spec['variable'] for spec in windows.values()})
+        rows = 0
+        # 年ごとにまとめて計算し、年の出力と状態を保存する（中断しても年単位で再開できる）
+        for year in sorted({date[:4] for date, _ in files}):
+            if last_date[:4] < year:
+                # 年の初めの状態（再修正された日がある場合の計算の再開点）
+                _save_json(os.path.join(rolling_dir, f"start_{year}.json"),
+                           {'last_date': last_date, 'engine': engine.to_state()})
+            year_files = [(date, path) for date, path in files if date[:4] == year]
+            frame = pd.concat((pd.read_csv(path, usecols=['time'] + variables) for _, path in year_files),
+                              ignore_index=True)
+            times = pd.to_datetime(frame['time']).to_numpy().astype('datetime64[h]')
+            order = np.argsort(times, kind='stable')
+            hours = times[order].astype(np.int64)
+            result = engine.update(hours, {var: frame[var].to_numpy()[order] for var in variables})
+            if not result.empty:
+                _write_year(rolling_dir, year, result)
+                rows += len(result)
+            last_date = max(date for date, _ in year_files)
+            sources.update(_source_stats(year_files))
+            _save_json(state_file, {'last_date': last_date, 'engine': engine.to_state(), 'sources': sources})
+        if verbose:
+            print(f"地点 '{target_name}': {len(files)} ファイル, {rows} 時刻を追加しました ({rolling_dir})")
+        return True
+    except Exception as e:
+        print(f"エラー: 地点 '{target_name}' の移動窓の計算中に問題が発生しました: {e}")
+        return False
+
+
+def process_rolling(config_file, targets=None, rebuild=False):
+    """設定ファイルの地点の移動窓の統計を前回の続きから計算する"""
+    config = load_config(config_file)
+    return run_rolling(config, targets, rebuild)
+
+
+def run_rolling(config, targets=None, rebuild=False):
+    """設定（辞書）の地点の移動窓の統計を前回の続きから計算する"""
+    output_dir = config['output_directory']
+    csv_dir = config.get('input_csv_directory', os.path.join(output_dir, 'csv'))
+    windows = config.get('rolling_windows', DEFAULT_WINDOWS)
+    try:
+        _validate_windows(windows)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return False
+    results = [update_rolling(csv_dir, name, windows, os.path.join(output_dir, 'rolling', name), rebuild)
+               for name in (targets or config['targets'].keys())]
+    return all(results)
+
+
+def load_rolling(output_dir, target_name, start=None, end=None):
+    """保存した移動窓の統計を読み込む（時刻をインデックスとするDataFrame）"""
+    rolling_dir = os.path.join(output_dir, 'rolling', target_name)
+    files = sorted(glob.glob(os.path.join(rolling_dir, '[0-9][0-9][0-9][0-9].csv')))
+    if start:
+        files = [f for f in files if os.path.basename(f)[:4] >= str(start)[:4]]
+    if end:
+        files = [f for f in files if os.path.basename(f)[:4] <= str(end)[:4]]
+    if not files:
+        return pd.DataFrame()
+    df = pd.concat((pd.read_csv(f, parse_dates=['time']) for f in files), ignore_index=True).set_index('time')
+    return df.loc[start:end] if start or end else df
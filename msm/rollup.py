@@ -0,0 +1,368 @@
+"""結合可能な部分集計（日単位）による多解像度の集計
+
+地点ごと・日ごとに、合計・個数・最小・最大・U/V成分の合計・10度ごとの
+風向ビンの個数・晴れ/曇りの時間数を ``output/rollup/<地点名>/<年>.npz`` に
+保存する。月・季節・年・任意の期間の統計は、時別データを読み直さずに
+これらの部分集計を結合して求める（18年分でも日数に比例する計算量）。
+
+平均は「合計 / 個数」、ベクトル平均風向は「U, V の合計 / 個数」から求めるため、
+combine の日別・月別出力と同じ値になる（合計の順序による浮動小数点の丸め誤差のみ）。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from msm.config import load_config
+from msm.journal import atomic_path
+from msm.combine import MEAN_VARIABLES, SUM_VARIABLES, MAX_MIN_VARIABLES, compute_daily_statistics, compute_monthly_statistics
+
+# 風向ビンの数（10度ごと）
+DIRECTION_BINS = 36
+DIRECTION_COLUMNS = [f'dir_{i:02d}' for i in range(DIRECTION_BINS)]
+
+# --verify で combine の結果と一致とみなす最大相対誤差（合計の順序による丸め誤差を許容）
+VERIFY_TOLERANCE = 1e-9
+
+# 集計の単位
+FREQUENCIES = ['day', 'month', 'season', 'year', 'climatology']
+
+# 季節（12月は翌年の冬として扱う）
+SEASONS = {12: 'DJF', 1: 'DJF', 2: 'DJF', 3: 'MAM', 4: 'MAM', 5: 'MAM',
+           6: 'JJA', 7: 'JJA', 8: 'JJA', 9: 'SON', 10: 'SON', 11: 'SON'}
+
+
+def compute_daily_partials(all_data):
+    """
+    時別データから日ごとの部分集計を計算する
+
+    Returns:
+    --------
+    pandas.DataFrame
+        日付（datetime64）をインデックスとする部分集計
+    """
+    datetimes = pd.to_datetime(all_data['time'])
+    dates = datetimes.dt.normalize()
+    groups = all_data.groupby(dates.values)
+
+    partials = {}
+    for var in MEAN_VARIABLES + SUM_VARIABLES + ['u', 'v']:
+        if var in all_data.columns:
+            partials[f'{var}_sum'] = groups[var].sum()
+            partials[f'{var}_count'] = groups[var].count()
+    for var in MAX_MIN_VARIABLES:
+        if var in all_data.columns:
+            partials[f'{var}_max'] = groups[var].max()
+            partials[f'{var}_min'] = groups[var].min()
+
+    if 'wind_direction' in all_data.columns:
+        bins = np.floor(all_data['wind_direction'].to_numpy(dtype=np.float64) / 10)
+        onehot = (bins[:, None] == np.arange(DIRECTION_BINS)[None, :]).astype(np.int64)
+        direction_counts = pd.DataFrame(onehot, columns=DIRECTION_COLUMNS).groupby(dates.values).sum()
+        for column in DIRECTION_COLUMNS:
+            partials[column] = direction_counts[column]
+
+    if 'ncld' in all_data.columns:
+        partials['clear_hours'] = (all_data['ncld'] < 3).groupby(dates.values).sum()
+        partials['cloudy_hours'] = (all_data['ncld'] >= 7).groupby(dates.values).sum()
+
+    df = pd.DataFrame(partials)
+    df.index = pd.DatetimeIndex(df.index, name='date')
+    return df
+
+
+def _aggregation(columns):
+    """部分集計の列ごとの結合方法"""
+    how = {}
+    for column in columns:
+        if column.endswith('_max'):
+            how[column] = 'max'
+        elif column.endswith('_min'):
+            how[column] = 'min'
+        else:
+            how[column] = 'sum'
+    return how
+
+
+def merge_partials(partials, labels):
+    """部分集計をラベルごとに結合する（ラベルが同じ行の合計・最小・最大を取る）"""
+    merged = partials.groupby(labels).agg(_aggregation(partials.columns))
+    # 降水日数（日降水量1mm以上の日数）は日単位で判定してから数える
+    if 'r1h_sum' in partials.columns:
+        merged['precipitation_days'] = (partials['r1h_sum'] >= 1.0).groupby(labels).sum()
+    merged['days'] = partials.groupby(labels).size()
+    return merged
+
+
+def finalize_partials(merged):
+    """結合した部分集計から統計値（combine の出力と同じ列名）を計算する"""
+    stats = {}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for var in MEAN_VARIABLES:
+            if f'{var}_sum' in merged.columns:
+                stats[f'{var}_mean'] = merged[f'{var}_sum'] / merged[f'{var}_count'].where(merged[f'{var}_count'] > 0)
+        for var in SUM_VARIABLES:
+            if f'{var}_sum' in merged.columns:
+                stats[f'{var}_sum'] = merged[f'{var}_sum']
+        for var in MAX_MIN_VARIABLES:
+            if f'{var}_max' in merged.columns:
+                stats[f'{var}_max'] = merged[f'{var}_max']
+                stats[f'{var}_min'] = merged[f'{var}_min']
+
+        if all(column in merged.columns for column in DIRECTION_COLUMNS):
+            counts = merged[DIRECTION_COLUMNS].to_numpy()
+            # 同数の場合は小さい方のビン（combine の日別出力と同じ）
+            mode = np.where(counts.sum(axis=1) > 0, counts.argmax(axis=1) * 10 + 5.0, np.nan)
+            stats['wind_direction_mode'] = pd.Series(mode, index=merged.index)
+        if 'u_sum' in merged.columns and 'v_sum' in merged.columns:
+            u_mean = merged['u_sum'] / merged['u_count'].where(merged['u_count'] > 0)
+            v_mean = merged['v_sum'] / merged['v_count'].where(merged['v_count'] > 0)
+            stats['wind_direction_vector'] = (270 - np.degrees(np.arctan2(v_mean, u_mean))) % 360
+
+    if 'clear_hours' in merged.columns:
+        stats['clear_hours'] = merged['clear_hours']
+        stats['cloudy_hours'] = merged['cloudy_hours']
+    if 'precipitation_days' in merged.columns:
+        stats['precipitation_days'] = merged['precipitation_days']
+    stats['days'] = merged['days']
+    return pd.DataFrame(stats)
+
+
+def _partials_file(rollup_dir, target_name, year):
+    return os.path.join(rollup_dir, target_name, f"{year}.npz")
+
+
+# 部分集計の元になった日別CSVのサイズと更新時刻（再修正された日の検出用）
+SOURCE_KEYS = ['source_date', 'source_size', 'source_mtime_ns']
+
+
+def load_partials_year(rollup_dir, target_name, year):
+    """保存済みの1年分の部分集計を読み込む（ない場合はNone）"""
+    path = _partials_file(rollup_dir, target_name, year)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as npz:
+        columns = [name for name in npz.files if name != 'date' and name not in SOURCE_KEYS]
+        df = pd.DataFrame({name: npz[name] for name in columns},
+                          index=pd.DatetimeIndex(npz['date'], name='date'))
+    return df
+
+
+def load_partials_sources(rollup_dir, target_name, year):
+    """
+    1年分の部分集計の元になった日別CSVのサイズと更新時刻を読み込む
+
+    Returns:
+    --------
+    dict
+        日付（YYYYMMDD）をキー、(サイズ, 更新時刻 ns) を値とする辞書
+        （記録のない古い形式のファイルでは空）
+    """
+    path = _partials_file(rollup_dir, target_name, year)
+    if not os.path.exists(path):
+        return {}
+    with np.load(path, allow_pickle=False) as npz:
+        if not all(key in npz.files for key in SOURCE_KEYS):
+            return {}
+        return {str(date): (int(size), int(mtime))
+                for date, size, mtime in zip(npz['source_date'], npz['source_size'], npz['source_mtime_ns'])}
+
+
+def save_partials_year(rollup_dir, target_name, year, partials, sources=None):
+    """1年分の部分集計を（元のCSVのサイズと更新時刻とともに）保存する"""
+    path = _partials_file(rollup_dir, target_name, year)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {column: partials[column].to_numpy() for column in partials.columns}
+    if sources:
+        dates = sorted(sources)
+        arrays['source_date'] = np.array(dates)
+        arrays['source_size'] = np.array([sources[d][0] for d in dates], dtype=np.int64)
+        arrays['source_mtime_ns'] = np.array([sources[d][1] for d in dates], dtype=np.int64)
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, date=partials.index.values.astype('datetime64[D]'), **arrays)
+
+
+def update_partials(csv_dir, rollup_dir, target_name):
+    """
+    地点の抽出済みCSVのうち、部分集計がまだない日と、前回からサイズまたは
+    更新時刻が変わった日（再修正された日）だけを読み込んで部分集計を更新する
+
+    Returns:
+    --------
+    int
+        追加または再計算した日数
+    """
+    target_dir = os.path.join(csv_dir, target_name)
+    if not os.path.isdir(target_dir):
+        print(f"警告: 地点 '{target_name}' のデータディレクトリが見つかりません: {target_dir}")
+        return 0
+
+    updated = 0
+    for year in sorted(d for d in os.listdir(target_dir) if d.isdigit()):
+        year_dir = os.path.join(target_dir, year)
+        existing = load_partials_year(rollup_dir, target_name, year)
+        sources = load_partials_sources(rollup_dir, target_name, year) if existing is not None else {}
+
+        current = {}
+        for f in sorted(os.listdir(year_dir)):
+            if f.endswith('.csv'):
+                st = os.stat(os.path.join(year_dir, f))
+                current[f[:-4]] = (st.st_size, st.st_mtime_ns)
+        changed = [date for date, stat in current.items() if sources.get(date) != stat]
+        if not changed:
+            continue
+
+        new_data = pd.concat((pd.read_csv(os.path.join(year_dir, f"{date}.csv")) for date in changed),
+                             ignore_index=True)
+        partials = compute_daily_partials(new_data)
+        if existing is not None:
+            # 再計算した日の古い部分集計を置き換える
+            stale = existing.index.strftime('%Y%m%d').isin(changed)
+            partials = pd.concat([existing[~stale], partials]).sort_index()
+        sources.update({date: current[date] for date in changed})
+        save_partials_year(rollup_dir, target_name, year, partials, sources)
+        updated += len(changed)
+    return updated
+
+
+def load_partials(rollup_dir, target_name, start_date=None, end_date=None):
+    """期間内の部分集計を読み込んで連結する"""
+    target_dir = os.path.join(rollup_dir, target_name)
+    if not os.path.isdir(target_dir):
+        return None
+    start_year = int(start_date[:4]) if start_date else None
+    end_year = int(end_date[:4]) if end_date else None
+    frames = []
+    for name in sorted(os.listdir(target_dir)):
+        if not name.endswith('.npz') or not name[:-4].isdigit():
+            continue
+        year = int(name[:-4])
+        if (start_year is not None and year < start_year) or (end_year is not None and year > end_year):
+            continue
+        frames.append(load_partials_year(rollup_dir, target_name, year))
+    if not frames:
+        return None
+    partials = pd.concat(frames).sort_index()
+    return partials.loc[start_date:end_date]
+
+
+def period_labels(index, freq):
+    """日付のインデックスを集計単位のラベルに変換する"""
+    if freq == 'day':
+        return index.strftime('%Y-%m-%d')
+    if freq == 'month':
+        return index.strftime('%Y-%m')
+    if freq == 'season':
+        season_year = index.year + (index.month == 12)
+        seasons = index.month.map(SEASONS)
+        return pd.Index([f"{y}-{s}" for y, s in zip(season_year, seasons)])
+    if freq == 'year':
+        return index.strftime('%Y')
+    if freq == 'climatology':
+        return index.strftime('%m')
+    raise ValueError(f"集計単位は {', '.join(FREQUENCIES)} のいずれかを指定してください: {freq}")
+
+
+def rollup(partials, freq):
+    """部分集計を集計単位（day, month, season, year, climatology）ごとに結合して統計値を返す"""
+    labels = period_labels(partials.index, freq)
+    stats = finalize_partials(merge_partials(partials, labels))
+    if freq == 'day' and 'precipitation_days' in stats.columns:
+        # 日単位では combine の日別出力と同じく降水日の判定（True/False）にする
+        stats = stats.rename(columns={'precipitation_days': 'precipitation_day'})
+        stats['precipitation_day'] = stats['precipitation_day'] > 0
+    stats.index.name = {'climatology': 'month_of_year'}.get(freq, freq)
+    return stats
+
+
+def rollup_window(partials, start_date, end_date):
+    """任意の期間（両端を含む）の部分集計を結合して統計値（1行）を返す"""
+    window = partials.loc[start_date:end_date]
+    labels = pd.Index([f"{start_date}/{end_date}"] * len(window), name='window')
+    return finalize_partials(merge_partials(window, labels))
+
+
+def verify_against_combine(csv_dir, target_name, partials, start_date, end_date):
+    """
+    部分集計から求めた日別・月別統計を combine と同じ計算（時別データの再集計）と比較する
+
+    Returns:
+    --------
+    dict
+        列ごとの最大相対誤差（'daily' と 'monthly'）
+    """
+    from msm.query import SeriesStore
+    hourly = SeriesStore(csv_dir).get_series(target_name, start_date, end_date).reset_index()
+    hourly['time'] = hourly['time'].astype(str)
+    daily_df = compute_daily_statistics(hourly)
+    monthly_df = compute_monthly_statistics(hourly, daily_df)
+
+    window = partials.loc[start_date:end_date]
+    rolled = {'daily': rollup(window, 'day'), 'monthly': rollup(window, 'month')}
+    expected = {'daily': daily_df, 'monthly': monthly_df}
+    expected['daily'].index = expected['daily'].index.astype(str)
+    expected['monthly'].index = expected['monthly'].index.astype(str)
+
+    errors = {}
+    for key in ['daily', 'monthly']:
+        errors[key] = {}
+        for column in expected[key].columns:
+            if column not in rolled[key].columns:
+                continue
+            a = rolled[key][column].astype(np.float64)
+            b = expected[key][column].astype(np.float64).reindex(a.index)
+            scale = np.maximum(np.abs(b), 1e-300)
+            errors[key][column] = float(np.nanmax(np.abs(a - b) / scale)) if len(a) else 0.0
+    return errors
+
+
+def process_rollup(config_file, freqs=('month', 'season', 'year', 'climatology'), window=None, verify=False):
+    """設定ファイルに基づいて部分集計を更新し、集計単位ごとの統計をCSVに保存する"""
+    config = load_config(config_file)
+    targets = config['targets']
+    output_dir = config['output_directory']
+    csv_dir = config.get('input_csv_directory', os.path.join(output_dir, 'csv'))
+    rollup_dir = os.path.join(output_dir, 'rollup')
+    stats_dir = os.path.join(output_dir, 'statistics', 'rollup')
+    os.makedirs(stats_dir, exist_ok=True)
+
+    success_count = 0
+    verify_failed = False
+    for target_name in targets.keys():
+        added = update_partials(csv_dir, rollup_dir, target_name)
+        partials = load_partials(rollup_dir, target_name)
+        if partials is None or partials.empty:
+            print(f"警告: 地点 '{target_name}' の部分集計がありません")
+            continue
+        print(f"地点 '{target_name}': 部分集計 {len(partials)} 日 (今回追加・再計算: {added} 日)")
+
+        if window:
+            stats = rollup_window(partials, window[0], window[1])
+            out_file = os.path.join(stats_dir, f"{target_name}_{window[0].replace('-', '')}-{window[1].replace('-', '')}.csv")
+            with atomic_path(out_file) as tmp_path:
+                stats.to_csv(tmp_path)
+            print(f"期間統計を保存しました: {out_file}")
+        else:
+            for freq in freqs:
+                stats = rollup(partials, freq)
+                out_file = os.path.join(stats_dir, f"{target_name}_{freq}.csv")
+                with atomic_path(out_file) as tmp_path:
+                    stats.to_csv(tmp_path)
+                print(f"{freq} 統計を保存しました: {out_file}")
+
+        if verify:
+            start_date = config.get('combine_start_date', partials.index[0].strftime('%Y-%m-%d'))
+            end_date = config.get('combine_end_date', partials.index[-1].strftime('%Y-%m-%d'))
+            errors = verify_against_combine(csv_dir, target_name, partials, start_date, end_date)
+            for key, columns in errors.items():
+                worst = max(columns.values()) if columns else 0.0
+                print(f"検証 ({key}, {start_date} から {end_date}): 最大相対誤差 {worst:.3e}")
+                if worst > VERIFY_TOLERANCE:
+                    print(f"エラー: 地点 '{target_name}' の {key} 統計が combine の結果と一致しません "
+                          f"(許容誤差 {VERIFY_TOLERANCE:.0e})")
+                    verify_failed = True
+        success_count += 1
+
+    return success_count > 0 and not verify_failed
@@ -0,0 +1,159 @@
+"""抽出済みデータの問い合わせ用HTTPサービス（ローカル専用）
+
+``msm serve config.json`` で起動する。データは msm.query.SeriesStore の
+共有キャッシュから返すため、同じ地点・年への問い合わせはCSVを読み直さない。
+同じブロックへの同時リクエストは1回の読み込みに合流する。
+
+エンドポイント（すべてGET）:
+
+    /targets                                  地点名の一覧
+    /series?target=&start=&end=[&variables=temp,r1h][&resample=D]
+                                              時別データ（resample指定時は集計値）
+    /daily?target=&start=&end=[&columns=...]  日別統計（combine の日別出力と同じ列）
+    /monthly?target=&start=&end=[&columns=...]
+                                              月別統計（combine の月別出力と同じ列）
+    /stats                                    キャッシュの状態
+
+``format=arrow`` を指定すると Apache Arrow IPC ストリーム形式で返す
+（pyarrow が必要）。それ以外は JSON（pandas の orient='split' 形式）で返す。
+"""
+
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from msm.query import open_store
+
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+class QueryError(Exception):
+    """リクエストの内容が不正な場合の例外（HTTPステータスを持つ）"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _to_arrow(df):
+    """DataFrameをArrow IPCストリームのバイト列に変換する"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise QueryError(406, "format=arrow には pyarrow が必要です")
+    table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """問い合わせを処理するリクエストハンドラ（server.store を共有する）"""
+
+    server_version = 'MSMQuery/1.0'
+
+    def _param(self, params, name, required=True):
+        values = params.get(name)
+        if not values or values[0] == '':
+            if required:
+                raise QueryError(400, f"パラメータ '{name}' が必要です")
+            return None
+        return values[0]
+
+    def _list_param(self, params, name):
+        value = self._param(params, name, required=False)
+        return [v for v in value.split(',') if v] if value else None
+
+    def _target(self, params):
+        target = self._param(params, 'target')
+        if target.startswith('.') or os.sep in target or '/' in target:
+            raise QueryError(400, f"不正な地点名です: {target}")
+        if not os.path.isdir(os.path.join(self.server.store.csv_dir, target)):
+            raise QueryError(404, f"地点 '{target}' のデータが見つかりません")
+        return target
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, obj):
+        self._send(status, json.dumps(obj, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def _send_frame(self, df, params):
+        if self._param(params, 'format', required=False) == 'arrow':
+            self._send(200, _to_arrow(df), ARROW_CONTENT_TYPE)
+        else:
+            body = df.to_json(orient='split', date_format='iso', date_unit='s')
+            self._send(200, body.encode('utf-8'), 'application/json; charset=utf-8')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        store = self.server.store
+        try:
+            if url.path == '/targets':
+                targets = sorted(d for d in os.listdir(store.csv_dir)
+                                 if not d.startswith('.') and os.path.isdir(os.path.join(store.csv_dir, d)))
+                self._send_json(200, {'targets': targets})
+            elif url.path == '/series':
+                target = self._target(params)
+                df = store.get_series(target, self._param(params, 'start'), self._param(params, 'end'),
+                                      self._list_param(params, 'variables'),
+                                      self._param(params, 'resample', required=False))
+                self._send_frame(df, params)
+            elif url.path in ('/daily', '/monthly'):
+                target = self._target(params)
+                df = store.get_statistics(target, self._param(params, 'start'), self._param(params, 'end'),
+                                          url.path[1:], self._list_param(params, 'columns'))
+                self._send_frame(df, params)
+            elif url.path == '/stats':
+                self._send_json(200, store.cache_info())
+            else:
+                raise QueryError(404, f"不明なパス: {url.path}")
+        except QueryError as e:
+            self._send_json(e.status, {'error': str(e)})
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {'error': f"不正なリクエスト: {e}"})
+        except Exception as e:
+            self._send_json(500, {'error': f"問い合わせの処理中に問題が発生しました: {e}"})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(config_file, host='127.0.0.1', port=8000, verbose=False):
+    """設定ファイルのCSVディレクトリを対象とする問い合わせサーバーを作成する"""
+    server = ThreadingHTTPServer((host, port), QueryHandler)
+    server.daemon_threads = True
+    server.store = open_store(config_file)
+    server.verbose = verbose
+    return server
+
+
+def serve(config_file, host='127.0.0.1', port=8000, verbose=False):
+    """問い合わせサーバーを起動し、Ctrl+Cで停止するまで処理を続ける"""
+    server = create_server(config_file, host, port, verbose)
+    print(f"MSM問い合わせサーバーを起動しました: http://{host}:{server.server_address[1]}/ "
+          f"(データ: {server.store.csv_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nサーバーを停止します")
+    finally:
+        server.server_close()
+    return True
+
+
+def start_background_server(config_file, host='127.0.0.1', port=0):
+    """別スレッドでサーバーを起動する（負荷試験などで使用）。(server, thread) を返す"""
+    server = create_server(config_file, host, port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
@@ -0,0 +1,393 @@
+"""ダウンロードの試験用のアーカイブ代替サーバー（ローカル専用）
+
+``msm standin`` で起動し、京都大学生存圏研究所のアーカイブと同じ ``.../MSM-S/<年>/<MMDD>.nc``
+のURLでMSM-S形式のnetCDFファイルを返す。設定ファイルの ``archive_base_url`` をこのサーバーの
+URLにすると、ネットワークを使わずにダウンロード（並列数、再試行、続きからの受信）を試験できる::
+
+    msm standin --root ./standin --port 8080 --drop-rate 0.1 --error-rate 0.05 --bandwidth 20
+    "archive_base_url": "http://127.0.0.1:8080/MSM-S"
+
+ファイルは ``root/<年>/<MMDD>.nc`` にあればそれを返し、なければ日付から決まる乱数で生成して
+保存する（既存の ``output/netcdf`` を root に指定すれば実際のファイルを返せる）。
+障害は次のように注入する（乱数は seed で再現できる）:
+
+- latency: 応答を返すまでの待ち時間（秒）
+- bandwidth: 接続ごとの送信速度の上限（MB/s）
+- drop_rate: 本文の途中で接続を切る割合
+- error_rate: 503 を返す割合
+- ranges: Rangeリクエスト（206）に対応するかどうか
+
+``/stats`` でリクエスト数・送信バイト数・注入した障害の数をJSONで返す。
+"""
+
+import os
+import re
+import json
+import time
+import random
+import socket
+import threading
+from datetime import datetime, date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from msm.journal import atomic_path
+
+ARCHIVE_PATH = re.compile(r'/MSM-S/(\d{4})/(\d{2})(\d{2})\.nc$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# 生成するグリッド（lat は北から南、lon は西から東）
+GRIDS = {
+    # 北海道中央部（30 × 40、1ファイル約0.5MB）
+    'small': ((44.5, 0.05, 30), (142.0, 0.0625, 40)),
+    # MSM-Sと同じ範囲（505 × 481、1ファイル約140MB）
+    'full': ((47.6, 0.05, 505), (120.0, 0.0625, 481)),
+}
+
+# 生成する変数（平均、標準偏差、scale_factor、add_offset）。MSM-Sと同じく short 型で保存する。
+# scale_factor と add_offset は、値の範囲（下の clip の後）が ±32767 に収まるように選ぶ
+VARIABLES = {
+    'psea': (101000.0, 500.0, 1.0, 100000.0),
+    'sp': (95000.0, 500.0, 1.0, 95000.0),
+    'u': (0.0, 5.0, 0.006, 0.0),
+    'v': (0.0, 5.0, 0.006, 0.0),
+    'temp': (273.0, 8.0, 0.0018, 255.4),
+    'rh': (70.0, 15.0, 0.002, 50.0),
+    'r1h': (0.5, 1.0, 0.01, 0.0),
+    'ncld_upper': (30.0, 30.0, 0.002, 50.0),
+    'ncld_mid': (30.0, 30.0, 0.002, 50.0),
+    'ncld_low': (30.0, 30.0, 0.002, 50.0),
+    'ncld': (50.0, 40.0, 0.002, 50.0),
+    'dswrf': (200.0, 200.0, 0.04, 600.0),
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def generate_msm_file(path, day, grid='small'):
+    """
+    日付から決まる乱数でMSM-S形式のnetCDFファイルを作成する（同じ日付・グリッドなら同じ値）
+
+    Raises:
+    -------
+    ValueError
+        生成した値が変数の i2 のパッキングで表せない場合（ファイルは作成しない）
+    """
+    import numpy as np
+    import netCDF4 as nc
+
+    (lat0, dlat, nlat), (lon0, dlon, nlon) = GRIDS[grid]
+    rng = np.random.default_rng(int(day.strftime('%Y%m%d')))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with atomic_path(path) as tmp_path:
+        dataset = nc.Dataset(tmp_path, 'w', format='NETCDF3_CLASSIC')
+        try:
+            dataset.createDimension('lon', nlon)
+            dataset.createDimension('lat', nlat)
+            dataset.createDimension('time', 24)
+            lon = dataset.createVariable('lon', 'f4', ('lon',))
+            lon.units = 'degrees_east'
+            lon[:] = lon0 + dlon * np.arange(nlon)
+            lat = dataset.createVariable('lat', 'f4', ('lat',))
+            lat.units = 'degrees_north'
+            lat[:] = lat0 - dlat * np.arange(nlat)
+            time_var = dataset.createVariable('time', 'f4', ('time',))
+            time_var.units = day.strftime('hours since %Y-%m-%d 00:00:00+00:00')
+            time_var[:] = np.arange(24)
+            for name, (mean, std, scale_factor, add_offset) in VARIABLES.items():
+                var = dataset.createVariable(name, 'i2', ('time', 'lat', 'lon'))
+                var.scale_factor = scale_factor
+                var.add_offset = add_offset
+                values = mean + std * rng.standard_normal((24, nlat, nlon), dtype=np.float32)
+                if name == 'r1h':
+                    values = np.clip(values, 0, None)
+                    values[rng.random(values.shape) < 0.02] = 200
+                elif name in ('rh', 'ncld', 'ncld_upper', 'ncld_mid', 'ncld_low'):
+                    values = np.clip(values, 0, 100)
+                elif name == 'dswrf':
+                    values = np.clip(values, 0, 1300)
+                elif name == 'temp':
+                    values = np.clip(values, 200, 313)
+                # i2 に収まらない値は符号が反転するため、書き込んだ値が読み戻せることを確認する
+                if np.abs(values - add_offset).max() / scale_factor > 32767:
+                    raise ValueError(f"変数 '{name}' の値が i2（scale_factor={scale_factor}, "
+                                     f"add_offset={add_offset}）の範囲に収まりません")
+                var[:] = values
+                if not np.allclose(var[:], values, rtol=0, atol=scale_factor):
+                    raise ValueError(f"変数 '{name}' に書き込んだ値が読み戻せません")
+        finally:
+            dataset.close()
+    return path
+
+
+def parse_range(header, size):
+    """
+    Rangeヘッダー（単一の範囲のみ）を解釈する
+
+    Returns:
+    --------
+    tuple or None
+        (最初のバイト, 最後のバイト)。ヘッダーが解釈できない場合はNone（全体を返す）
+
+    Raises:
+    -------
+    ValueError
+        範囲がファイルの外にある場合（416を返す）
+    """
+    match = RANGE_HEADER.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(0, size - length), size - 1
+    first = int(first)
+    last = size - 1 if last == '' else min(int(last), size - 1)
+    if first >= size or first > last:
+        raise ValueError(header)
+    return first, last
+
+
+class ArchiveStandin:
+    """
+    アーカイブの代替のファイルの生成と障害の設定・集計（リクエストハンドラで共有する）
+
+    Parameters:
+    -----------
+    root : str
+        ファイルのディレクトリ（root/<年>/<MMDD>.nc）
+    grid : str, default='small'
+        生成するグリッド（GRIDS のキー）。None の場合は生成せず、root にないファイルは404
+    latency : float, default=0
+        応答までの待ち時間（秒）
+    bandwidth : float, optional
+        接続ごとの送信速度の上限（MB/s）
+    drop_rate, error_rate : float, default=0
+        本文の途中で接続を切る割合、503を返す割合
+    ranges : bool, default=True
+        Rangeリクエストに対応するかどうか（False の場合は常に全体を200で返す）
+    seed : int, default=0
+        障害を決める乱数のシード
+    """
+
+    def __init__(self, root, grid='small', latency=0.0, bandwidth=None, drop_rate=0.0, error_rate=0.0,
+                 ranges=True, seed=0):
+        if grid is not None and grid not in GRIDS:
+            raise ValueError(f"不明なグリッドです: {grid}（{list(GRIDS)}）")
+        self.root = root
+        self.grid = grid
+        self.latency = latency
+        self.bandwidth = bandwidth * 1024 ** 2 if bandwidth else None
+        self.drop_rate = drop_rate
+        self.error_rate = error_rate
+        self.ranges = ranges
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._file_locks = {}
+        self.stats = {'requests': 0, 'files': 0, 'partial': 0, 'not_found': 0, 'errors_injected': 0,
+                      'drops_injected': 0, 'bytes_sent': 0, 'generated': 0}
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def draw(self):
+        """このリクエストに注入する障害（'error'、'drop' またはNone）を決める"""
+        with self._lock:
+            x = self._rng.random()
+            if x < self.error_rate:
+                return 'error'
+            if x < self.error_rate + self.drop_rate:
+                return 'drop'
+            return None
+
+    def drop_point(self, length):
+        """接続を切るまでに送るバイト数"""
+        with self._lock:
+            return int(self._rng.random() * length)
+
+    def file_path(self, day):
+        return os.path.join(self.root, day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+
+    def ensure_file(self, day):
+        """日のファイルのパスを返す（なければ生成する。生成しない設定や未来の日付の場合はNone）"""
+        path = self.file_path(day)
+        if os.path.exists(path):
+            return path
+        if self.grid is None or day > date.today():
+            return None
+        with self._lock:
+            file_lock = self._file_locks.setdefault(path, threading.Lock())
+        # 同じファイルへの同時リクエストは1回の生成にまとめる
+        with file_lock:
+            if not os.path.exists(path):
+                generate_msm_file(path, day, self.grid)
+                self.count('generated')
+        return path
+
+    def prepare(self, days):
+        """試験の前にファイルを生成しておく（生成にかかる時間をスループットに含めないため）"""
+        for day in days:
+            self.ensure_file(day)
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """アーカイブと同じURLでファイルを返すリクエストハンドラ（server.standin を共有する）"""
+
+    server_version = 'MSMStandin/1.0'
+
+    def _send_status(self, status, message, headers=None):
+        body = (message + '\n').encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_body(self, path, first, length, drop_after):
+        """ファイルの範囲を送る（drop_after バイトで接続を切った場合はFalse）"""
+        standin = self.server.standin
+        sent = 0
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            f.seek(first)
+            while sent < length:
+                size = min(CHUNK_SIZE, length - sent)
+                if drop_after is not None:
+                    size = min(size, drop_after - sent)
+                    if size <= 0:
+                        # Content-Length より前に接続を切る
+                        standin.count('drops_injected')
+                        self.close_connection = True
+                        self.wfile.flush()
+                        try:
+                            self.connection.shutdown(socket.SHUT_RDWR)
+                        except OSError:
+                            pass
+                        return False
+                chunk = f.read(size)
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                standin.count('bytes_sent', len(chunk))
+                if standin.bandwidth:
+                    wait = sent / standin.bandwidth - (time.perf_counter() - started)
+                    if wait > 0:
+                        time.sleep(wait)
+        return True
+
+    def _handle(self):
+        standin = self.server.standin
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            body = json.dumps(standin.stats).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        standin.count('requests')
+        match = ARCHIVE_PATH.search(url.path)
+        try:
+            day = datetime.strptime(''.join(match.groups()), '%Y%m%d').date() if match else None
+        except ValueError:
+            day = None
+        path = standin.ensure_file(day) if day is not None else None
+        if path is None:
+            standin.count('not_found')
+            self._send_status(404, f"ファイルがありません: {url.path}")
+            return
+
+        if standin.latency:
+            time.sleep(standin.latency)
+        fault = standin.draw()
+        if fault == 'error':
+            standin.count('errors_injected')
+            self._send_status(503, "一時的に利用できません（注入したエラー）", {'Retry-After': '1'})
+            return
+
+        size = os.path.getsize(path)
+        try:
+            byte_range = parse_range(self.headers.get('Range'), size) if standin.ranges else None
+        except ValueError:
+            self._send_status(416, "範囲が不正です", {'Content-Range': f"bytes */{size}"})
+            return
+        first, last = byte_range if byte_range else (0, size - 1)
+        length = last - first + 1
+        if byte_range:
+            standin.count('partial')
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {first}-{last}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/x-netcdf')
+        self.send_header('Content-Length', str(length))
+        if standin.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        drop_after = standin.drop_point(length) if fault == 'drop' else None
+        try:
+            if self._send_body(path, first, length, drop_after):
+                standin.count('files')
+        except OSError:
+            # クライアントが切断した場合
+            self.close_connection = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_HEAD(self):
+        self._handle()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def create_standin(root, host='127.0.0.1', port=8080, verbose=False, **options):
+    """アーカイブの代替サーバーを作成する（options は ArchiveStandin の引数）"""
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.standin = ArchiveStandin(root, **options)
+    server.verbose = verbose
+    return server
+
+
+def standin_base_url(server):
+    """サーバーの archive_base_url に指定するURL"""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/MSM-S"
+
+
+def serve_standin(root, host='127.0.0.1', port=8080, verbose=False, **options):
+    """アーカイブの代替サーバーを起動し、Ctrl+Cで停止するまで処理を続ける"""
+    try:
+        server = create_standin(root, host, port, verbose, **options)
+    except Exception as e:
+        print(f"エラー: 代替サーバーを起動できませんでした: {e}")
+        return False
+    print(f"アーカイブの代替サーバーを起動しました: {standin_base_url(server)} (ファイル: {root})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nサーバーを停止します")
+    finally:
+        server.server_close()
+    return True
+
+
+def start_background_standin(root, host='127.0.0.1', port=0, **options):
+    """別スレッドで代替サーバーを起動する（負荷試験などで使用）。(server, thread) を返す"""
+    server = create_standin(root, host, port, **options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
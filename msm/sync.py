@@ -0,0 +1,156 @@
+"""状態ファイルに基づく差分同期（cron向け）
+
+処理する日がない場合にすぐ終了できるよう、netCDF4 / pandas は
+実際に処理する段階になってから読み込む。
+"""
+
+import os
+import json
+from datetime import datetime, timedelta, timezone
+
+from msm.config import load_config
+from msm.download import msm_file_url, download_msm_file, archive_base_url, download_settings
+from msm.journal import atomic_path, compact_journal, fix_journal_directory, journal_directory, RunJournal
+
+# 同期処理の段階（前の段階が完了した日までを次の段階で処理する）
+SYNC_STAGES = ['download', 'extract', 'clean', 'aggregate']
+
+def load_sync_state(state_file):
+    """同期処理の状態ファイル（各段階の最終処理日）を読み込む"""
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_sync_state(state_file, state):
+    """同期処理の状態ファイルを保存する。中断しても壊れないよう一時ファイル経由で置き換える"""
+    with atomic_path(state_file) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=4)
+
+def process_sync(config_file):
+    """状態ファイルに基づいて未処理の日だけをダウンロード・抽出・特殊値処理・集計する（cron向け）"""
+    config = load_config(config_file)
+
+    targets = config['targets']
+    output_dir = config['output_directory']
+    skip_existing = config.get('skip_existing_files', True)
+
+    save_dir = os.path.join(output_dir, 'netcdf')
+    csv_dir = os.path.join(output_dir, 'csv')
+    fixed_dir = config.get('input_csv_directory', csv_dir)
+    stats_dir = os.path.join(output_dir, 'statistics')
+    fix_method = config.get('fix_method', 'nan')
+    base_url = archive_base_url(config)
+    download_options = download_settings(config)
+
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    state_file = os.path.join(output_dir, 'sync_state.json')
+    state = load_sync_state(state_file)
+    journal = RunJournal(journal_directory(config))
+    fix_journal = RunJournal(fix_journal_directory(fixed_dir))
+
+    # 状態ファイルがない段階は sync_start_date（未指定なら download_end_date の翌日）から始める
+    if 'sync_start_date' in config:
+        initial_date = datetime.strptime(config['sync_start_date'], '%Y-%m-%d').date()
+    else:
+        initial_date = datetime.strptime(config['download_end_date'], '%Y-%m-%d').date() + timedelta(days=1)
+
+    # 公開までの遅れを考慮し、UTCの今日から sync_lag_days 日前までを対象とする
+    end_date = datetime.now(timezone.utc).date() - timedelta(days=config.get('sync_lag_days', 1))
+
+    def last_done(stage):
+        if stage in state:
+            return datetime.strptime(state[stage], '%Y-%m-%d').date()
+        return initial_date - timedelta(days=1)
+
+    def pending_days(stage, limit):
+        day = last_done(stage) + timedelta(days=1)
+        days = []
+        while day <= limit:
+            days.append(day)
+            day += timedelta(days=1)
+        return days
+
+    def nc_path(day):
+        return os.path.join(save_dir, day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+
+    def csv_path(base_dir, target_name, day):
+        return os.path.join(base_dir, target_name, day.strftime('%Y'), f"{day.strftime('%Y%m%d')}.csv")
+
+    def download_day(day):
+        output_path = nc_path(day)
+        if skip_existing and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return True
+        year_dir = os.path.dirname(output_path)
+        if not os.path.exists(year_dir):
+            os.makedirs(year_dir)
+        print(f"ダウンロード中: {msm_file_url(day, base_url)}")
+        if not download_msm_file(msm_file_url(day, base_url), output_path, **download_options):
+            return False
+        journal.record('download', day.isoformat(), output_path)
+        return True
+
+    def extract_day(day):
+        from msm.derived import derived_settings
+        from msm.extract import extract_msm_data_to_csv, find_missing_targets
+        from msm.panel import open_panel_writer
+        derived_variables, derived_parameters = derived_settings(config)
+        missing = find_missing_targets(nc_path(day), targets, csv_dir) if skip_existing else targets
+        return not missing or extract_msm_data_to_csv(nc_path(day), missing, csv_dir, journal,
+                                                      derived_variables=derived_variables,
+                                                      derived_parameters=derived_parameters,
+                                                      panel=open_panel_writer(config))
+
+    def clean_day(day):
+        # 特殊値処理の出力先が設定されていない場合は何もしない
+        if os.path.abspath(fixed_dir) == os.path.abspath(csv_dir):
+            return True
+        from msm.fix import process_r1h_timeseries
+        for name in targets.keys():
+            fixed_file = csv_path(fixed_dir, name, day)
+            if not process_r1h_timeseries(csv_path(csv_dir, name, day), fixed_file, fix_method, verbose=False):
+                return False
+            fix_journal.record('fix', fixed_file, fixed_file, source=csv_path(csv_dir, name, day), method=fix_method)
+        return True
+
+    def run_stage(stage, limit, process_day):
+        days = pending_days(stage, limit)
+        processed = 0
+        for day in days:
+            if not process_day(day):
+                # 未公開の日や失敗した日以降は次回の同期で再試行する
+                print(f"{stage}: {day.isoformat()} の処理に失敗したため中断します")
+                break
+            state[stage] = day.isoformat()
+            save_sync_state(state_file, state)
+            processed += 1
+        print(f"- {stage}: {processed} 日処理 (最終処理日: {last_done(stage).isoformat()})")
+
+    print(f"同期処理を開始します (対象期間の終了日: {end_date.isoformat()})")
+    run_stage('download', end_date, download_day)
+    run_stage('extract', last_done('download'), extract_day)
+    run_stage('clean', last_done('extract'), clean_day)
+
+    # 集計は月単位で再計算するため、未集計の日をまとめて処理する
+    days = pending_days('aggregate', last_done('clean'))
+    if days:
+        from msm.combine import update_aggregates
+        if all([update_aggregates(fixed_dir, name, days, stats_dir) for name in targets.keys()]):
+            state['aggregate'] = days[-1].isoformat()
+            save_sync_state(state_file, state)
+        else:
+            print("aggregate: 集計に失敗した地点があるため、次回の同期で再試行します")
+    print(f"- aggregate: {len(days)} 日処理 (最終処理日: {last_done('aggregate').isoformat()})")
+
+    # 移動窓の統計は地点ごとの状態から続きを計算する（rolling_windows を指定した場合）
+    if config.get('rolling_windows') and days:
+        from msm.rolling import run_rolling
+        run_rolling(config)
+
+    # 同期のたびにファイルが増えないよう、プロセスごとのジャーナルをまとめる
+    for run_journal in (journal, fix_journal):
+        run_journal.close()
+        compact_journal(run_journal.journal_dir, verbose=False)
+    return True
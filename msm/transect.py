@@ -0,0 +1,219 @@
+"""測線（2地点を結ぶ線上の断面）の抽出
+
+設定ファイルの ``transects`` に始点・終点と間隔を指定すると、線上の N 点を
+最も近いグリッドで抽出し、変数ごとに (時刻 × 距離) の2次元配列として
+1日1ファイル（``output/transect/<測線名>/YYYY/YYYYMMDD.npz``）に保存する。
+
+各変数は測線を囲む範囲を1回だけ読み込み（ハイパースラブ）、配列の添字で
+N 点をまとめて取り出すため、数百点の断面でも地点1つとほぼ同じ時間で抽出でき、
+点ごとのディレクトリも作られない::
+
+    "transects": {
+        "asahikawa_yukikabe": {
+            "start": "asahikawa",
+            "end": {"latitude": 43.5789, "longitude": 144.5288},
+            "spacing_km": 2.0
+        }
+    }
+
+始点・終点は ``targets`` の地点名または緯度・経度で指定する。``spacing_km`` の
+代わりに ``points``（点の数）も指定できる。
+"""
+
+import os
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from msm.fields import read_field, wind_direction, wind_speed
+from msm.journal import atomic_path
+
+# 抽出する変数（extract と同じ。温度は摂氏に変換する）
+TRANSECT_VARIABLES = ['psea', 'sp', 'u', 'v', 'temp', 'rh', 'r1h', 'ncld', 'dswrf']
+
+# 地球の半径（km）
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """2点間の大円距離（km）"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lon2 - lon1)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def _endpoint(value, targets):
+    if isinstance(value, str):
+        if value not in targets:
+            raise ValueError(f"測線の端点の地点名が targets にありません: {value}")
+        value = targets[value]
+    return float(value['latitude']), float(value['longitude'])
+
+
+def resolve_transects(config):
+    """設定ファイルの transects の端点の地点名を緯度・経度に置き換えて返す"""
+    targets = config.get('targets', {})
+    resolved = {}
+    for name, transect in config.get('transects', {}).items():
+        item = dict(transect)
+        for key in ['start', 'end']:
+            lat, lon = _endpoint(transect[key], targets)
+            item[key] = {'latitude': lat, 'longitude': lon}
+        resolved[name] = item
+    return resolved
+
+
+def transect_points(transect, targets=None):
+    """
+    測線の始点から終点までの点の緯度・経度と始点からの距離を返す
+
+    短い測線（数百km以内）を想定し、緯度・経度を線形に内挿する。
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (緯度, 経度, 始点からの距離[km])
+    """
+    lat0, lon0 = _endpoint(transect['start'], targets or {})
+    lat1, lon1 = _endpoint(transect['end'], targets or {})
+    length = float(haversine_km(lat0, lon0, lat1, lon1))
+    if 'points' in transect:
+        n = int(transect['points'])
+    else:
+        n = int(math.floor(length / float(transect.get('spacing_km', 5.0)))) + 1
+    n = max(n, 2)
+    fraction = np.linspace(0.0, 1.0, n)
+    return lat0 + (lat1 - lat0) * fraction, lon0 + (lon1 - lon0) * fraction, length * fraction
+
+
+def transect_file(transect_dir, name, nc_file):
+    """netCDFファイル（YYYY/MMDD.nc）に対応する測線ファイル（YYYY/YYYYMMDD.npz）のパスを返す"""
+    year_str = os.path.basename(os.path.dirname(nc_file))
+    date_str = os.path.splitext(os.path.basename(nc_file))[0]
+    return os.path.join(transect_dir, name, year_str, f"{year_str}{date_str}.npz")
+
+
+def find_missing_transects(nc_file, transects, transect_dir):
+    """netCDFファイルについて、まだ抽出されていない測線だけを返す"""
+    return {name: transect for name, transect in transects.items()
+            if not os.path.exists(transect_file(transect_dir, name, nc_file))}
+
+
+def write_transects(dataset, nc_file, transects, transect_dir, time_values, journal=None):
+    """
+    開いているnetCDFファイルから測線を抽出して保存する
+
+    Parameters:
+    -----------
+    dataset : netCDF4.Dataset
+        開いているnetCDFファイル
+    nc_file : str
+        netCDFファイルのパス（出力ファイル名に使用）
+    transects : dict
+        抽出する測線の設定（resolve_transects で端点を緯度・経度にしたもの）
+    transect_dir : str
+        出力先のディレクトリ
+    time_values : array-like
+        時刻（extract で変換済みのもの）
+    journal : msm.journal.RunJournal, default=None
+        完了した測線・日を記録するジャーナル
+    """
+    lats = np.asarray(dataset.variables['lat'][:])
+    lons = np.asarray(dataset.variables['lon'][:])
+    times = np.array([str(t) for t in time_values])
+
+    for name, transect in transects.items():
+        point_lats, point_lons, distance = transect_points(transect)
+        # 各点の最も近いグリッドの添字（extract と同じ方法）
+        lat_idx = np.abs(lats[None, :] - point_lats[:, None]).argmin(axis=1)
+        lon_idx = np.abs(lons[None, :] - point_lons[:, None]).argmin(axis=1)
+        lat_slice = slice(lat_idx.min(), lat_idx.max() + 1)
+        lon_slice = slice(lon_idx.min(), lon_idx.max() + 1)
+
+        arrays = {
+            'time': times,
+            'distance_km': distance,
+            'latitude': point_lats,
+            'longitude': point_lons,
+            'grid_latitude': lats[lat_idx],
+            'grid_longitude': lons[lon_idx],
+        }
+        for var_name in TRANSECT_VARIABLES:
+            try:
+                # 測線を囲む範囲を1回で読み込み、添字で全点を取り出す（時刻 × 距離）
+                # r1h の特殊値は地点のCSVと同じく残す
+                block = read_field(dataset, var_name, (lat_slice, lon_slice), np.float64, mask_sentinel=False)
+                values = block[:, lat_idx - lat_slice.start, lon_idx - lon_slice.start]
+                arrays[var_name] = values.astype(np.float32)
+            except Exception as e:
+                print(f"警告: 測線 '{name}' の変数 '{var_name}' の抽出中にエラーが発生しました: {e}")
+                arrays[var_name] = np.full((len(times), len(distance)), np.nan, dtype=np.float32)
+
+        u = arrays['u'].astype(np.float64)
+        v = arrays['v'].astype(np.float64)
+        arrays['wind_direction'] = wind_direction(u, v).astype(np.float32)
+        arrays['wind_speed'] = wind_speed(u, v).astype(np.float32)
+
+        path = transect_file(transect_dir, name, nc_file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+        if journal is not None:
+            journal.record('transect', f"{name}/{os.path.basename(path)[:-4]}", path)
+        print(f"測線を保存しました: {path} ({len(distance)} 点, {distance[-1]:.1f} km)")
+
+
+def load_transect(transect_dir, name, start_date, end_date, variables=None):
+    """
+    期間内の測線の日ファイルを連結して読み込む
+
+    Returns:
+    --------
+    dict
+        'time'（datetime64）, 'distance_km', 'grid_latitude', 'grid_longitude' と
+        変数ごとの (時刻 × 距離) の配列
+    """
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d')
+    parts = []
+    current = start_dt
+    while current <= end_dt:
+        path = os.path.join(transect_dir, name, current.strftime('%Y'), f"{current.strftime('%Y%m%d')}.npz")
+        if os.path.exists(path):
+            with np.load(path, allow_pickle=False) as npz:
+                parts.append({key: npz[key] for key in npz.files})
+        current += timedelta(days=1)
+    if not parts:
+        return None
+
+    names = variables or TRANSECT_VARIABLES + ['wind_direction', 'wind_speed']
+    result = {key: parts[0][key] for key in ['distance_km', 'grid_latitude', 'grid_longitude']}
+    result['time'] = np.concatenate([part['time'] for part in parts]).astype('datetime64[s]')
+    for var_name in names:
+        result[var_name] = np.concatenate([part[var_name] for part in parts], axis=0)
+    return result
+
+
+def export_transect(config_file, name, variable, start_date, end_date, output_file=None):
+    """測線の1変数を (時刻 × 距離) の表としてCSVに出力する"""
+    import pandas as pd
+    from msm.config import load_config
+
+    config = load_config(config_file)
+    transect_dir = os.path.join(config['output_directory'], 'transect')
+    data = load_transect(transect_dir, name, start_date, end_date, [variable])
+    if data is None:
+        print(f"エラー: 測線 '{name}' の期間 {start_date} から {end_date} のデータが見つかりません")
+        return False
+    df = pd.DataFrame(data[variable], index=pd.DatetimeIndex(data['time'], name='time'),
+                      columns=[f"{d:.2f}" for d in data['distance_km']])
+    if output_file is None:
+        output_file = os.path.join(transect_dir, f"{name}_{variable}_{start_date.replace('-', '')}-{end_date.replace('-', '')}.csv")
+    with atomic_path(output_file) as tmp_path:
+        df.to_csv(tmp_path)
+    print(f"測線 '{name}' の {variable} を保存しました: {output_file} ({df.shape[0]} 時刻 × {df.shape[1]} 点)")
+    return True
@@ -0,0 +1,400 @@
+"""共有ファイルシステム上の作業キューによる複数ホストでの分担処理
+
+長期間のダウンロード・抽出・特殊値処理を、NFS などを共有する複数のホストの
+``msm worker`` プロセスで分担する。作業（日の範囲）は1つずつJSONファイルで、
+状態ごとのディレクトリ間の ``os.rename``（同じファイルシステム内では不可分）
+で受け渡すため、同じ作業を2つのワーカーが同時に取得することはない::
+
+    queue/
+    ├── pending/   未処理の作業
+    ├── leased/    処理中の作業（ファイルの更新時刻をハートビートとして更新）
+    ├── done/      完了した作業
+    └── failed/    max_attempts 回失敗した作業
+
+ハートビートが lease_timeout 秒以上途絶えた作業は、停止したワーカーのものとみなして
+pending/ に戻し、別のワーカーが取得し直す。各段階は既存のファイルをスキップするため、
+同じ日を2回処理しても結果は変わらない。
+
+leased/ の作業ファイルを書き換える・移す処理（取得・回収・完了）は、まずファイルを
+プロセスごとの一意な名前（``<作業名>.<ホスト名>.<pid>.<スレッド>.<操作>``）に rename して
+自分だけが持つ状態にし、内容（取得ごとの ``lease_id``）と更新時刻を確認してから移す。
+確認の前に別のワーカーが回収・取得し直していた場合は元に戻すため、回収した作業を
+元のワーカーが done/ に移したり、新しく取得された作業を回収したりすることはない。
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from msm.config import load_config
+from msm.journal import atomic_path, fix_journal_directory, journal_directory, RunJournal
+
+QUEUE_STATES = ['pending', 'leased', 'done', 'failed']
+
+# デフォルトの設定
+DEFAULT_CHUNK_DAYS = 7
+DEFAULT_LEASE_TIMEOUT = 600
+DEFAULT_HEARTBEAT = 30
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def queue_directory(config):
+    """設定ファイルから作業キューのディレクトリを返す（省略時は output_directory/queue）"""
+    return config.get('queue_directory', os.path.join(config['output_directory'], 'queue'))
+
+
+def _state_dir(queue_dir, state):
+    return os.path.join(queue_dir, state)
+
+
+def _write_task(path, task):
+    """作業ファイルを一時ファイル経由で書き込む"""
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(task, f, ensure_ascii=False, indent=4)
+
+
+def _read_task(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _private_path(path, operation):
+    """作業ファイルを一時的に自分だけが持つためのパス（*.json に一致しないので他のワーカーからは見えない）"""
+    return f"{path}.{socket.gethostname()}.{os.getpid()}.{threading.get_ident()}.{operation}"
+
+
+def _task_files(queue_dir, state):
+    directory = _state_dir(queue_dir, state)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+
+
+def init_queue(queue_dir, start_date, end_date, chunk_days=DEFAULT_CHUNK_DAYS):
+    """
+    期間を chunk_days 日ごとの作業に分けてキューに登録する。すでにいずれかの状態にある作業は登録しない
+
+    Returns:
+    --------
+    int
+        新しく登録した作業の数
+    """
+    for state in QUEUE_STATES:
+        os.makedirs(_state_dir(queue_dir, state), exist_ok=True)
+    existing = set()
+    for state in QUEUE_STATES:
+        existing.update(_task_files(queue_dir, state))
+
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d').date()
+    added = 0
+    current = start_dt
+    while current <= end_dt:
+        last = min(current + timedelta(days=chunk_days - 1), end_dt)
+        name = f"{current.strftime('%Y%m%d')}-{last.strftime('%Y%m%d')}.json"
+        if name not in existing:
+            task = {'start': current.isoformat(), 'end': last.isoformat(), 'attempts': 0}
+            _write_task(os.path.join(_state_dir(queue_dir, 'pending'), name), task)
+            added += 1
+        current = last + timedelta(days=1)
+    return added
+
+
+def queue_status(queue_dir):
+    """状態ごとの作業数を返す"""
+    return {state: len(_task_files(queue_dir, state)) for state in QUEUE_STATES}
+
+
+def reclaim_stale_leases(queue_dir, lease_timeout=DEFAULT_LEASE_TIMEOUT, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """
+    ハートビートが lease_timeout 秒以上途絶えた作業を pending/ に戻す
+    （max_attempts 回に達した作業は failed/ に移す）
+
+    Returns:
+    --------
+    int
+        戻した作業の数
+    """
+    reclaimed = 0
+    for name in _task_files(queue_dir, 'leased'):
+        path = os.path.join(_state_dir(queue_dir, 'leased'), name)
+        try:
+            if time.time() - os.stat(path).st_mtime < lease_timeout:
+                continue
+            lease_id = _read_task(path).get('lease_id')
+            # 判定と移動の間に作業が回収・取得し直されても取り違えないよう、先に自分だけの名前に移す
+            private = _private_path(path, 'reclaim')
+            os.rename(path, private)
+        except (FileNotFoundError, ValueError):
+            # 他のワーカーが完了・回収した直後、または書き込み中
+            continue
+        task = _read_task(private)
+        if task.get('lease_id') != lease_id or time.time() - os.stat(private).st_mtime < lease_timeout:
+            # 確認の間に取得し直された作業（leased/ の同じ名前のファイルは他にないため、そのまま戻せる）
+            os.rename(private, path)
+            continue
+        destination = 'failed' if task.get('attempts', 0) >= max_attempts else 'pending'
+        os.rename(private, os.path.join(_state_dir(queue_dir, destination), name))
+        print(f"停止したワーカーの作業を回収しました: {name} (ワーカー: {task.get('owner')}) -> {destination}")
+        reclaimed += 1
+    return reclaimed
+
+
+class Lease:
+    """取得した作業。処理中はハートビートのスレッドがファイルの更新時刻を更新する"""
+
+    def __init__(self, queue_dir, name, task, heartbeat=DEFAULT_HEARTBEAT):
+        self.queue_dir = queue_dir
+        self.name = name
+        self.task = task
+        self.path = os.path.join(_state_dir(queue_dir, 'leased'), name)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, args=(heartbeat,), daemon=True)
+
+    def _beat(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                os.utime(self.path)
+            except FileNotFoundError:
+                # 他のワーカーが確認のために一時的に移しているか、回収された。処理は続け、完了時に判定する
+                pass
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _move(self, state, update=None, retries=5):
+        """
+        自分の作業（lease_id が同じもの）だけを state に移す。回収されて別のワーカーが
+        取得し直した作業には触れない
+
+        Returns:
+        --------
+        str or None
+            移した先のパス（回収されていた場合は None）
+        """
+        private = _private_path(self.path, state)
+        for attempt in range(retries):
+            try:
+                os.rename(self.path, private)
+                break
+            except FileNotFoundError:
+                # 他のワーカーが回収の確認のために一時的に移している可能性がある
+                time.sleep(0.1 * (attempt + 1))
+        else:
+            print(f"警告: 作業 {self.name} は処理中に回収されました（結果は同じため問題ありません）")
+            return None
+        if _read_task(private).get('lease_id') != self.task.get('lease_id'):
+            os.rename(private, self.path)
+            print(f"警告: 作業 {self.name} は処理中に回収され、別のワーカーが処理しています")
+            return None
+        if update:
+            self.task.update(update)
+            _write_task(private, self.task)
+        destination = os.path.join(_state_dir(self.queue_dir, state), self.name)
+        os.rename(private, destination)
+        return destination
+
+    def complete(self):
+        """作業を done/ に移す"""
+        return self._move('done', {'finished': datetime.now().isoformat(timespec='seconds')}) is not None
+
+    def release(self, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """失敗した作業を pending/ に戻す（max_attempts 回に達した場合は failed/ に移す）"""
+        return self._move('failed' if self.task['attempts'] >= max_attempts else 'pending') is not None
+
+
+def claim_task(queue_dir, worker_id, heartbeat=DEFAULT_HEARTBEAT):
+    """
+    pending/ の作業を1つ取得する（rename に成功したワーカーだけが取得できる）
+
+    Returns:
+    --------
+    Lease or None
+        取得した作業（未処理の作業がない場合は None）
+    """
+    for name in _task_files(queue_dir, 'pending'):
+        source = os.path.join(_state_dir(queue_dir, 'pending'), name)
+        destination = os.path.join(_state_dir(queue_dir, 'leased'), name)
+        private = _private_path(destination, 'claim')
+        try:
+            os.rename(source, private)
+        except FileNotFoundError:
+            # 他のワーカーが先に取得した
+            continue
+        # 所有者と取得ごとの lease_id を書き込んでから leased/ に置く（書き込みで更新時刻も新しくなる）
+        task = _read_task(private)
+        task['owner'] = worker_id
+        task['lease_id'] = uuid.uuid4().hex
+        task['attempts'] = task.get('attempts', 0) + 1
+        task['leased'] = datetime.now().isoformat(timespec='seconds')
+        _write_task(private, task)
+        os.rename(private, destination)
+        return Lease(queue_dir, name, task, heartbeat)
+    return None
+
+
+def process_days(config, start_date, end_date):
+    """期間の各日についてダウンロード・抽出・特殊値処理を行う（既存のファイルはスキップ）"""
+    from msm.download import msm_file_url, download_msm_file, archive_base_url, download_settings
+
+    targets = config['targets']
+    output_dir = config['output_directory']
+    save_dir = os.path.join(output_dir, 'netcdf')
+    csv_dir = os.path.join(output_dir, 'csv')
+    fixed_dir = config.get('input_csv_directory', csv_dir)
+    fix_method = config.get('fix_method', 'nan')
+    base_url = archive_base_url(config)
+    download_options = download_settings(config)
+    journal = RunJournal(journal_directory(config))
+    fix_journal = RunJournal(fix_journal_directory(fixed_dir))
+    from msm.derived import derived_settings
+    from msm.panel import open_panel_writer
+    derived_variables, derived_parameters = derived_settings(config)
+    panel = open_panel_writer(config)
+    transect_dir = os.path.join(output_dir, 'transect')
+    transects = {}
+    if config.get('transects'):
+        from msm.transect import resolve_transects
+        transects = resolve_transects(config)
+
+    day = datetime.strptime(start_date, '%Y-%m-%d').date()
+    last = datetime.strptime(end_date, '%Y-%m-%d').date()
+    while day <= last:
+        nc_file = os.path.join(save_dir, day.strftime('%Y'), f"{day.strftime('%m%d')}.nc")
+        if not (os.path.exists(nc_file) and os.path.getsize(nc_file) > 0):
+            os.makedirs(os.path.dirname(nc_file), exist_ok=True)
+            print(f"ダウンロード中: {msm_file_url(day, base_url)}")
+            if not download_msm_file(msm_file_url(day, base_url), nc_file, **download_options):
+                return False
+            journal.record('download', day.isoformat(), nc_file)
+
+        from msm.extract import extract_msm_data_to_csv, find_missing_targets, target_csv_path
+        missing = find_missing_targets(nc_file, targets, csv_dir)
+        missing_transects = {}
+        if transects:
+            from msm.transect import find_missing_transects
+            missing_transects = find_missing_transects(nc_file, transects, transect_dir)
+        if (missing or missing_transects) and not extract_msm_data_to_csv(
+                nc_file, missing, csv_dir, journal, missing_transects, transect_dir,
+                derived_variables, derived_parameters, panel):
+            return False
+
+        if os.path.abspath(fixed_dir) != os.path.abspath(csv_dir):
+            from msm.fix import process_r1h_timeseries
+            for target_name in targets.keys():
+                fixed_file = target_csv_path(fixed_dir, target_name, nc_file)
+                if os.path.exists(fixed_file) and os.path.getsize(fixed_file) > 0:
+                    continue
+                source_file = target_csv_path(csv_dir, target_name, nc_file)
+                if not process_r1h_timeseries(source_file, fixed_file, fix_method, verbose=False):
+                    return False
+                fix_journal.record('fix', fixed_file, fixed_file, source=source_file, method=fix_method)
+        day += timedelta(days=1)
+    return True
+
+
+def run_worker(config_file, max_tasks=None, lease_timeout=DEFAULT_LEASE_TIMEOUT,
+               heartbeat=DEFAULT_HEARTBEAT, max_attempts=DEFAULT_MAX_ATTEMPTS, wait=True, poll_interval=None):
+    """
+    作業キューから作業を取得して処理する
+
+    Parameters:
+    -----------
+    config_file : str
+        設定ファイルのパス
+    max_tasks : int, default=None
+        処理する作業の最大数（Noneの場合は作業がなくなるまで）
+    lease_timeout : float, default=600
+        ハートビートが途絶えてから作業を回収するまでの秒数
+    heartbeat : float, default=30
+        ハートビートの間隔（秒）
+    max_attempts : int, default=3
+        作業を failed/ に移すまでの試行回数
+    wait : bool, default=True
+        未処理の作業がなくても、他のワーカーの処理中の作業があれば回収できるまで待つ
+    poll_interval : float, default=None
+        待機中にキューを確認する間隔（秒、Noneの場合は heartbeat と同じ）
+
+    Returns:
+    --------
+    bool
+        失敗した作業がなかったかどうか
+    """
+    config = load_config(config_file)
+    queue_dir = queue_directory(config)
+    if not os.path.isdir(_state_dir(queue_dir, 'pending')):
+        print(f"エラー: 作業キューが見つかりません: {queue_dir} (msm queue init で作成してください)")
+        return False
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    poll_interval = heartbeat if poll_interval is None else poll_interval
+    processed = 0
+    failed = 0
+    print(f"ワーカー {worker_id} を開始します (キュー: {queue_dir})")
+
+    while max_tasks is None or processed + failed < max_tasks:
+        reclaim_stale_leases(queue_dir, lease_timeout, max_attempts)
+        lease = claim_task(queue_dir, worker_id, heartbeat)
+        if lease is None:
+            if wait and _task_files(queue_dir, 'leased'):
+                time.sleep(poll_interval)
+                continue
+            break
+
+        task = lease.task
+        print(f"作業 {lease.name} を処理中 ({task['start']} から {task['end']}, {task['attempts']} 回目)")
+        with lease:
+            try:
+                ok = process_days(config, task['start'], task['end'])
+            except Exception as e:
+                print(f"エラー: 作業 {lease.name} の処理中に問題が発生しました: {e}")
+                ok = False
+        if ok:
+            lease.complete()
+            processed += 1
+        else:
+            lease.release(max_attempts)
+            failed += 1
+
+    status = queue_status(queue_dir)
+    print(f"\nワーカー {worker_id} を終了します:")
+    print(f"- 完了: {processed} 作業")
+    if failed > 0:
+        print(f"- 失敗: {failed} 作業")
+    print(f"- キュー: " + ", ".join(f"{state} {count}" for state, count in status.items()))
+    return failed == 0
+
+
+def process_queue_command(config_file, action, start_date=None, end_date=None, chunk_days=DEFAULT_CHUNK_DAYS):
+    """作業キューの作成（init）と状態の表示（status）"""
+    config = load_config(config_file)
+    queue_dir = queue_directory(config)
+    if action == 'init':
+        start_date = start_date or config['download_start_date']
+        end_date = end_date or config['download_end_date']
+        added = init_queue(queue_dir, start_date, end_date, chunk_days)
+        print(f"作業キューに {added} 作業を登録しました: {queue_dir} ({start_date} から {end_date}, {chunk_days} 日ごと)")
+    if not os.path.isdir(_state_dir(queue_dir, 'pending')):
+        print(f"エラー: 作業キューが見つかりません: {queue_dir}")
+        return False
+    status = queue_status(queue_dir)
+    print("キューの状態: " + ", ".join(f"{state} {count}" for state, count in status.items()))
+    for name in _task_files(queue_dir, 'leased'):
+        path = os.path.join(_state_dir(queue_dir, 'leased'), name)
+        try:
+            task = _read_task(path)
+            age = time.time() - os.stat(path).st_mtime
+        except (FileNotFoundError, ValueError):
+            continue
+        print(f"  処理中: {name} (ワーカー: {task.get('owner')}, 最終ハートビート: {age:.0f} 秒前)")
+    return True
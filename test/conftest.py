@@ -0,0 +1,26 @@
+"""pytest の共通設定
+
+test_run.py は手動で実行するスクリプト（読み込み時に処理を実行する）のため収集しない。
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+collect_ignore = ['test_run.py']
+
+
+@pytest.fixture
+def msm_command():
+    """サブプロセスで msm コマンドを実行するための (引数を作る関数, 環境変数)（リポジトリの msm を使う）"""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+
+    def command(*args):
+        return [sys.executable, '-m', 'msm'] + [str(a) for a in args]
+    return command, env
@@ -0,0 +1,25 @@
+"""結合期間（combine_windows）の設定の確認と出力ファイル名"""
+
+from msm.combine import validate_combine_windows, resolve_combine_windows, _window_file_stem
+
+
+def test_bad_window_is_reported_by_name(capsys):
+    config = {'combine_start_date': '2024-01-01', 'combine_end_date': '2024-12-31',
+              'combine_windows': [{'name': 'winter', 'start': '12-01', 'end': '03-31', 'every_year': True},
+                                  {'name': 'event', 'start': '2024-02-30', 'end': '2024-03-05'},
+                                  {'name': 'reversed', 'start': '2024-05-10', 'end': '2024-05-01'}]}
+    assert not validate_combine_windows(config)
+    output = capsys.readouterr().out
+    assert "'event'" in output and "'reversed'" in output and "'winter'" not in output
+
+    config['combine_windows'] = config['combine_windows'][:1]
+    assert validate_combine_windows(config)
+
+
+def test_window_name_in_file_names():
+    config = {'combine_start_date': '2020-01-01', 'combine_end_date': '2021-12-31',
+              'combine_windows': [{'name': 'winter', 'start': '12-01', 'end': '02-29', 'every_year': True}]}
+    windows = resolve_combine_windows(config, 'a', [2020, 2021])
+    stems = {_window_file_stem('a', *window) for window in windows}
+    # 翌年のデータがない 2021-2022 年の冬は含めない
+    assert stems == {'a_20200101-20211231', 'a_winter_2020-2021_20201201-20210228'}
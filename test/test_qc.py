@@ -0,0 +1,92 @@
+"""品質管理（msm qc）の規則の評価と条件式の検証"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from msm.qc import validate_rules, evaluate_rules, decode_flags, _compile_condition, _evaluate_node
+
+RULES = [
+    {'name': 'r1h_sentinel', 'type': 'sentinel', 'variable': 'r1h', 'value': 200, 'action': 'nan'},
+    {'name': 'r1h_range', 'type': 'range', 'variable': 'r1h', 'min': 0, 'max': 150},
+    {'name': 'rh_range', 'type': 'range', 'variable': 'rh', 'min': 0, 'max': 100},
+    {'name': 'temp_spike', 'type': 'spike', 'variable': 'temp', 'threshold': 8.0},
+    {'name': 'temp_step', 'type': 'step', 'variable': 'temp', 'threshold': 12.0},
+    {'name': 'temp_stuck', 'type': 'stuck', 'variable': 'temp', 'hours': 4},
+    {'name': 'wind_consistency', 'type': 'cross', 'variables': ['wind_speed'],
+     'condition': 'abs(wind_speed - sqrt(u ** 2 + v ** 2)) > 0.01'},
+]
+BIT = {rule['name']: 1 << i for i, rule in enumerate(RULES)}
+
+
+@pytest.fixture
+def frame():
+    """1時間ごと24時刻の合成データ（気温は0.5℃ずつ上昇）"""
+    n = 24
+    temp = 0.5 * np.arange(n)
+    temp[5] += 20.0       # 1時間だけ突出（spike、前後の step）
+    temp[12:] += 15.0     # 12時から15℃上昇（step）
+    temp[18:22] = 24.0    # 4時刻同じ値（stuck）
+    rh = np.full(n, 60.0)
+    rh[3], rh[7], rh[9] = 120.0, -5.0, np.nan
+    r1h = np.zeros(n)
+    r1h[2], r1h[10] = 200.0, 160.0
+    wind_speed = np.full(n, 5.0)
+    wind_speed[8] = 7.0
+    return pd.DataFrame({'time': pd.date_range('2024-01-01', periods=n, freq='h'), 'temp': temp, 'rh': rh,
+                         'r1h': r1h, 'u': 3.0, 'v': 4.0, 'wind_speed': wind_speed})
+
+
+def test_rule_counts_and_bits(frame):
+    validate_rules(RULES)
+    flags, counts, to_nan = evaluate_rules(frame.drop(columns='time'), RULES, frame['time'])
+    assert dict(counts) == {'r1h_sentinel': 1, 'r1h_range': 1, 'rh_range': 2, 'temp_spike': 1,
+                            'temp_step': 3, 'temp_stuck': 4, 'wind_consistency': 1}
+
+    # 特殊値は以降の規則では欠損（範囲外にはならない）
+    assert flags['r1h'][2] == BIT['r1h_sentinel']
+    assert flags['r1h'][10] == BIT['r1h_range']
+    assert np.flatnonzero(to_nan['r1h']).tolist() == [2]
+    assert flags['rh'][3] == flags['rh'][7] == BIT['rh_range']
+    assert flags['rh'][9] == 0
+
+    assert flags['temp'][5] == BIT['temp_spike'] | BIT['temp_step']
+    assert flags['temp'][6] == flags['temp'][12] == BIT['temp_step']
+    assert flags['temp'][18:22].tolist() == [BIT['temp_stuck']] * 4
+    assert np.count_nonzero(flags['temp']) == 7
+    assert flags['wind_speed'][8] == BIT['wind_consistency']
+    assert decode_flags(flags['temp'][5], RULES) == ['temp_spike', 'temp_step']
+
+
+def test_neighbour_rules_skip_gaps(frame):
+    # 5時の値の直後に時刻の欠け（5時→7時）がある場合、spike は判定しない
+    times = frame['time'].copy()
+    times[6:] += pd.Timedelta(hours=1)
+    _, counts, _ = evaluate_rules(frame.drop(columns='time'), RULES, times)
+    assert counts['temp_spike'] == 0
+    assert counts['temp_step'] == 2
+
+
+@pytest.mark.parametrize('condition', [
+    'u.real > 0',                  # 属性
+    'u[0] > 1',                    # 添字
+    'exp(u) > 1',                  # 使えない関数
+    '__import__("os").getcwd()',   # 使えない関数と文字列
+    "u == 'a'",                    # 文字列の定数
+    'abs > 1',                     # 関数を呼び出さずに使う
+    'abs(x=u) > 1',                # キーワード引数
+    'lambda: u',                   # 関数の定義
+])
+def test_condition_rejects_unsafe_nodes(condition):
+    rule = {'name': 'bad', 'type': 'cross', 'variables': ['u'], 'condition': condition}
+    with pytest.raises(ValueError, match='条件式が不正です'):
+        validate_rules([rule])
+
+
+def test_condition_evaluation():
+    columns = {'u': np.array([-1.0, 0.5, 2.0, np.nan]), 'v': np.array([1.0, 1.0, -3.0, 0.0])}
+    result = _evaluate_node(_compile_condition('(0 < u < 1) | ~(v > 0) and not isnan(u)'), columns)
+    expected = ((0 < columns['u']) & (columns['u'] < 1) | ~(columns['v'] > 0)) & ~np.isnan(columns['u'])
+    assert np.array_equal(result, expected)
+    with pytest.raises(NameError):
+        _evaluate_node(_compile_condition('w > 0'), columns)
@@ -0,0 +1,52 @@
+"""KLL スケッチの精度とスケッチの保存先の更新"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from msm.sketch import benchmark_sketch, update_sketch_store
+
+# モジュールの説明と README に記載している順位誤差の最大値（k=200，20回の試行）
+MAX_RANK_ERROR_18_YEARS = 0.0038
+MAX_RANK_ERROR_ONE_MONTH = 0.0047
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rank_error_18_years(seed):
+    assert benchmark_sketch(n=24 * 365 * 18, k=200, seed=seed) <= MAX_RANK_ERROR_18_YEARS
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_rank_error_one_month(seed):
+    assert benchmark_sketch(n=24 * 31, k=200, seed=seed) <= MAX_RANK_ERROR_ONE_MONTH
+
+
+def _write_day(csv_dir, day, temp):
+    times = pd.date_range(day, periods=24, freq='h')
+    path = os.path.join(csv_dir, 'a', day[:4], f"{day.replace('-', '')}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame({'time': times.strftime('%Y-%m-%d %H:%M:%S'), 'temp': temp,
+                  'r1h': 0.0, 'wind_speed': 1.0}).to_csv(path, index=False)
+    return path
+
+
+def test_refixed_day_rebuilds_month(tmp_path):
+    csv_dir, sketch_dir = str(tmp_path / 'csv'), str(tmp_path / 'sketch')
+    _write_day(csv_dir, '2024-01-01', np.arange(24.0))
+    path = _write_day(csv_dir, '2024-01-02', np.arange(24.0))
+    _write_day(csv_dir, '2024-02-01', np.arange(24.0))
+    sketches = update_sketch_store(csv_dir, sketch_dir, 'a')
+    assert sketches[('2024-01', 'temp')][0].quantile(1.0) == 23.0
+
+    # 再修正で値が変わった日は，同じ月の他の日と合わせて作り直される（古い値は残らない）
+    _write_day(csv_dir, '2024-01-02', np.arange(24.0) - 100)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    sketches = update_sketch_store(csv_dir, sketch_dir, 'a')
+    sketch = sketches[('2024-01', 'temp')][0]
+    assert sketch.quantile(0.0) == -100.0
+    assert sketch.quantile(1.0) == 23.0
+    assert sketch.n == 48
+    assert sketches[('2024-02', 'temp')][0].quantile(0.0) == 0.0
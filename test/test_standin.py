@@ -0,0 +1,43 @@
+"""代替サーバー（msm.standin）に対するダウンローダーの試験（ネットワークを使わない）"""
+
+from datetime import date
+
+import pytest
+
+from msm.loadtest import run_download_load_test
+from msm.standin import start_background_standin, standin_base_url
+
+START, END = '2024-01-01', '2024-01-06'
+
+
+@pytest.fixture
+def standin(tmp_path):
+    """障害を注入する代替サーバー（乱数のシードは固定）"""
+    server, _ = start_background_standin(str(tmp_path / 'archive'), drop_rate=0.2, error_rate=0.2, seed=1)
+    server.standin.prepare([date(2024, 1, day) for day in range(1, 7)])
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_recovers_from_injected_faults(standin, tmp_path):
+    result = run_download_load_test(standin_base_url(standin), START, END, str(tmp_path / 'netcdf'),
+                                    workers=2, retries=10, retry_delay=0.01,
+                                    reference_dir=str(tmp_path / 'archive'))
+    assert result['files'] == 6
+    assert result['failed'] == 0
+    assert result['mismatched'] == 0
+    stats = standin.standin.stats
+    # 注入した障害は再試行（途中からの受信を含む）で回復している
+    assert stats['errors_injected'] + stats['drops_injected'] > 0
+    assert result['retries'] >= stats['errors_injected'] + stats['drops_injected']
+
+
+def test_unpackable_values_raise(tmp_path, monkeypatch):
+    import msm.standin
+    # 平均が i2 のパッキングの範囲を大きく外れる海面気圧
+    monkeypatch.setitem(msm.standin.VARIABLES, 'psea', (1.0e7, 1.0, 1.0, 0.0))
+    path = tmp_path / '0101.nc'
+    with pytest.raises(ValueError, match='psea'):
+        msm.standin.generate_msm_file(str(path), date(2024, 1, 1))
+    assert not path.exists()
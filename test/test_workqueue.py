@@ -0,0 +1,122 @@
+"""作業キュー（msm queue / msm worker）の複数プロセスでの動作"""
+
+import os
+import json
+import signal
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+from msm.standin import generate_msm_file
+from msm.workqueue import init_queue, queue_status, _read_task, _task_files
+
+START = date(2024, 1, 1)
+DAYS = 6
+
+
+@pytest.fixture
+def queue_config(tmp_path):
+    """1日1作業のキューと、ダウンロード済みの netCDF（スタンドインのデータ）を用意する"""
+    output_dir = tmp_path / 'output'
+    for i in range(DAYS):
+        day = START + timedelta(days=i)
+        generate_msm_file(str(output_dir / 'netcdf' / day.strftime('%Y') / f"{day.strftime('%m%d')}.nc"), day)
+    config = {
+        'download_start_date': START.isoformat(),
+        'download_end_date': (START + timedelta(days=DAYS - 1)).isoformat(),
+        'targets': {'a': {'latitude': 43.6, 'longitude': 142.9}, 'b': {'latitude': 44.0, 'longitude': 142.5}},
+        'output_directory': str(output_dir),
+        'auto_confirm': True,
+    }
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps(config))
+    queue_dir = str(output_dir / 'queue')
+    assert init_queue(queue_dir, config['download_start_date'], config['download_end_date'], chunk_days=1) == DAYS
+    return str(config_file), queue_dir, output_dir
+
+
+def _run_workers(msm_command, config_file, count, *options):
+    command, env = msm_command
+    workers = [subprocess.Popen(command('worker', config_file, *options), env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+               for _ in range(count)]
+    outputs = [worker.communicate(timeout=300)[0] for worker in workers]
+    assert all(worker.returncode == 0 for worker in workers), outputs
+    return outputs
+
+
+def _processed_names(outputs):
+    """ワーカーの出力から処理した作業名を集める（同じ作業を2回処理した場合は2回現れる）"""
+    names = []
+    for output in outputs:
+        for line in output.splitlines():
+            if line.startswith('作業 ') and 'を処理中' in line:
+                names.append(line.split()[1])
+    return names
+
+
+def test_workers_process_every_task_once(msm_command, queue_config):
+    config_file, queue_dir, output_dir = queue_config
+    outputs = _run_workers(msm_command, config_file, 3, '--heartbeat', 0.5)
+
+    names = _processed_names(outputs)
+    assert sorted(names) == sorted(set(names))
+    assert sorted(names) == _task_files(queue_dir, 'done')
+    assert queue_status(queue_dir) == {'pending': 0, 'leased': 0, 'done': DAYS, 'failed': 0}
+    for name in _task_files(queue_dir, 'done'):
+        assert _read_task(os.path.join(queue_dir, 'done', name))['attempts'] == 1
+    for target in ['a', 'b']:
+        assert len(os.listdir(output_dir / 'csv' / target / '2024')) == DAYS
+    # 作業ファイルを一時的に移した名前（*.claim など）が残っていない
+    for state in ['pending', 'leased', 'done', 'failed']:
+        assert all(name.endswith('.json') for name in os.listdir(os.path.join(queue_dir, state)))
+
+
+def test_killed_worker_lease_is_reclaimed(msm_command, queue_config):
+    config_file, queue_dir, _ = queue_config
+    command, env = msm_command
+    # 作業を1つ取得したまま強制終了されるワーカー
+    doomed = subprocess.Popen(
+        [sys.executable, '-c',
+         "import sys, time\n"
+         "from msm.workqueue import claim_task\n"
+         "lease = claim_task(sys.argv[1], 'doomed')\n"
+         "print(lease.name, flush=True)\n"
+         "time.sleep(600)\n", queue_dir],
+        env=env, stdout=subprocess.PIPE, text=True)
+    stolen = doomed.stdout.readline().strip()
+    doomed.send_signal(signal.SIGKILL)
+    doomed.wait()
+    assert _task_files(queue_dir, 'leased') == [stolen]
+
+    outputs = _run_workers(msm_command, config_file, 2, '--lease-timeout', 2, '--heartbeat', 0.5)
+
+    assert any(f"停止したワーカーの作業を回収しました: {stolen}" in output for output in outputs)
+    names = _processed_names(outputs)
+    assert sorted(names) == sorted(set(names)) == _task_files(queue_dir, 'done')
+    assert queue_status(queue_dir) == {'pending': 0, 'leased': 0, 'done': DAYS, 'failed': 0}
+    task = _read_task(os.path.join(queue_dir, 'done', stolen))
+    assert task['attempts'] == 2 and task['owner'] != 'doomed'
+
+
+def test_reclaimed_worker_cannot_complete_new_lease(tmp_path):
+    from msm.workqueue import claim_task, reclaim_stale_leases
+
+    queue_dir = str(tmp_path / 'queue')
+    init_queue(queue_dir, '2024-01-01', '2024-01-01')
+    first = claim_task(queue_dir, 'first')
+    # first のハートビートが止まったものとして回収し、second が取得し直す
+    os.utime(first.path, (0, 0))
+    assert reclaim_stale_leases(queue_dir, lease_timeout=10) == 1
+    second = claim_task(queue_dir, 'second')
+    assert second.name == first.name
+    # 新しい作業は回収されない
+    assert reclaim_stale_leases(queue_dir, lease_timeout=10) == 0
+
+    assert not first.complete()
+    assert _task_files(queue_dir, 'leased') == [second.name]
+    assert _read_task(second.path)['owner'] == 'second'
+    assert second.complete()
+    assert queue_status(queue_dir) == {'pending': 0, 'leased': 0, 'done': 1, 'failed': 0}